@@ -0,0 +1,108 @@
+"""Realized PNL, commission and funding accounting from the futures income history.
+
+IncomeLedger pages through futures_income_history once (INCOME_HISTORY_DAYS back,
+in INCOME_WINDOW_DAYS windows of up to INCOME_PAGE_LIMIT rows, quote-asset rows
+only) and then syncs incrementally: each sync asks only for records after a cursor kept in the state
+store. Records are stored in the store's income table, unique per account +
+tranId + type and indexed by time. In memory the ledger keeps running totals per
+income type and per symbol, for all time and for the session. A session is
+what the target monitor counts, from the moment a basket is opened on a flat
+account. New records are folded in as they arrive, so a sync costs O(new records).
+
+    net PNL = unrealized + session (REALIZED_PNL + COMMISSION + FUNDING_FEE)   # fees and paid funding are negative
+"""
+import time
+from decimal import Decimal
+
+# --- Configuration ---
+INCOME_HISTORY_DAYS = 90 # First sync reaches this far back (Binance keeps about three months)
+INCOME_WINDOW_DAYS = 7 # startTime..endTime span of one request
+INCOME_PAGE_LIMIT = 1000 # Rows per request (API maximum)
+INCOME_SETTLE_MS = 60000 # Records can appear this late; the cursor trails the last sync by this much
+NET_TYPES = ('REALIZED_PNL', 'COMMISSION', 'FUNDING_FEE') # Income types that count toward net PNL (transfers do not)
+QUOTE_ASSET = "USDC"
+
+
+class IncomeLedger:
+    """Income records of one account with running aggregates. sync() runs on the engine's loop; the rest is plain state."""
+    def __init__(self, store=None, account=None, history_days=INCOME_HISTORY_DAYS):
+        self.store = store; self.account = account; self.history_days = history_days
+        self.cursor = None; self.session_start = int(time.time() * 1000) # ms; records at or after the cursor are re-requested (deduplicated)
+        self.recent = {} # (tranId, type) -> time of records at or after the cursor, to drop re-sent rows
+        self.totals = {}; self.by_symbol = {} # type -> Decimal; symbol -> {type: Decimal}, all time
+        self.session = {}; self.session_by_symbol = {} # The same since session_start
+        self.records = 0; self.synced_at = 0.0
+
+    @property
+    def settings_key(self): return f"income:{self.account}"
+
+    # --- Aggregates ---
+    def _add(self, symbol, income_type, amount, at):
+        self.totals[income_type] = self.totals.get(income_type, Decimal(0)) + amount
+        per_symbol = self.by_symbol.setdefault(symbol, {}); per_symbol[income_type] = per_symbol.get(income_type, Decimal(0)) + amount
+        if at >= self.session_start:
+            self.session[income_type] = self.session.get(income_type, Decimal(0)) + amount
+            per_symbol = self.session_by_symbol.setdefault(symbol, {}); per_symbol[income_type] = per_symbol.get(income_type, Decimal(0)) + amount
+        self.records += 1
+
+    def load(self):
+        """Restores cursor, session start and aggregates from the store (once, at connect; blocking, run it off the loop)."""
+        if not self.store or not self.account: return
+        state = self.store.get(self.settings_key, {}); self.cursor = state.get('cursor'); self.session_start = state.get('session_start', self.session_start)
+        for tran_id, income_type, symbol, amount, at in self.store.load_income(self.account):
+            self._add(symbol, income_type, Decimal(amount), at)
+            if self.cursor is not None and at >= self.cursor: self.recent[(tran_id, income_type)] = at
+
+    def start_session(self):
+        """Starts counting session income from now (no record can be newer yet). Call save_state() to persist it."""
+        self.session_start = int(time.time() * 1000); self.session = {}; self.session_by_symbol = {}
+
+    def save_state(self):
+        """Persists cursor and session start (blocking)."""
+        if not self.store or not self.account: return
+        try: self.store.put(self.settings_key, {'cursor': self.cursor, 'session_start': self.session_start})
+        except Exception as e: print(f"Error saving income cursor: {e}")
+
+    def session_net(self):
+        """Session realized PNL + commissions + funding (Decimal, quote asset)."""
+        return sum((self.session.get(t, Decimal(0)) for t in NET_TYPES), Decimal(0))
+
+    def symbol_net(self, symbol, session=True):
+        per_symbol = (self.session_by_symbol if session else self.by_symbol).get(symbol, {})
+        return sum((per_symbol.get(t, Decimal(0)) for t in NET_TYPES), Decimal(0))
+
+    def describe(self):
+        s = self.session
+        return (f"Session: realized {s.get('REALIZED_PNL', Decimal(0)):.4f}, fees {s.get('COMMISSION', Decimal(0)):.4f}, funding {s.get('FUNDING_FEE', Decimal(0)):.4f}, "
+                f"net {self.session_net():.4f} {QUOTE_ASSET}")
+
+    # --- Sync ---
+    async def sync(self, client, loop=None):
+        """Fetches every record after the cursor (paging as needed), stores and aggregates the new ones. Returns how many were new."""
+        now = int(time.time() * 1000); start = self.cursor if self.cursor is not None else now - self.history_days * 86400000
+        window = INCOME_WINDOW_DAYS * 86400000; fresh = []; page = 1
+        while start <= now:
+            end = min(start + window - 1, now)
+            rows = await client.futures_income_history(startTime=start, endTime=end, limit=INCOME_PAGE_LIMIT, page=page)
+            for row in rows:
+                key = (row.get('tranId'), row.get('incomeType'))
+                if key in self.recent or (row.get('asset') or QUOTE_ASSET) != QUOTE_ASSET: continue # Other margin assets are not in the quote totals
+                self.recent[key] = int(row['time']); fresh.append(row)
+            if len(rows) < INCOME_PAGE_LIMIT: start = end + 1; page = 1; continue
+            last = int(rows[-1]['time']) # Full page: re-query from its last timestamp (the overlap is deduplicated by tranId)...
+            if last > start: start = last; page = 1
+            else: page += 1 # ...or, when the whole page shares startTime, take the next page of the same query
+        for row in fresh: self._add(row.get('symbol') or "", row['incomeType'], Decimal(row['income']), int(row['time']))
+        cursor = max(self.cursor or 0, now - INCOME_SETTLE_MS) # Everything up to now is in; only the last INCOME_SETTLE_MS is asked again
+        self.cursor = cursor; self.synced_at = time.time(); self.recent = {key: at for key, at in self.recent.items() if at >= cursor}
+        if self.store and self.account:
+            rows = [(row.get('tranId'), row['incomeType'], row.get('symbol') or "", row.get('asset') or QUOTE_ASSET, row['income'], int(row['time'])) for row in fresh]
+            if loop: await loop.run_in_executor(None, self._persist, rows)
+            else: self._persist(rows)
+        return len(fresh)
+
+    def _persist(self, rows):
+        try:
+            if rows: self.store.save_income(self.account, rows)
+            self.save_state()
+        except Exception as e: print(f"Error saving income records: {e}")
@@ -0,0 +1,191 @@
+"""Account registry: one basket traded on several (sub-)accounts at once.
+
+Every account gets its own TradingEngine, so its own pooled HTTP session,
+order-count budget and leverage cache. Request weight is per IP, so the
+engines share one weight bucket. AccountRegistry offers the engine's
+high-level actions (open_basket, add_position, close_all, PNL snapshot,
+target monitor) and fans each out to every connected account with one
+asyncio.gather, so ten accounts take about the wall time of one. With a
+single account it behaves exactly like that account's engine.
+
+Sub-account keys are read from the environment variables named in
+ACCOUNTS_PATH; they are never written to disk:
+
+    [{"name": "sub1", "key_env": "SUB1_API_KEY", "secret_env": "SUB1_API_SECRET"}]
+"""
+import asyncio
+import json
+import os
+from decimal import Decimal
+from typing import NamedTuple
+
+from engine import TradingEngine, MonitorResult, QUOTE_ASSET, TARGET_MONITOR_INTERVAL_SECONDS
+from portfolio import PortfolioSnapshot
+from rate_limiter import RateLimiter
+
+# --- Configuration ---
+ACCOUNTS_PATH = os.path.join(os.path.expanduser("~"), ".binance_trader", "accounts.json")
+STREAM_MONITOR_INTERVAL_SECONDS = 0.25 # Combined target check period while every account streams (local books, no REST)
+
+
+class AccountConfig(NamedTuple):
+    name: str
+    api_key: str
+    api_secret: str
+
+
+def load_accounts(path=ACCOUNTS_PATH):
+    """AccountConfigs from the accounts file ([] if there is none). Entries whose variables are unset are skipped with a warning."""
+    if not path or not os.path.exists(path): return []
+    try:
+        with open(path, encoding='utf-8') as f: entries = json.load(f)
+    except (OSError, ValueError) as e: print(f"Warning: Could not read accounts file {path}: {e}"); return []
+    configs = []
+    for entry in entries:
+        name = entry.get('name'); key = os.environ.get(entry.get('key_env') or ''); secret = os.environ.get(entry.get('secret_env') or '')
+        if not name or not key or not secret: print(f"Warning: Skipping account {name or '?'}: set {entry.get('key_env')} and {entry.get('secret_env')}."); continue
+        configs.append(AccountConfig(name, key, secret))
+    return configs
+
+
+class AccountRegistry:
+    """Named TradingEngines driven together. The first one added is the primary (the GUI's own login).
+    Every coroutine must run on the engines' event loop."""
+    def __init__(self, primary=None, name="main"):
+        self.engines = {} # name -> TradingEngine, in insertion order
+        if primary: self.add(name, primary)
+
+    def add(self, name, engine):
+        engine.name = engine.name or name; self.engines[name] = engine
+        return engine
+
+    @property
+    def primary(self): return next(iter(self.engines.values()), None)
+
+    @property
+    def connected(self): return any(engine.connected for engine in self.engines.values())
+
+    def connected_engines(self):
+        return {name: engine for name, engine in self.engines.items() if engine.connected}
+
+    def set_leverage(self, leverage):
+        for engine in self.engines.values(): engine.leverage = leverage
+
+    # --- Connection ---
+    async def connect_accounts(self, configs, testnet=False, clients=None):
+        """Adds an engine per config (sharing the primary's weight bucket, store and journal) and connects them concurrently.
+        clients: optional {name: ready client} (e.g. sim_exchange.SimClient). Accounts that fail to connect are dropped.
+        Returns {name: (success, message, hedge_mode)}."""
+        clients = clients or {}; configs = [c for c in configs if c.name not in self.engines]
+        for config in configs:
+            primary = self.primary; base = primary.limiter if primary else None
+            limiter = RateLimiter(base.weight_per_minute, base.orders_per_10s, base.orders_per_minute, weight_bucket=base.weight) if base else None
+            self.add(config.name, TradingEngine(primary.leverage, primary.use_streaming, limiter, primary.store, primary.journal, config.name) if primary else TradingEngine(name=config.name))
+        outcomes = await asyncio.gather(*(self.engines[c.name].connect(c.api_key, c.api_secret, testnet, clients.get(c.name)) for c in configs))
+        for config, (ok, message, _) in zip(configs, outcomes):
+            if not ok: del self.engines[config.name]; print(f"Account {config.name}: {message}")
+        return {config.name: outcome for config, outcome in zip(configs, outcomes)}
+
+    async def disconnect(self, keep_primary=True):
+        """Disconnects every account; sub-accounts are removed (the primary stays registered unless keep_primary is False)."""
+        await asyncio.gather(*(engine.disconnect() for engine in self.engines.values()))
+        primary = self.primary; self.engines = {name: e for name, e in self.engines.items() if keep_primary and e is primary}
+
+    # --- Fan-out ---
+    async def _fan_out(self, action):
+        """Runs coroutine action(engine) on every connected account concurrently. Returns {name: result or exception}."""
+        engines = self.connected_engines()
+        outcomes = await asyncio.gather(*(action(engine) for engine in engines.values()), return_exceptions=True)
+        return dict(zip(engines, outcomes))
+
+    @staticmethod
+    def _merge_lines(outcomes):
+        """{name: (lines, has_errors)} -> (lines, has_errors); lines are prefixed with the account when there are several."""
+        lines = []; has_errors = not outcomes; multi = len(outcomes) > 1
+        if not outcomes: lines.append("Not connected.")
+        for name, outcome in outcomes.items():
+            if isinstance(outcome, Exception): lines.append(f"[{name}] Error - {outcome}"); has_errors = True; continue
+            account_lines, errors = outcome; has_errors = has_errors or errors
+            lines += [f"[{name}] {line}" if multi else line for line in account_lines]
+        return lines, has_errors
+
+    async def preapply_leverage(self, symbols, leverage=None):
+        """TradingEngine.preapply_leverage on every account. Returns {symbol: 'account: error; ...'}."""
+        errors = {}
+        for name, outcome in (await self._fan_out(lambda e: e.preapply_leverage(symbols, leverage))).items():
+            if isinstance(outcome, Exception): outcome = {s: str(outcome) for s in symbols}
+            for symbol, error in outcome.items(): errors[symbol] = f"{errors[symbol]}; {name}: {error}" if symbol in errors else f"{name}: {error}"
+        return errors
+
+    async def open_basket(self, selections, amount_per_coin, sl_percent=None, policy=None):
+        """The same basket (amount_per_coin margin per coin) on every account. Returns (result lines, has_errors)."""
+        return self._merge_lines(await self._fan_out(lambda e: e.open_basket(selections, amount_per_coin, sl_percent, policy)))
+
+    async def add_position(self, symbol, position_side, amount):
+        """TradingEngine.add_position on every account. Returns (message, is_error)."""
+        outcomes = await self._fan_out(lambda e: e.add_position(symbol, position_side, amount))
+        lines, has_errors = self._merge_lines({name: o if isinstance(o, Exception) else ([o[0]], o[1]) for name, o in outcomes.items()})
+        return "\n".join(lines), has_errors
+
+    async def close_all(self, policy=None):
+        """Closes every leg on every account concurrently (policy: execution.ExecutionPolicy, None = market). Returns (result lines, has_errors)."""
+        return self._merge_lines(await self._fan_out(lambda e: e.close_all(policy)))
+
+    # --- PNL ---
+    async def get_pnl_by_account(self):
+        """{name: (status, snapshot, total_pnl)} from each account's shared snapshot, fetched concurrently."""
+        outcomes = await self._fan_out(lambda e: e.get_shared_pnl_snapshot())
+        return {name: (f"Error PNL: {o}", PortfolioSnapshot.empty(), Decimal(0)) if isinstance(o, Exception) else o for name, o in outcomes.items()}
+
+    async def get_shared_pnl_snapshot(self):
+        """(status, snapshot, total_pnl) over all accounts. With several accounts the legs are keyed 'account/SYMBOL_SIDE'
+        and the status lists each account's total."""
+        by_account = await self.get_pnl_by_account()
+        if len(by_account) <= 1: return next(iter(by_account.values()), ("Not connected.", PortfolioSnapshot.empty(), Decimal(0)))
+        snapshot = PortfolioSnapshot.concat({name: s for name, (_, s, _) in by_account.items()})
+        total = sum((t for _, _, t in by_account.values()), Decimal(0))
+        accounts = " | ".join(f"{name} {t:.4f}" for name, (_, _, t) in by_account.items())
+        return f"PNL ({len(snapshot)} Pos, {len(by_account)} accounts). Total: {total:.4f} {QUOTE_ASSET} | {accounts}", snapshot, total
+
+    def invalidate_pnl_snapshot(self):
+        for engine in self.engines.values(): engine.invalidate_pnl_snapshot()
+
+    def session_income(self):
+        """Session realized PNL + fees + funding summed over the connected accounts."""
+        return sum((engine.session_income() for engine in self.connected_engines().values()), Decimal(0))
+
+    def income_summary(self):
+        """One line per connected account with its session income ('' before any ledger exists)."""
+        engines = {name: e for name, e in self.connected_engines().items() if e.ledger}
+        if len(engines) == 1: return next(iter(engines.values())).ledger.describe()
+        return " | ".join(f"{name} {e.ledger.describe()}" for name, e in engines.items())
+
+    # --- Target Profit Monitor ---
+    async def run_target_monitor(self, trigger, notify=None):
+        """Drives one ProfitTrigger on the combined PNL; when it fires every account is closed concurrently.
+        With a single account this is that engine's (event-driven) run_target_monitor."""
+        engines = self.connected_engines()
+        if len(engines) == 1: return await next(iter(engines.values())).run_target_monitor(trigger, notify)
+        notify = notify or print
+        print(f"Target TP Monitor started on {len(engines)} accounts. Target: {trigger.target:.4f} {QUOTE_ASSET}{' net of fees and funding' if trigger.net else ''}")
+        error_backoff = TARGET_MONITOR_INTERVAL_SECONDS
+        while True:
+            if not self.connected:
+                print("Monitor: Disconnected. Stopping monitor.")
+                return MonitorResult(False, "Disconnected")
+            try:
+                status_msg, snapshot, total_pnl = await self.get_shared_pnl_snapshot(); trigger.offset = self.session_income()
+                if trigger.evaluate(total_pnl):
+                    print(f"Monitor: {trigger.reason} REACHED on combined PNL {total_pnl:.4f}")
+                    notify(f"{trigger.reason} HIT! Attempting MARKET close on all accounts...")
+                    results, has_errors = await self.close_all()
+                    return MonitorResult(True, trigger.reason, results, has_errors)
+                if not len(snapshot):
+                    print("Monitor: No open positions found. Stopping monitor.")
+                    return MonitorResult(False, "No open positions")
+                live = all(engine.stream_live() for engine in self.connected_engines().values())
+                await asyncio.sleep(STREAM_MONITOR_INTERVAL_SECONDS if live else TARGET_MONITOR_INTERVAL_SECONDS)
+                error_backoff = TARGET_MONITOR_INTERVAL_SECONDS
+            except Exception as e:
+                print(f"Error in Target Monitor: {e}")
+                await asyncio.sleep(error_backoff); error_backoff = min(error_backoff * 2, 60)
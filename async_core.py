@@ -0,0 +1,56 @@
+"""Asyncio execution core: one event-loop thread and one pooled keep-alive HTTP session.
+
+All exchange I/O runs as coroutines on ExchangeLoop. Other threads (the Tk
+main loop) submit coroutines and get results back through callbacks /
+concurrent futures instead of spawning a blocking thread per action.
+"""
+import asyncio
+import threading
+
+import aiohttp
+from binance import AsyncClient
+
+# --- Configuration ---
+CONNECTION_POOL_SIZE = 64 # Concurrent keep-alive connections to the API host
+KEEPALIVE_SECONDS = 60
+
+
+class MeteredAsyncClient(AsyncClient):
+    """AsyncClient that hands every response's headers (X-MBX-USED-WEIGHT-1M, X-MBX-ORDER-COUNT-*) to header_listener."""
+    header_listener = None
+
+    async def _handle_response(self, response):
+        if self.header_listener: self.header_listener(response.headers)
+        return await super()._handle_response(response)
+
+
+class ExchangeLoop:
+    """Owns a dedicated asyncio loop running forever on a daemon thread."""
+    def __init__(self, name="exchange-loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True, name=name); self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop); self.loop.run_forever()
+
+    def submit(self, coro, callback=None):
+        """Schedules coro on the loop from any thread. callback(future) runs on the loop thread when done."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if callback: future.add_done_callback(callback)
+        return future
+
+    def run(self, coro, timeout=None):
+        """Blocking helper for non-loop threads: runs coro on the loop and returns its result."""
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, fn, *args):
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self):
+        if self.loop.is_running(): self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+async def create_client(api_key, api_secret, testnet=False):
+    """AsyncClient whose aiohttp session keeps a pool of keep-alive connections, so N concurrent requests cost ~1 RTT."""
+    connector = aiohttp.TCPConnector(limit=CONNECTION_POOL_SIZE, keepalive_timeout=KEEPALIVE_SECONDS, ttl_dns_cache=300)
+    return await MeteredAsyncClient.create(api_key, api_secret, testnet=testnet, session_params={'connector': connector})
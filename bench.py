@@ -0,0 +1,168 @@
+"""Offline load / latency benchmarks against the simulated exchange (sim_exchange.SimClient).
+
+    python bench.py                                  # sizes 10,100,500, unthrottled
+    python bench.py --sizes 10,100 --repeat 10 --latency 20 --weight-limit 2400 --json before.json
+
+Scenarios, each timed per run at every size N:
+  fanout    multi-trade entry of N symbols, each sent with its TP order in one batch (TradingEngine.place_brackets)
+  closeall  position fetch + close-all of N legs (place_closing_orders), as the Close All button does
+  pnl_rest  one REST PNL snapshot with N legs (TradingEngine.get_open_positions_pnl)
+  pnl_tick  one streaming mark tick with N legs: book update, ProfitTrigger decision and PortfolioSnapshot
+  accounts  N accounts (AccountRegistry): open an ACCOUNT_BASKET-leg basket on all of them, then close all
+  twap      N entries worked as a short TWAP (execution.Executor) on a depth-limited simulated book; prints the
+            average slippage next to that of one market sweep of the same basket
+The simulator is seeded, so the same arguments replay the same order flow and prices.
+By default request-weight and order-count limits are lifted so the numbers measure the client path;
+pass --weight-limit 2400 to include Binance pacing (the simulator and the client's RateLimiter both use it).
+"""
+import argparse
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import numpy as np
+
+from accounts import AccountConfig, AccountRegistry
+from engine import TradingEngine
+from execution import ExecutionPolicy
+from profit_trigger import ProfitTrigger
+from rate_limiter import RateLimiter, ORDERS_PER_10_SECONDS, ORDERS_PER_MINUTE
+from sim_exchange import SimClient
+from streaming import PositionBook
+
+# --- Configuration ---
+DEFAULT_SIZES = (10, 100, 500)
+DEFAULT_REPEAT = 5
+UNTHROTTLED_WEIGHT = 10 ** 9
+TRADE_NOTIONAL = 50 # Quote per leg in fan-out runs
+ACCOUNT_BASKET = 20 # Legs per account in the accounts scenario
+TWAP_POLICY = ExecutionPolicy("TWAP", duration_seconds=2, slices=5) # Short horizon so twap runs stay quick
+TWAP_NOTIONAL = 20000 # Quote per leg in twap runs: about ten BOOK_DEPTH levels as one sweep
+BOOK_DEPTH = 2000 # Quote per simulated book level in twap runs
+BOOK_REFILL_SECONDS = 0.5
+TWAP_DAILY_VOLUME = 10 ** 10 # Enough simulated volume that the participation cap leaves the depth cap in charge
+ENGINE = TradingEngine(use_streaming=False)
+
+
+async def _connect(n_symbols, args, **sim_options):
+    unthrottled = args.weight_limit >= UNTHROTTLED_WEIGHT; order_limit = UNTHROTTLED_WEIGHT if unthrottled else ORDERS_PER_10_SECONDS
+    sim = SimClient(n_symbols=n_symbols, latency_ms=args.latency, jitter_ms=args.jitter, weight_limit=args.weight_limit, order_limit=order_limit, seed=args.seed, **sim_options)
+    ENGINE.limiter = RateLimiter(args.weight_limit, order_limit, UNTHROTTLED_WEIGHT if unthrottled else ORDERS_PER_MINUTE) # Fresh budgets per simulated exchange
+    ok, message, _ = await ENGINE.connect(None, None, client=sim)
+    if not ok: raise RuntimeError(message)
+    return sim
+
+
+async def bench_fanout(n, args):
+    sim = await _connect(n, args); samples = []
+    symbols = list(sim.symbols)[:n]
+    for _ in range(args.repeat):
+        trades = [{'symbol': s, 'side': 'BUY', 'position_side': 'LONG', 'quantity': float(Decimal(TRADE_NOTIONAL) * ENGINE.leverage / sim.marks[s]), 'tp_price': float(sim.marks[s] * Decimal('1.05'))} for s in symbols]
+        started = time.perf_counter(); outcomes = await ENGINE.place_brackets(trades); samples.append(time.perf_counter() - started)
+        failed = [r.error for b in outcomes for r in b if r and not r.ok]
+        if failed: print(f"  fanout N={n}: {len(failed)} failed, e.g. {failed[0]}")
+    return sim, samples
+
+
+async def bench_closeall(n, args):
+    sim = await _connect(n, args); samples = []
+    for _ in range(args.repeat):
+        sim.open_positions(n)
+        started = time.perf_counter()
+        legs = [{'symbol': p['symbol'], 'positionSide': p['positionSide'], 'amount': abs(Decimal(p['positionAmt']))} for p in await sim.futures_position_information()]
+        results = await ENGINE.place_closing_orders(legs); samples.append(time.perf_counter() - started)
+        failed = [r.error for r in results if not r.ok]
+        if failed: print(f"  closeall N={n}: {len(failed)} failed, e.g. {failed[0]}")
+    return sim, samples
+
+
+async def bench_pnl_rest(n, args):
+    sim = await _connect(n, args); sim.open_positions(n); samples = []
+    for _ in range(args.repeat):
+        sim.step_marks()
+        started = time.perf_counter(); await ENGINE.get_open_positions_pnl(); samples.append(time.perf_counter() - started)
+    return sim, samples
+
+
+async def bench_pnl_tick(n, args):
+    sim = await _connect(n, args); sim.open_positions(n); samples = []
+    book = PositionBook(); book.leverage.update(sim.leverage); book.seed(await sim.futures_position_information())
+    trigger = ProfitTrigger(Decimal(10) ** 9, stop_loss=Decimal(10) ** 9); trigger.attach(book) # Thresholds never hit: measures the per-tick path
+    for _ in range(args.repeat):
+        frame = [{'e': 'markPriceUpdate', 's': s, 'p': str(m)} for s, m in sim.step_marks().items()]
+        started = time.perf_counter(); book.handle_frame(frame); book.snapshot(); samples.append(time.perf_counter() - started)
+    trigger.detach()
+    return sim, samples
+
+
+async def bench_accounts(n, args):
+    sims = [await _connect(ACCOUNT_BASKET, args)] + [SimClient(n_symbols=ACCOUNT_BASKET, latency_ms=args.latency, jitter_ms=args.jitter, weight_limit=args.weight_limit, seed=args.seed) for _ in range(n - 1)]
+    registry = AccountRegistry(ENGINE); samples = []
+    await registry.connect_accounts([AccountConfig(f"sub{i}", None, None) for i in range(1, n)], clients={f"sub{i}": sims[i] for i in range(1, n)})
+    basket = [{'symbol': s, 'position_side': 'LONG'} for s in sims[0].symbols]
+    for _ in range(args.repeat):
+        started = time.perf_counter(); opened = await registry.open_basket(basket, Decimal(TRADE_NOTIONAL)); closed = await registry.close_all(); samples.append(time.perf_counter() - started)
+        failed = [line for line in opened[0] + closed[0] if 'Failed' in line or 'Error' in line]
+        if failed: print(f"  accounts N={n}: {len(failed)} failed, e.g. {failed[0]}")
+    await registry.disconnect()
+    return sims, samples
+
+
+async def bench_twap(n, args):
+    samples = []; slippage = {}
+    for _ in range(args.repeat):
+        for policy in (None, TWAP_POLICY):
+            await ENGINE.disconnect(); sim = await _connect(n, args, book_depth=BOOK_DEPTH, book_refill_seconds=BOOK_REFILL_SECONDS, daily_volume=TWAP_DAILY_VOLUME)
+            trades = [{'symbol': s, 'side': 'BUY', 'position_side': 'LONG', 'quantity': Decimal(TWAP_NOTIONAL) / sim.marks[s], 'mark': sim.marks[s]} for s in sim.symbols]
+            started = time.perf_counter(); outcomes = await ENGINE.place_brackets(trades, policy)
+            if policy: samples.append(time.perf_counter() - started)
+            fills = [(b.entry.avg_price if policy else Decimal(b.entry.order['avgPrice']), t['mark']) for b, t in zip(outcomes, trades) if b.entry.ok]
+            slippage.setdefault(policy.describe() if policy else "MARKET", []).extend(float((p - m) / m * 10000) for p, m in fills)
+            if len(fills) < n: print(f"  twap N={n}: {n - len(fills)} entries not filled")
+    print(f"  twap N={n}: avg slippage " + ", ".join(f"{name} {np.mean(bps):.2f} bps" for name, bps in slippage.items()))
+    return sim, samples
+
+
+SCENARIOS = {'fanout': bench_fanout, 'closeall': bench_closeall, 'pnl_rest': bench_pnl_rest, 'pnl_tick': bench_pnl_tick, 'accounts': bench_accounts, 'twap': bench_twap}
+
+
+def summarize(name, n, sim, samples):
+    """sim may be a list of SimClients (one per account)."""
+    sims = sim if isinstance(sim, list) else [sim]; ms = np.array(samples) * 1000
+    return {'scenario': name, 'n': n, 'runs': len(samples), 'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)), 'p99_ms': float(np.percentile(ms, 99)),
+            'items_per_s': float(n / (ms.mean() / 1000)) if ms.mean() else 0.0, 'requests': sum(sum(s.calls.values()) for s in sims), 'rate_limited': sum(s.rejected for s in sims),
+            'throttled_s': ENGINE.limiter.throttled_seconds}
+
+
+async def run(args):
+    rows = []
+    for name in args.scenarios:
+        for n in args.sizes:
+            sim, samples = await SCENARIOS[name](n, args); await ENGINE.disconnect()
+            rows.append(summarize(name, n, sim, samples))
+    return rows
+
+
+def print_table(rows):
+    print(f"\n{'scenario':<10} {'N':>5} {'runs':>5} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'items/s':>12} {'requests':>9} {'429s':>5} {'paced s':>8}")
+    for r in rows: print(f"{r['scenario']:<10} {r['n']:>5} {r['runs']:>5} {r['mean_ms']:>10.2f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['items_per_s']:>12.1f} {r['requests']:>9} {r['rate_limited']:>5} {r['throttled_s']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks against the simulated exchange.")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated position counts")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=5.0, help="Simulated round trip (ms)")
+    parser.add_argument('--jitter', type=float, default=2.0, help="Uniform +/- jitter on the round trip (ms)")
+    parser.add_argument('--weight-limit', type=int, default=UNTHROTTLED_WEIGHT, help="Request weight per minute (2400 = Binance)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]; args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown: parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+    rows = asyncio.run(run(args)); print_table(rows)
+    if args.json:
+        with open(args.json, 'w') as f: json.dump({'args': {k: v for k, v in vars(args).items() if k != 'json'}, 'results': rows}, f, indent=2)
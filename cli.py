@@ -0,0 +1,192 @@
+"""Headless command-line entry point for the trading engine (no tkinter / X needed).
+
+    export BINANCE_API_KEY=... BINANCE_API_SECRET=...
+    python cli.py --testnet pnl
+    python cli.py --testnet trade basket.csv --amount 100
+    python cli.py --testnet watch --target 5 --trail 1 --stop-loss 10   # net of session fees and funding (--gross: unrealized only)
+    python cli.py --testnet close-all --yes
+    python cli.py --testnet select --count 10 --sides both --out basket.csv   # rank every symbol from market data
+    python cli.py --testnet trade basket.csv --amount 5000 --algo twap --duration 300 --slices 10
+    python cli.py --sim 50 trade basket.csv --amount 100     # dry run against sim_exchange
+    python cli.py --accounts close-all --yes                  # also every sub-account in accounts.ACCOUNTS_PATH
+
+Basket files are CSV lines `SYMBOL,LONG|SHORT[,TP_PRICE[,SL_PRICE]]` (# comments allowed) or a JSON
+list of {"symbol", "side", "tp", "sl"} objects. The amount is total margin split equally, as in the GUI.
+--algo works entries (trade) or closes (close-all) in slices instead of one market order; see execution.py.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+
+from accounts import ACCOUNTS_PATH, AccountRegistry, load_accounts
+from engine import TradingEngine, LEVERAGE, QUOTE_ASSET
+from execution import ALGOS, ExecutionPolicy, EXEC_DURATION_SECONDS, TWAP_SLICES, MAX_PARTICIPATION, MAX_SLIPPAGE_BPS
+from journal import open_journal
+from metrics import REGISTRY, start_metrics_server, start_loop_lag_probe
+from profit_trigger import ProfitTrigger
+from scoring import BasketScorer, BASKET_SIZE, DEFAULT_WEIGHTS, FACTORS, SIDES
+
+# --- Configuration ---
+INCOME_WAIT_SECONDS = 30 # pnl waits this long for the first income-history sync
+
+
+def load_basket(path):
+    """Reads a basket file into GUI-style selections: [{'symbol', 'position_side', 'tp_price', 'sl_price'}]."""
+    with open(path) as f: text = f.read()
+    if text.lstrip().startswith('['): rows = [(r['symbol'], r.get('side', 'LONG'), r.get('tp'), r.get('sl')) for r in json.loads(text)]
+    else: rows = [(r[0], r[1] if len(r) > 1 else 'LONG', r[2] if len(r) > 2 else None, r[3] if len(r) > 3 else None) for r in csv.reader(line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#'))]
+    basket = []; price = lambda v: float(v) if v not in (None, '') and float(v) > 0 else None
+    for symbol, side, tp, sl in rows:
+        side = side.strip().upper()
+        if side not in ('LONG', 'SHORT'): raise ValueError(f"{symbol}: side must be LONG or SHORT, got {side!r}")
+        basket.append({'symbol': symbol.strip().upper(), 'position_side': side, 'tp_price': price(tp), 'sl_price': price(sl)})
+    return basket
+
+
+def print_snapshot(snapshot):
+    status, portfolio, total_pnl = snapshot
+    print(status)
+    for key, row in portfolio.items():
+        if 'error' in row: print(f"  {row['symbol']:<14} {row['side']:<6} {row['error']}"); continue
+        print(f"  {row['symbol']:<14} {row['side']:<6} amt {row['amount']:<14.8g} entry {row['entry_price']:<12.6g} mark {row['mark_price']:<12.6g} liq {row['liq_price']:<12.6g} {row['leverage']:>3}x  pnl {row['pnl']:>12.4f}  {row['pnl_percent']:>8.2f}%")
+    if len(portfolio): print(f"Total: {total_pnl:.4f} {QUOTE_ASSET}  margin {portfolio.total_margin:.2f}  notional {portfolio.total_notional:.2f}")
+
+
+async def run(args):
+    journal = open_journal() if not args.no_journal and not args.sim else None # Sim dry runs stay out of the journal
+    engine = TradingEngine(leverage=args.leverage, use_streaming=not args.no_stream and not args.sim, journal=journal)
+    metrics_server = start_metrics_server(args.metrics_port); start_loop_lag_probe(asyncio.get_running_loop())
+    client = None
+    if args.sim:
+        from sim_exchange import SimClient
+        client = SimClient(n_symbols=args.sim)
+    ok, message, hedge_mode = await engine.connect(os.environ.get('BINANCE_API_KEY'), os.environ.get('BINANCE_API_SECRET'), testnet=args.testnet, client=client)
+    if not ok:
+        if journal: journal.close()
+        if metrics_server: metrics_server.stop()
+        print(message, file=sys.stderr); return 2
+    if hedge_mode is False: print("Warning: Hedge Mode MUST be enabled.", file=sys.stderr)
+    registry = AccountRegistry(engine)
+    try:
+        if args.accounts:
+            configs = load_accounts(args.accounts); sim_clients = None
+            if args.sim:
+                from sim_exchange import SimClient
+                sim_clients = {c.name: SimClient(n_symbols=args.sim) for c in configs} # Same simulated market, separate account state
+            for name, (ok, message, hedge) in (await registry.connect_accounts(configs, args.testnet, sim_clients)).items():
+                print(f"Account {name}: {message}" + (" Warning: Hedge Mode MUST be enabled." if hedge is False else ""), file=sys.stderr if not ok or hedge is False else sys.stdout)
+        if args.command == 'pnl':
+            try: await asyncio.wait_for(asyncio.gather(*(e.income_ready.wait() for e in registry.connected_engines().values() if e.income_ready)), INCOME_WAIT_SECONDS) # First income sync
+            except asyncio.TimeoutError: print("Income history still syncing; net figures may be incomplete.", file=sys.stderr)
+            if len(registry.engines) == 1: print_snapshot(await engine.get_shared_pnl_snapshot()); print(registry.income_summary()); return 0
+            by_account = await registry.get_pnl_by_account()
+            for name, snapshot in by_account.items(): print(f"[{name}]"); print_snapshot(snapshot)
+            total = sum((total for _, _, total in by_account.values()), Decimal(0)); income = registry.session_income()
+            print(f"All accounts: {total:.4f} {QUOTE_ASSET}  net {total + income:.4f}\n{registry.income_summary()}"); return 0
+        if args.command == 'select':
+            basket = await BasketScorer(engine).select(args.count, args.sides, args.weights, args.tp_percent)
+            lines = [f"# {len(basket)} of {len(engine.tradable_symbols())} symbols by {', '.join(f'{n}={w:g}' for n, w in args.weights.items())}"] + [f"{b['symbol']},{b['position_side']},{b['tp_price'] or ''}" for b in basket]
+            if args.out:
+                with open(args.out, 'w') as f: f.write("\n".join(lines) + "\n")
+            print("\n".join(lines))
+            return 0 if basket else 1
+        if args.command == 'trade':
+            basket = load_basket(args.basket)
+            if not basket: print("Basket is empty.", file=sys.stderr); return 2
+            amount_per_coin = args.amount / Decimal(len(basket))
+            print(f"Placing {len(basket)} trades ({engine.leverage}x), ~{amount_per_coin:.4f} {QUOTE_ASSET} each...")
+            results, has_errors = await registry.open_basket(basket, amount_per_coin, args.sl_percent, execution_policy(args))
+        elif args.command == 'close-all':
+            policy = execution_policy(args)
+            if not args.yes and input(f"CLOSE ALL positions NOW with {policy.describe()} orders? [y/N] ").strip().lower() != 'y': print("Aborted."); return 1
+            results, has_errors = await registry.close_all(policy)
+        elif args.command == 'watch':
+            trigger = ProfitTrigger(args.target, trailing=args.trail, stop_loss=args.stop_loss, net=not args.gross)
+            print(f"Watching {'unrealized' if args.gross else 'net'} PNL for >= {args.target} {QUOTE_ASSET} (Ctrl+C to stop)...")
+            outcome = await registry.run_target_monitor(trigger)
+            print(f"Monitor stopped: {outcome.reason}")
+            if not outcome.fired: return 0
+            results, has_errors = outcome.results, outcome.has_errors
+        print("\n".join(results))
+        return 1 if has_errors else 0
+    finally:
+        await registry.disconnect()
+        if journal: journal.close()
+        if metrics_server: metrics_server.stop()
+        if args.stats: print("\n".join(REGISTRY.summary_lines()), file=sys.stderr)
+
+
+def execution_policy(args):
+    return ExecutionPolicy(args.algo, args.duration, args.slices, args.post_only, args.participation, args.max_slippage_bps)
+
+
+def add_execution_args(parser):
+    parser.add_argument('--algo', default="MARKET", type=str.upper, choices=ALGOS, help="How orders are worked (default: one MARKET order per leg)")
+    parser.add_argument('--duration', type=float, default=EXEC_DURATION_SECONDS, metavar='SECONDS', help="TWAP horizon / ICEBERG and CHASE deadline, after which the rest goes at market")
+    parser.add_argument('--slices', type=int, default=TWAP_SLICES, help="TWAP child orders")
+    parser.add_argument('--post-only', action='store_true', help="Work TWAP/ICEBERG children as chasing post-only limits")
+    parser.add_argument('--participation', type=float, default=MAX_PARTICIPATION, help="Max share of nearby book depth and of average volume per child")
+    parser.add_argument('--max-slippage-bps', type=float, default=MAX_SLIPPAGE_BPS, help="Depth within this many bps of the touch counts for --participation")
+
+
+def weights_arg(value):
+    """'momentum=1,funding=0.5' -> {factor: weight}."""
+    try: weights = {name.strip(): float(w) for name, w in (item.split('=') for item in value.split(',') if item.strip())}
+    except ValueError: raise argparse.ArgumentTypeError(f"expected FACTOR=WEIGHT,...: {value!r}")
+    unknown = set(weights) - set(FACTORS)
+    if unknown: raise argparse.ArgumentTypeError(f"unknown factors {', '.join(sorted(unknown))} (have {', '.join(FACTORS)})")
+    return weights
+
+
+def decimal_arg(value):
+    try: return Decimal(value)
+    except InvalidOperation: raise argparse.ArgumentTypeError(f"not a number: {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Binance USD-M futures trader (API keys from BINANCE_API_KEY / BINANCE_API_SECRET).")
+    parser.add_argument('--testnet', action='store_true', help="Use the futures testnet")
+    parser.add_argument('--leverage', type=int, default=LEVERAGE)
+    parser.add_argument('--no-stream', action='store_true', help="Poll PNL over REST instead of websocket streams")
+    parser.add_argument('--no-journal', action='store_true', help="Do not record orders in the trade journal")
+    parser.add_argument('--metrics-port', type=int, default=0, metavar='PORT', help="Serve Prometheus-style metrics on 127.0.0.1:PORT/metrics while running")
+    parser.add_argument('--stats', action='store_true', help="Print request/stage latency stats on exit")
+    parser.add_argument('--accounts', nargs='?', const=ACCOUNTS_PATH, metavar='FILE', help=f"Also trade the sub-accounts listed in FILE (default {ACCOUNTS_PATH})")
+    parser.add_argument('--sim', type=int, metavar='N_SYMBOLS', help="Dry run against the in-process simulated exchange")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('pnl', help="Print open positions and PNL")
+    select = commands.add_parser('select', help="Rank every symbol by market-data factors and print the top ones as a basket file")
+    select.add_argument('--count', type=int, default=BASKET_SIZE)
+    select.add_argument('--sides', default="LONG", type=str.upper, choices=SIDES, help="BOTH = half LONG, half SHORT")
+    select.add_argument('--weights', type=weights_arg, default=dict(DEFAULT_WEIGHTS), help=f"Factor weights, e.g. momentum=1,open_interest=0.5 (factors: {', '.join(FACTORS)})")
+    select.add_argument('--out', metavar='FILE', help="Also write the basket file here (for trade)")
+    select.add_argument('--tp-percent', type=float, help="TP this far from the mark (default: half the 24h range; 0 = none)")
+    trade = commands.add_parser('trade', help="Open a basket of market positions")
+    trade.add_argument('basket', help="CSV (SYMBOL,SIDE[,TP]) or JSON basket file")
+    trade.add_argument('--amount', type=decimal_arg, required=True, help=f"Total margin in {QUOTE_ASSET}, split equally")
+    trade.add_argument('--sl-percent', type=decimal_arg, help="Stop-loss this many percent from the mark for coins without an SL price")
+    add_execution_args(trade)
+    close_all = commands.add_parser('close-all', help="Close every open position with MARKET orders")
+    close_all.add_argument('--yes', action='store_true', help="Skip the confirmation prompt")
+    add_execution_args(close_all)
+    watch = commands.add_parser('watch', help="Close everything when total PNL hits a target / trailing / stop loss")
+    watch.add_argument('--target', type=decimal_arg, required=True)
+    watch.add_argument('--trail', type=decimal_arg, help="Trailing distance below the peak once the target is reached")
+    watch.add_argument('--stop-loss', type=decimal_arg, help="Close if total PNL falls to -STOP_LOSS")
+    watch.add_argument('--gross', action='store_true', help="Compare unrealized PNL only (default: plus the session's realized PNL, fees and funding)")
+    args = parser.parse_args(argv)
+    if args.command == 'trade' and args.amount <= 0: parser.error("--amount must be positive")
+    if args.command == 'select' and (args.count < 1 or (args.tp_percent is not None and args.tp_percent < 0)): parser.error("--count must be positive, --tp-percent not negative")
+    if args.command == 'watch' and args.target <= 0: parser.error("--target must be positive")
+    if args.command in ('trade', 'close-all') and (args.duration <= 0 or args.slices < 1 or not 0 < args.participation <= 1): parser.error("--duration and --slices must be positive, --participation in (0, 1]")
+    if not args.sim and not (os.environ.get('BINANCE_API_KEY') and os.environ.get('BINANCE_API_SECRET')): parser.error("Set BINANCE_API_KEY and BINANCE_API_SECRET (or use --sim)")
+    try: return asyncio.run(run(args))
+    except KeyboardInterrupt: print("Interrupted."); return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
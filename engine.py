@@ -0,0 +1,650 @@
+"""Headless trading engine: exchange client, symbol/leverage caches, positions and monitors.
+
+TradingEngine holds everything the GUI used to keep in module globals and
+runs all of it as coroutines on one asyncio loop. It has no tkinter
+dependency, so the same engine drives the Tk app (main.py), the CLI
+(cli.py) and the offline benchmarks (bench.py).
+"""
+import asyncio
+import time
+from decimal import Decimal, getcontext
+from typing import NamedTuple, Optional
+
+from binance.client import Client
+from binance.exceptions import BinanceAPIException, BinanceOrderException
+
+from accounting import IncomeLedger
+from async_core import create_client
+from execution import Executor, ExecutionReport, ParentOrder
+from order_engine import OrderDispatcher, OrderRequest, OrderResult
+from portfolio import PortfolioSnapshot
+from metrics import REGISTRY
+from quantizer import SymbolQuantizer, to_decimal
+from risk import RiskEngine, DEFAULT_MAINT_MARGIN_RATIO
+from profit_trigger import TICK_TO_DECISION, TICK_TO_FIRE
+from state_store import account_id
+from rate_limiter import LimitedClient, RateLimiter, PRIORITY_CRITICAL, request_priority
+from streaming import PositionBook, MarketStream, FUTURES_WS_URLS
+
+# --- Configuration ---
+LEVERAGE = 20
+QUOTE_ASSET = "USDC"
+TARGET_MONITOR_INTERVAL_SECONDS = 3 # How often the auto-TP monitor polls PNL when streams are down
+PNL_SNAPSHOT_MAX_AGE_SECONDS = 2.5 # Display and monitor reuse a PNL snapshot younger than this
+SYMBOL_CACHE_TTL_SECONDS = 900 # How often the symbol filter cache re-downloads exchangeInfo
+INCOME_SYNC_SECONDS = 30 # How often realized PNL / fees / funding are pulled from the income history
+INCOME_SETTLE_SECONDS = 2 # After a trade, wait this long before the early income sync (records lag the fill)
+USE_STREAMING = True # Read PNL from websocket streams instead of REST polling when the streams are live
+getcontext().prec = 18
+
+
+# --- Symbol Metadata ---
+class SymbolInfo(NamedTuple):
+    """Trading rules for one futures symbol, parsed once from exchangeInfo."""
+    symbol: str
+    quote_asset: str
+    contract_type: str
+    status: str
+    qty_precision: Optional[int]
+    price_precision: Optional[int]
+    step_size: Optional[Decimal]
+    tick_size: Optional[Decimal]
+    min_qty: Optional[Decimal]
+    max_qty: Optional[Decimal]
+    market_max_qty: Optional[Decimal]
+    min_notional: Optional[Decimal]
+    quantizer: Optional[SymbolQuantizer] = None # Precomputed step/tick rounding and order checks
+
+def _decimal_places(size):
+    exponent = Decimal(size).normalize().as_tuple().exponent
+    return -exponent if exponent < 0 else 0
+
+def parse_symbol_info(s):
+    """Builds a SymbolInfo (and its quantizer) from one entry of exchangeInfo['symbols']."""
+    q = SymbolQuantizer.from_filters(s['symbol'], s.get('filters', []))
+    return SymbolInfo(symbol=s['symbol'], quote_asset=s.get('quoteAsset'), contract_type=s.get('contractType'), status=s.get('status'),
+                      qty_precision=_decimal_places(q.step) if q.step is not None else None, price_precision=_decimal_places(q.tick) if q.tick is not None else None,
+                      step_size=q.step, tick_size=q.tick, min_qty=q.min_qty, max_qty=q.max_qty, market_max_qty=q.market_max_qty, min_notional=q.min_notional, quantizer=q)
+
+
+class Bracket(NamedTuple):
+    """Reduce-only exits still working for one filled entry (None = that exit is not on the book)."""
+    symbol: str
+    position_side: str
+    entry_id: int
+    tp_id: Optional[int]
+    sl_id: Optional[int]
+
+
+class BracketResult(NamedTuple):
+    """Outcome of one entry order and its exits (None when not requested)."""
+    entry: OrderResult
+    tp: Optional[OrderResult] = None
+    sl: Optional[OrderResult] = None
+
+    @property
+    def ok(self): return all(r.ok for r in self if r)
+
+    def describe(self):
+        lines = [r.describe() for r in self if r]
+        missing = [r.request.tag for r in (self.tp, self.sl) if r and not r.ok]
+        if self.entry.ok and missing: lines.append(f"WARNING ({self.entry.request.symbol}): position open without {'/'.join(missing)}")
+        return lines
+
+
+class MonitorResult(NamedTuple):
+    """How a target-profit watch ended. results/has_errors describe the close-all when fired."""
+    fired: bool
+    reason: str
+    results: list = []
+    has_errors: bool = False
+
+
+# --- Engine ---
+class TradingEngine:
+    """Owns the client, caches, streams and PNL snapshot. Every coroutine must run on one event loop."""
+    def __init__(self, leverage=LEVERAGE, use_streaming=USE_STREAMING, limiter=None, store=None, journal=None, name=None):
+        self.name = name # Account label (accounts.AccountRegistry), used in metrics
+        self.client = None # LimitedClient around an AsyncClient (or sim_exchange.SimClient)
+        self.limiter = limiter or RateLimiter() # Request weight / order-count budgets shared by every call
+        self.store = store; self.network = None; self.account = None # state_store.StateStore for warm starts (optional)
+        self.journal = journal # journal.Journal recording every order outcome (optional)
+        if journal: REGISTRY.gauge('journal_queue_depth', journal.queue.qsize, "Journal records waiting for the writer thread")
+        self.symbol_cache_version = None # Content hash of the exchangeInfo behind symbol_cache (state_store.exchange_info_version)
+        self.dispatcher = None # Batched/concurrent order sender bound to client
+        self.leverage = leverage; self.use_streaming = use_streaming
+        self.position_book = None; self.market_stream = None # Streaming position book (mark prices + user-data stream)
+        self.symbol_cache = {}; self.symbol_cache_loaded_at = 0.0; self.symbol_cache_task = None # symbol -> SymbolInfo, swapped wholesale on every refresh
+        self.leverage_cache = {} # symbol -> leverage currently set on the account (seeded at connect, updated on change)
+        self.brackets = {}; self.loop = None # entry order id -> Bracket whose exits are working; loop the engine runs on
+        self.order_waiters = {} # order id -> asyncio.Event set when the user-data stream reports the order done (execution.Executor)
+        self.pnl_snapshot = None; self.pnl_snapshot_at = 0.0; self.pnl_snapshot_lock = None # (status, PortfolioSnapshot, total_pnl) from the last fetch
+        self.risk = RiskEngine() # Cached balance / brackets / legs for pre-trade margin and liquidation checks
+        self.ledger = None; self.income_task = None; self.income_wakeup = None; self.income_ready = None # accounting.IncomeLedger kept in sync by a background task; income_ready is set after its first sync
+
+    @property
+    def connected(self): return self.client is not None
+
+    # --- Connection ---
+    async def connect(self, api_key, api_secret, testnet=False, client=None):
+        """Opens the pooled AsyncClient and runs the connect checks concurrently.
+        client: use this ready client instead (e.g. sim_exchange.SimClient for offline runs).
+        Returns (success, message, hedge_mode); hedge_mode is None if it could not be checked."""
+        self.network = "testnet" if testnet else "mainnet"; self.account = account_id(api_key, testnet); self.loop = asyncio.get_running_loop()
+        if self.store: self.leverage_cache.update(self.store.load_leverage(self.account)) # symbol_config below overrides it
+        try:
+            self.client = LimitedClient(client or await create_client(api_key, api_secret, testnet=testnet), self.limiter); self.dispatcher = OrderDispatcher(self.client, journal=self.journal)
+            self.limiter.register_metrics(**({'account': self.name} if self.name else {}))
+            self.pnl_snapshot_lock = asyncio.Lock()
+            print("Binance Connection Successful! Checking Settings...")
+            with REGISTRY.time('stage_duration_ms', stage='connect.checks'): account_info, position_mode, exchange_info, symbol_config, brackets = await asyncio.gather(self.client.futures_account_balance(), self.client.futures_get_position_mode(), self.client.futures_exchange_info(), self.client.futures_symbol_config(), self.client.futures_leverage_bracket(), return_exceptions=True)
+            for result in (account_info, exchange_info):
+                if isinstance(result, Exception): raise result
+            hedge_mode = None
+            if isinstance(position_mode, BinanceAPIException): print(f"Could not check position mode: {position_mode}")
+            elif isinstance(position_mode, Exception): raise position_mode
+            else:
+                hedge_mode = bool(position_mode.get('dualSidePosition'))
+                if not hedge_mode: print("CRITICAL Warning: Hedge Mode MUST be enabled in Binance Futures Settings.")
+            self.update_symbol_cache(exchange_info); self.start_symbol_cache_refresher(); await self._store_exchange_info(exchange_info)
+            if isinstance(symbol_config, Exception): print(f"Could not seed leverage cache: {symbol_config}")
+            else: self.update_leverage_cache(symbol_config)
+            self.risk.update_balances(account_info)
+            if isinstance(brackets, Exception): print(f"Could not load leverage brackets (risk checks assume {DEFAULT_MAINT_MARGIN_RATIO:.1%} maintenance): {brackets}")
+            else: self.risk.update_brackets(brackets)
+            self.ledger = IncomeLedger(self.store, self.account); await self.loop.run_in_executor(None, self.ledger.load); self.start_income_sync()
+            if self.use_streaming: self.start_streaming(testnet)
+            return True, "Connected successfully!", hedge_mode
+        except BinanceAPIException as e: await self.disconnect(); print(f"API Error: {e}"); return False, f"API Error: {e.message}", None
+        except Exception as e: await self.disconnect(); print(f"Connection Error: {e}"); return False, f"Connection Error: {e}", None
+
+    async def disconnect(self):
+        if self.store and self.account and self.leverage_cache:
+            try: self.store.save_leverage(self.account, self.leverage_cache)
+            except Exception as e: print(f"Error saving leverage cache: {e}")
+        self.stop_streaming(); self.stop_symbol_cache_refresher(); self.stop_income_sync(); self.invalidate_pnl_snapshot(); self.leverage_cache.clear(); self.brackets.clear(); self.risk.clear()
+        client = self.client; self.client = None; self.dispatcher = None
+        if client:
+            try: await client.close_connection()
+            except Exception as e: print(f"Error closing client session: {e}")
+
+    def start_streaming(self, testnet=False, ws_base_url=None):
+        """Starts the mark-price + user-data streams feeding position_book. The book is seeded from REST on (re)connect."""
+        self.stop_streaming()
+        self.position_book = PositionBook(); self.market_stream = MarketStream(self.client, self.position_book, ws_base_url or FUTURES_WS_URLS[testnet])
+        self.position_book.subscribe(self._on_leverage_event); self.position_book.subscribe(self._on_bracket_event); self.position_book.subscribe(self._on_order_done); self.position_book.subscribe(self.risk.on_account_event); self.position_book.leverage.update(self.leverage_cache) # positionRisk v3 carries no leverage
+        self.market_stream.start(asyncio.get_running_loop())
+
+    def stop_streaming(self):
+        if self.market_stream: self.market_stream.stop()
+        self.position_book = None; self.market_stream = None
+
+    def stream_live(self):
+        stream = self.market_stream
+        return bool(stream and self.position_book and stream.is_live())
+
+    # --- Symbol Metadata Cache ---
+    def update_symbol_cache(self, exchange_info):
+        """Replaces the symbol cache from an exchangeInfo payload we already hold."""
+        new_cache = {}
+        for s in exchange_info.get('symbols', []):
+            try: new_cache[s['symbol']] = parse_symbol_info(s)
+            except (KeyError, ArithmeticError) as e: print(f"Warning: Bad exchangeInfo entry {s.get('symbol')}: {e}")
+        self.symbol_cache = new_cache; self.symbol_cache_loaded_at = time.time()
+        return new_cache
+
+    async def refresh_symbol_cache(self):
+        """Downloads exchangeInfo once and refreshes the cache. Returns the raw payload."""
+        if not self.client: return None
+        exchange_info = await self.client.futures_exchange_info()
+        self.update_symbol_cache(exchange_info); await self._store_exchange_info(exchange_info)
+        return exchange_info
+
+    async def _store_exchange_info(self, exchange_info):
+        """Persists exchangeInfo off the loop thread; the store skips the write when the version is unchanged."""
+        if not self.store or not self.network: return
+        try: self.symbol_cache_version, changed = await asyncio.get_running_loop().run_in_executor(None, self.store.save_exchange_info, self.network, exchange_info)
+        except Exception as e: print(f"Error saving exchangeInfo: {e}"); return
+        if changed: print(f"exchangeInfo cached (version {self.symbol_cache_version[:8]}).")
+
+    def warm_start(self, testnet=False):
+        """Loads the cached exchangeInfo (if any) so symbols and filters are usable before connect. Returns tradable symbols."""
+        if not self.store: return []
+        exchange_info, version = self.store.load_exchange_info("testnet" if testnet else "mainnet")
+        if not exchange_info: return []
+        self.update_symbol_cache(exchange_info); self.symbol_cache_version = version
+        return self.tradable_symbols()
+
+    def get_symbol_info(self, symbol) -> Optional[SymbolInfo]:
+        """Cached trading rules for a symbol; None if the symbol is unknown."""
+        return self.symbol_cache.get(symbol)
+
+    def tradable_symbols(self, quote_asset=QUOTE_ASSET):
+        return sorted(i.symbol for i in self.symbol_cache.values() if i.quote_asset == quote_asset and i.contract_type == 'PERPETUAL' and i.status == 'TRADING')
+
+    async def ensure_symbols_cached(self, symbols):
+        """Refreshes the cache once if any symbol is unknown (new listing?), at most every 5s."""
+        if any(s not in self.symbol_cache for s in symbols) and self.client and time.time() - self.symbol_cache_loaded_at > 5:
+            try: await self.refresh_symbol_cache()
+            except BinanceAPIException as e: print(f"Error refreshing symbol cache: {e}")
+
+    async def _run_symbol_cache_refresher(self):
+        while self.client:
+            await asyncio.sleep(SYMBOL_CACHE_TTL_SECONDS)
+            try: await self.refresh_symbol_cache(); print(f"Symbol cache refreshed ({len(self.symbol_cache)} symbols).")
+            except Exception as e: print(f"Symbol cache refresh failed, keeping old cache: {e}")
+
+    def start_symbol_cache_refresher(self):
+        if self.symbol_cache_task is None or self.symbol_cache_task.done(): self.symbol_cache_task = asyncio.ensure_future(self._run_symbol_cache_refresher())
+
+    def stop_symbol_cache_refresher(self):
+        if self.symbol_cache_task: self.symbol_cache_task.cancel()
+        self.symbol_cache_task = None; self.symbol_cache = {}; self.symbol_cache_loaded_at = 0.0; self.symbol_cache_version = None
+
+    def get_quantizer(self, symbol) -> Optional[SymbolQuantizer]:
+        info = self.get_symbol_info(symbol)
+        return info.quantizer if info else None
+
+    # --- Leverage State Cache ---
+    def update_leverage_cache(self, entries):
+        """Seeds the cache from futures_symbol_config() (or position info) rows carrying symbol + leverage."""
+        for e in entries:
+            if e.get('symbol') and e.get('leverage') not in (None, '', 'N/A'): self.leverage_cache[e['symbol']] = int(e['leverage'])
+
+    def _on_leverage_event(self, kind, payload):
+        """Keeps the cache current when leverage is changed elsewhere (ACCOUNT_CONFIG_UPDATE)."""
+        if kind == 'config' and payload.get('ac'): self.leverage_cache[payload['ac']['s']] = int(payload['ac']['l'])
+
+    async def ensure_leverage(self, symbol, leverage=None):
+        """Sets leverage only when the cached value differs. Returns True if the REST call was made."""
+        leverage = leverage or self.leverage
+        if self.leverage_cache.get(symbol) == leverage: return False
+        try: await self.client.futures_change_leverage(symbol=symbol, leverage=leverage)
+        except BinanceAPIException as e:
+            if "leverage not modified" not in str(e).lower(): raise
+        self.leverage_cache[symbol] = leverage
+        return True
+
+    async def preapply_leverage(self, symbols, leverage=None):
+        """Bulk mode: sets leverage on every symbol whose cached value differs, concurrently.
+        Returns {symbol: error message} for the ones that failed."""
+        leverage = leverage or self.leverage
+        pending = [s for s in dict.fromkeys(symbols) if self.leverage_cache.get(s) != leverage]
+        if not pending: return {}
+        if not self.dispatcher: return {s: "Not connected." for s in pending}
+        async def apply(symbol):
+            try: await self.ensure_leverage(symbol, leverage); return None
+            except (BinanceAPIException, BinanceOrderException) as e: return e.message
+            except Exception as e: return str(e)
+        errors = await self.dispatcher.map(apply, pending)
+        return {s: err for s, err in zip(pending, errors) if err}
+
+    # --- Orders ---
+    def entry_quantity(self, amount, mark):
+        """Position size for `amount` quote margin at `mark`, before step snapping: amount * leverage / mark."""
+        return (to_decimal(amount) * Decimal(self.leverage)) / to_decimal(mark)
+
+    @staticmethod
+    def stop_price(mark, position_side, sl_percent):
+        """Stop-loss price sl_percent away from mark, on the losing side of the leg."""
+        return to_decimal(mark) * (1 - to_decimal(sl_percent) / 100 if position_side == "LONG" else 1 + to_decimal(sl_percent) / 100)
+
+    def _market_requests(self, symbol, side, position_side, quantity, tag, mark=None, reduce_only=False):
+        """Snaps quantity to the symbol's step and splits it into MARKET_LOT_SIZE chunks.
+        Returns (requests, error); error is set (with one unsendable request) when the exchange would reject it."""
+        quantizer = self.get_quantizer(symbol); params = {'newOrderRespType': 'RESULT'} # Fill qty / avgPrice in the response, for the journal
+        if reduce_only: params['reduceOnly'] = True
+        ref_price = to_decimal(mark) if mark else None
+        if quantizer is None: return [OrderRequest(symbol, side, position_side, Client.ORDER_TYPE_MARKET, to_decimal(quantity), params=params, tag=tag, ref_price=ref_price)], "Unknown symbol."
+        chunks = quantizer.split_market(quantizer.quantity(quantity))
+        requests = [OrderRequest(symbol, side, position_side, Client.ORDER_TYPE_MARKET, qty, params=params, tag=tag, ref_price=ref_price) for qty in chunks]
+        error = quantizer.check(min(chunks), mark, reduce_only=reduce_only)
+        return (requests[:1], error) if error else (requests, None)
+
+    def _journal_local(self, result):
+        """Journals a result the dispatcher did not: an order rejected before sending, or a chase child in its final state."""
+        if self.journal: self.journal.record(result)
+
+    def _exit_request(self, entry, kind, stop_price, quantity=None):
+        """Reduce-only TAKE_PROFIT_MARKET (kind "TP") or STOP_MARKET ("SL") closing entry's quantity at stop_price (already snapped)."""
+        order_type = Client.FUTURE_ORDER_TYPE_TAKE_PROFIT_MARKET if kind == "TP" else Client.FUTURE_ORDER_TYPE_STOP_MARKET
+        side = Client.SIDE_SELL if entry.side == Client.SIDE_BUY else Client.SIDE_BUY
+        return OrderRequest(entry.symbol, side, entry.position_side, order_type, quantity or entry.quantity, params={'stopPrice': stop_price, 'timeInForce': Client.TIME_IN_FORCE_GTC, 'reduceOnly': True}, tag=kind)
+
+    async def place_brackets(self, trades, policy=None):
+        """Market entries with optional take-profit / stop-loss exits; each entry travels with its exits in one batchOrders request.
+        trades: dicts with symbol, side, position_side, quantity and optional tp_price, sl_price, mark (for the min-notional check).
+        Oversized entries are split into MARKET_LOT_SIZE chunks, each with its own exits. The exchange does not process a batch
+        in order, so an exit can be rejected before its entry fills: rejected exits of filled entries are re-sent (with the filled
+        quantity) and exits accepted for a failed entry are cancelled, concurrently. Returns one BracketResult per entry order, in trade order.
+        policy: an execution.ExecutionPolicy other than MARKET works the entries instead (see _execute_brackets)."""
+        if policy and not policy.is_market and self.dispatcher: return await self._execute_brackets(trades, policy)
+        if not self.dispatcher: return [BracketResult(OrderResult(OrderRequest(t['symbol'], t['side'], t['position_side'], 'MARKET', to_decimal(t['quantity']), tag="ENTRY"), False, error="Not connected.")) for t in trades]
+        await self.ensure_symbols_cached([t['symbol'] for t in trades])
+        with REGISTRY.time('stage_duration_ms', stage='orders.leverage'): leverage_errors = await self.preapply_leverage([t['symbol'] for t in trades]) # Only symbols whose cached leverage differs
+        outcomes = [[] for _ in trades]; groups = []; slots = [] # slots[g] = (trade index, exit kinds sent with group g)
+        for i, t in enumerate(trades):
+            requests, error = self._market_requests(t['symbol'], t['side'], t['position_side'], t['quantity'], "ENTRY", t.get('mark'))
+            error = f"Leverage Error: {leverage_errors[t['symbol']]}" if t['symbol'] in leverage_errors else error
+            if error: outcomes[i].append(BracketResult(OrderResult(requests[0], False, error=error))); self._journal_local(outcomes[i][-1].entry); continue
+            quantizer = self.get_quantizer(t['symbol'])
+            stops = {kind: quantizer.price(t[key]) for kind, key in (("TP", 'tp_price'), ("SL", 'sl_price')) if t.get(key) and to_decimal(t[key]) > 0}
+            for entry in requests:
+                exits = [self._exit_request(entry, kind, price) for kind, price in stops.items() if price > 0]
+                invalid = {kind: OrderResult(self._exit_request(entry, kind, price), False, error=f"Invalid {kind} price.") for kind, price in stops.items() if price <= 0}
+                for result in invalid.values(): self._journal_local(result)
+                outcomes[i].append(invalid); groups.append([entry] + exits); slots.append((i, len(outcomes[i]) - 1, [r.tag for r in exits]))
+        with REGISTRY.time('stage_duration_ms', stage='orders.brackets'): group_results = await self.dispatcher.submit_groups(groups)
+        retries = []; orphans = []
+        for (i, j, kinds), results in zip(slots, group_results):
+            entry_result = results[0]; legs = dict(outcomes[i][j]); legs.update(zip(kinds, results[1:]))
+            outcomes[i][j] = (entry_result, legs)
+            for kind, leg in legs.items():
+                if entry_result.ok and not leg.ok and leg.error_code is not None: # Exchange-rejected exit: retry once
+                    filled = to_decimal(entry_result.order.get('executedQty') or 0) if entry_result.order else 0
+                    retries.append((i, j, kind, self._exit_request(entry_result.request, kind, leg.request.params['stopPrice'], filled if filled > 0 else None)))
+                elif not entry_result.ok and leg.ok: orphans.append((leg.request.symbol, leg.order_id))
+        if retries or orphans:
+            with REGISTRY.time('stage_duration_ms', stage='orders.bracket_fixup'):
+                retried, cancel_errors = await asyncio.gather(self.dispatcher.submit([r for *_, r in retries]), self.dispatcher.cancel(orphans))
+            for (i, j, kind, _), result in zip(retries, retried): outcomes[i][j][1][kind] = result
+            for order_id, error in cancel_errors.items(): print(f"Could not cancel exit {order_id} of a failed entry: {error}")
+        brackets = []
+        for trade_outcomes in outcomes:
+            for outcome in trade_outcomes:
+                if isinstance(outcome, BracketResult): brackets.append(outcome); continue
+                entry_result, legs = outcome; bracket = BracketResult(entry_result, legs.get("TP"), legs.get("SL")); brackets.append(bracket)
+                exit_ids = {kind: leg.order_id for kind, leg in legs.items() if leg.ok}
+                if entry_result.ok and exit_ids: self.brackets[entry_result.order_id] = Bracket(entry_result.request.symbol, entry_result.request.position_side, entry_result.order_id, exit_ids.get("TP"), exit_ids.get("SL"))
+        return brackets
+
+    async def _execute_brackets(self, trades, policy):
+        """place_brackets with every entry worked by an execution.Executor; the exits follow for the quantity actually filled.
+        Returns one BracketResult per trade whose entry is an ExecutionReport."""
+        await self.ensure_symbols_cached([t['symbol'] for t in trades])
+        with REGISTRY.time('stage_duration_ms', stage='orders.leverage'): leverage_errors = await self.preapply_leverage([t['symbol'] for t in trades])
+        parents = [ParentOrder(t['symbol'], t['side'], t['position_side'], to_decimal(t['quantity']), tag="ENTRY", ref_price=to_decimal(t['mark']) if t.get('mark') else None) for t in trades]
+        worked = [i for i, t in enumerate(trades) if t['symbol'] not in leverage_errors]
+        reports = dict(zip(worked, await Executor(self, policy).run(parents[i] for i in worked)))
+        exits = []; entries = []
+        for i, t in enumerate(trades):
+            if i not in reports: reports[i] = ExecutionReport(parents[i], to_decimal(t['quantity']), Decimal(0), None, [], f"Leverage Error: {leverage_errors[t['symbol']]}"); continue
+            quantizer = self.get_quantizer(t['symbol']); filled = reports[i].filled
+            if filled <= 0 or quantizer is None: continue
+            entry = OrderRequest(t['symbol'], t['side'], t['position_side'], Client.ORDER_TYPE_MARKET, filled, tag="ENTRY")
+            for kind, key in (("TP", 'tp_price'), ("SL", 'sl_price')):
+                if t.get(key) and quantizer.price(t[key]) > 0: exits.append(self._exit_request(entry, kind, quantizer.price(t[key]))); entries.append(i)
+        legs = {}
+        for i, result in zip(entries, await self.dispatcher.submit(exits) if exits else []): legs.setdefault(i, {})[result.request.tag] = result
+        for i, i_legs in legs.items():
+            exit_ids = {kind: leg.order_id for kind, leg in i_legs.items() if leg.ok}
+            if exit_ids and reports[i].order_id: self.brackets[reports[i].order_id] = Bracket(trades[i]['symbol'], trades[i]['position_side'], reports[i].order_id, exit_ids.get("TP"), exit_ids.get("SL"))
+        return [BracketResult(reports[i], legs.get(i, {}).get("TP"), legs.get(i, {}).get("SL")) for i in range(len(trades))]
+
+    async def cancel_brackets(self, legs=None):
+        """Cancels the working exits of tracked brackets in bulk. legs: (symbol, position_side) pairs, or None for all.
+        Returns {order_id: error} for exits that could not be cancelled."""
+        done = [b for b in self.brackets.values() if legs is None or (b.symbol, b.position_side) in legs]
+        for b in done: self.brackets.pop(b.entry_id, None)
+        orders = [(b.symbol, order_id) for b in done for order_id in (b.tp_id, b.sl_id) if order_id]
+        if not orders or not self.dispatcher: return {}
+        return await self.dispatcher.cancel(orders)
+
+    def _on_bracket_event(self, kind, payload):
+        """OCO: when one exit of a bracket fills, its sibling is cancelled; exits that end otherwise are forgotten."""
+        if kind != 'order': return
+        order = payload.get('o', {}); status = order.get('X'); order_id = order.get('i')
+        if status not in ('FILLED', 'CANCELED', 'EXPIRED'): return
+        for bracket in [b for b in self.brackets.values() if order_id in (b.tp_id, b.sl_id)]:
+            sibling = bracket.sl_id if order_id == bracket.tp_id else bracket.tp_id
+            if status == 'FILLED' or not sibling: del self.brackets[bracket.entry_id]
+            else: self.brackets[bracket.entry_id] = bracket._replace(tp_id=sibling if sibling == bracket.tp_id else None, sl_id=sibling if sibling == bracket.sl_id else None)
+            if status == 'FILLED' and sibling and self.dispatcher and self.loop: self.loop.call_soon_threadsafe(asyncio.ensure_future, self.dispatcher.cancel([(bracket.symbol, sibling)]))
+
+    def _on_order_done(self, kind, payload):
+        """Wakes wait_order() when the user-data stream reports the order filled, cancelled or expired."""
+        if kind != 'order': return
+        order = payload.get('o', {}); waiter = self.order_waiters.get(order.get('i'))
+        if waiter and order.get('X') in ('FILLED', 'CANCELED', 'EXPIRED') and self.loop: self.loop.call_soon_threadsafe(waiter.set)
+
+    async def wait_order(self, order_id, timeout):
+        """Sleeps up to timeout seconds; returns early when the (live) user-data stream reports order_id done."""
+        if not self.stream_live(): await asyncio.sleep(timeout); return
+        waiter = self.order_waiters.setdefault(order_id, asyncio.Event())
+        try: await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError: pass
+        finally: self.order_waiters.pop(order_id, None)
+
+    async def place_closing_orders(self, positions, policy=None):
+        """Closes legs with reduce-only MARKET orders. positions: list of dicts with symbol, positionSide, amount (and optional mark).
+        Legs above MARKET_LOT_SIZE are split. Returns one OrderResult per order (or per rejected leg), in order.
+        policy: an execution.ExecutionPolicy other than MARKET works each leg instead; then one ExecutionReport per leg is returned."""
+        await self.ensure_symbols_cached([pos['symbol'] for pos in positions])
+        if policy and not policy.is_market and self.dispatcher:
+            parents = [ParentOrder(p['symbol'], Client.SIDE_SELL if p['positionSide'] == 'LONG' else Client.SIDE_BUY, p['positionSide'], to_decimal(p['amount']), True, "CLOSE", to_decimal(p['mark']) if p.get('mark') else None) for p in positions]
+            with REGISTRY.time('stage_duration_ms', stage='orders.close'):
+                reports, cancel_errors = await asyncio.gather(Executor(self, policy).run(parents), self.cancel_brackets({(p['symbol'], p['positionSide']) for p in positions}))
+            for order_id, error in cancel_errors.items(): print(f"Could not cancel exit order {order_id}: {error}")
+            return reports
+        requests = []; errors = {}
+        for pos in positions:
+            side = Client.SIDE_SELL if pos['positionSide'] == 'LONG' else Client.SIDE_BUY
+            leg_requests, error = self._market_requests(pos['symbol'], side, pos['positionSide'], pos['amount'], "CLOSE", pos.get('mark'), reduce_only=True)
+            if error: errors[len(requests)] = error; self._journal_local(OrderResult(leg_requests[0], False, error=error))
+            requests += leg_requests
+        if not self.dispatcher: return [OrderResult(r, False, error="Not connected.") for r in requests]
+        with REGISTRY.time('stage_duration_ms', stage='orders.close'): # Leftover bracket exits of these legs are cancelled alongside
+            closed, cancel_errors = await asyncio.gather(self.dispatcher.submit([r for i, r in enumerate(requests) if i not in errors]), self.cancel_brackets({(p['symbol'], p['positionSide']) for p in positions}))
+        for order_id, error in cancel_errors.items(): print(f"Could not cancel exit order {order_id}: {error}")
+        sent = iter(closed)
+        return [OrderResult(r, False, error=errors[i]) if i in errors else next(sent) for i, r in enumerate(requests)]
+
+    # --- High-level Actions ---
+    async def open_basket(self, selections, amount_per_coin, sl_percent=None, policy=None):
+        """Bracketed market entries for a basket. selections: dicts with symbol, position_side and optional tp_price / sl_price.
+        amount_per_coin is margin in the quote asset; sl_percent sets a stop that far from the mark where sl_price is not given.
+        policy: execution.ExecutionPolicy for the entries (None = market). Returns (result lines, has_errors)."""
+        results = []; has_errors = False; trades = []
+        try: await self._start_session_if_flat()
+        except Exception as e: print(f"Could not check for open legs before the basket: {e}")
+        try:
+            with REGISTRY.time('stage_duration_ms', stage='basket.marks'): marks = {m['symbol']: Decimal(m['markPrice']) for m in await self._fetch_marks_for_risk()} # One call for every symbol
+        except BinanceAPIException as e: marks = {}; results.append(f"Mark price fetch error - {e.message}"); has_errors = True
+        except Exception as e: marks = {}; results.append(f"Mark price fetch error - {e}"); has_errors = True # Malformed rows or transport failures; each leg then reports no mark
+        for info in selections:
+            symbol=info["symbol"]; pos_side=info["position_side"]; tp=info.get("tp_price"); sl=info.get("sl_price"); side=Client.SIDE_BUY if pos_side=="LONG" else Client.SIDE_SELL
+            mark = marks.get(symbol, Decimal(0))
+            if mark <= 0: results.append(f"{symbol}: Error - Invalid mark"); has_errors=True; continue
+            if not sl and sl_percent: sl = self.stop_price(mark, pos_side, sl_percent)
+            if tp:
+                tp_d = Decimal(str(tp))
+                if pos_side=="LONG" and tp_d <= mark: results.append(f"TP ({symbol}): Warn - TP ≤ Mark")
+                elif pos_side=="SHORT" and tp_d >= mark: results.append(f"TP ({symbol}): Warn - TP ≥ Mark")
+            if sl:
+                sl_d = to_decimal(sl)
+                if pos_side=="LONG" and sl_d >= mark: results.append(f"SL ({symbol}): Warn - SL ≥ Mark")
+                elif pos_side=="SHORT" and sl_d <= mark: results.append(f"SL ({symbol}): Warn - SL ≤ Mark")
+            trades.append({'symbol': symbol, 'side': side, 'position_side': pos_side, 'quantity': self.entry_quantity(amount_per_coin, mark), 'tp_price': tp, 'sl_price': sl, 'mark': mark})
+        if trades:
+            trades, risk_lines, rejected = self.check_risk(trades); results += risk_lines; has_errors = has_errors or rejected
+        if trades:
+            try:
+                with REGISTRY.time('stage_duration_ms', stage='basket.orders'): outcomes = await self.place_brackets(trades, policy)
+                for bracket in outcomes: results += bracket.describe(); has_errors = has_errors or not bracket.ok
+            except Exception as e: results.append(f"Multi-trade: Error - {e}"); has_errors=True
+        self.invalidate_pnl_snapshot(); self.request_income_sync()
+        return results, has_errors
+
+    async def add_position(self, symbol, position_side, amount):
+        """Single market add of `amount` quote margin. Returns (message, is_error)."""
+        side = Client.SIDE_BUY if position_side == "LONG" else Client.SIDE_SELL; msg = ""; is_err = True
+        try:
+            ticker = await self._fetch_marks_for_risk(symbol); mark = Decimal(ticker['markPrice'])
+            if mark <= 0: msg = f"ADD ({symbol}): Error - Invalid mark"
+            else:
+                trades, risk_lines, rejected = self.check_risk([{'symbol': symbol, 'side': side, 'position_side': position_side, 'quantity': self.entry_quantity(amount, mark), 'mark': mark}])
+                outcomes = await self.place_brackets(trades) if trades else []
+                msg = "\n".join(risk_lines + [b.entry.describe() for b in outcomes]); is_err = rejected or not all(b.ok for b in outcomes)
+        except BinanceAPIException as e: msg = f"ADD ({symbol}): API Error - {e.message}"
+        except Exception as e: msg = f"ADD ({symbol}): Error - {e}" # Malformed responses or transport failures: reported like rejections, never raised to the caller
+        self.invalidate_pnl_snapshot(); self.request_income_sync(); print(msg)
+        return msg, is_err
+
+    async def _fetch_marks_for_risk(self, symbol=None):
+        """futures_mark_price(symbol); while the user-data stream is down the wallet balance is refreshed alongside for the risk check."""
+        marks = self.client.futures_mark_price(symbol=symbol) if symbol else self.client.futures_mark_price()
+        if self.stream_live(): return await marks
+        marks, balances = await asyncio.gather(marks, self.client.futures_account_balance(), return_exceptions=True)
+        if isinstance(marks, Exception): raise marks
+        if not isinstance(balances, Exception): self.risk.update_balances(balances)
+        return marks
+
+    def check_risk(self, trades):
+        """Local margin / liquidation check of entries before anything is sent (no REST). Returns (trades to send, possibly
+        scaled down, result lines, rejected)."""
+        if self.stream_live(): self.risk.observe(self.position_book.snapshot()[1])
+        elif self.pnl_snapshot: self.risk.observe(self.pnl_snapshot[1])
+        check = self.risk.check_basket(trades, self.leverage); REGISTRY.observe('stage_duration_ms', check.elapsed_us / 1000, stage='risk.check')
+        if not check.ok: return [], [check.describe()], True
+        if check.scale < 1: trades = [dict(t, quantity=to_decimal(t['quantity']) * to_decimal(check.scale)) for t in trades]
+        return trades, check.describe().splitlines(), False
+
+    async def close_all(self, policy=None):
+        """Closes every open leg with MARKET orders (or worked under an execution.ExecutionPolicy). Returns (result lines, has_errors).
+        Runs at critical request priority: ahead of polls and allowed into the reserved budget."""
+        with request_priority(PRIORITY_CRITICAL), REGISTRY.time('stage_duration_ms', stage='close_all'): return await self._close_all(policy)
+
+    async def _close_all(self, policy=None):
+        results = []; has_errors = False; positions_to_close = []
+        try:
+            with REGISTRY.time('stage_duration_ms', stage='close_all.positions'): positions = await self.client.futures_position_information()
+            for pos in positions:
+                if Decimal(pos.get('positionAmt', '0')) != Decimal(0):
+                    positions_to_close.append({'symbol': pos['symbol'], 'positionSide': pos['positionSide'], 'amount': abs(Decimal(pos['positionAmt'])), 'mark': pos.get('markPrice')})
+            if not positions_to_close: results.append("No open positions found to close.")
+            else:
+                results.append(f"Found {len(positions_to_close)} positions. Sending {policy.describe() if policy else 'MARKET'} close orders...")
+                for close_result in await self.place_closing_orders(positions_to_close, policy): # Batched and sent concurrently
+                    results.append(close_result.describe())
+                    if not close_result.ok: has_errors = True
+        except BinanceAPIException as e: results.append(f"CLOSE ALL: API Error - {e.message}"); has_errors = True
+        except Exception as e: results.append(f"CLOSE ALL: Generic Error - {e}"); has_errors = True
+        self.invalidate_pnl_snapshot(); self.request_income_sync()
+        return results, has_errors
+
+    # --- Income (realized PNL, fees, funding) ---
+    async def _run_income_sync(self):
+        while self.client:
+            try:
+                fresh = await self.ledger.sync(self.client, self.loop)
+                if fresh: print(f"Income: {fresh} new records. {self.ledger.describe()}")
+            except Exception as e: print(f"Income sync error: {e}")
+            self.income_ready.set()
+            try: await asyncio.wait_for(self.income_wakeup.wait(), INCOME_SYNC_SECONDS)
+            except asyncio.TimeoutError: continue
+            self.income_wakeup.clear(); await asyncio.sleep(INCOME_SETTLE_SECONDS)
+
+    def start_income_sync(self):
+        self.income_wakeup = asyncio.Event(); self.income_ready = asyncio.Event()
+        if self.income_task is None or self.income_task.done(): self.income_task = asyncio.ensure_future(self._run_income_sync())
+
+    def stop_income_sync(self):
+        if self.income_task: self.income_task.cancel()
+        self.income_task = None; self.ledger = None
+
+    def request_income_sync(self):
+        """Wakes the income sync early (after orders changed positions)."""
+        if self.income_wakeup: self.income_wakeup.set()
+
+    def session_income(self):
+        """Realized PNL + fees + funding since the session started (Decimal; 0 before the first sync)."""
+        return self.ledger.session_net() if self.ledger else Decimal(0)
+
+    async def _start_session_if_flat(self):
+        """Starts a new income session when no leg is open, so the coming basket's net PNL leaves earlier trades out."""
+        if not self.ledger: return
+        status, snapshot, _ = await self.get_shared_pnl_snapshot()
+        if len(snapshot) or 'Error' in status or status == "Not connected.": return
+        self.ledger.start_session(); await self.loop.run_in_executor(None, self.ledger.save_state); print("Income: new session started (account flat).")
+
+    # --- PNL ---
+    async def get_open_positions_pnl(self):
+        """Position and bulk mark-price calls in parallel, joined into one vectorized PortfolioSnapshot.
+        Returns (status, snapshot, total_pnl)."""
+        if not self.client: return "Not connected.", PortfolioSnapshot.empty(), Decimal(0)
+        try:
+            with REGISTRY.time('stage_duration_ms', stage='pnl.fetch'): positions, mark_list = await asyncio.gather(self.client.futures_position_information(), self.client.futures_mark_price())
+            if not positions: return "No positions info.", PortfolioSnapshot.empty(), Decimal(0)
+            snapshot = PortfolioSnapshot.from_position_info(positions, {m['symbol']: m['markPrice'] for m in mark_list}, self.leverage_cache)
+            total_pnl = snapshot.total_pnl_decimal()
+            status = f"PNL ({len(snapshot)} Pos). Total: {total_pnl:.4f} {QUOTE_ASSET}" if len(snapshot) else "No active positions."
+            return status, snapshot, total_pnl
+        except BinanceAPIException as e: return f"API Error PNL: {e.message}", PortfolioSnapshot.empty(), Decimal(0)
+        except Exception as e: return f"Error PNL: {e}", PortfolioSnapshot.empty(), Decimal(0)
+
+    async def get_shared_pnl_snapshot(self, max_age=PNL_SNAPSHOT_MAX_AGE_SECONDS):
+        """PNL snapshot shared by the display and the target monitor.
+        Served from the streaming position book while it is live, otherwise fetched over REST
+        only when the cached one is older than max_age; concurrent callers wait for one fetch.
+        The risk engine keeps the latest one and fills its liq_price column."""
+        book = self.position_book
+        if self.stream_live(): snapshot = book.snapshot(); self.risk.observe(snapshot[1]); return snapshot # Local book, no REST calls
+        if self.pnl_snapshot_lock is None: self.pnl_snapshot_lock = asyncio.Lock()
+        async with self.pnl_snapshot_lock:
+            if self.pnl_snapshot is None or time.monotonic() - self.pnl_snapshot_at >= max_age:
+                self.pnl_snapshot = await self.get_open_positions_pnl(); self.pnl_snapshot_at = time.monotonic(); self.risk.observe(self.pnl_snapshot[1])
+            return self.pnl_snapshot
+
+    def invalidate_pnl_snapshot(self):
+        """Forces the next get_shared_pnl_snapshot() to refetch (after orders change positions)."""
+        self.pnl_snapshot = None
+
+    # --- Target Profit Monitor ---
+    async def run_target_monitor(self, trigger, notify=None):
+        """Drives a ProfitTrigger until it fires (then closes everything), positions disappear or the client disconnects.
+        While the streams are live the trigger is evaluated on every mark tick and this coroutine
+        only waits for it to fire; otherwise it falls back to polling snapshots.
+        notify(message) receives progress lines. Cancel the task to stop watching."""
+        notify = notify or print
+        print(f"Target TP Monitor started. Target: {trigger.target:.4f} {QUOTE_ASSET}{' net of fees and funding' if trigger.net else ''}")
+        error_backoff = TARGET_MONITOR_INTERVAL_SECONDS
+        loop = asyncio.get_running_loop(); fired = asyncio.Event()
+        iteration = REGISTRY.histogram('stage_duration_ms', stage='monitor.iteration'); lag = REGISTRY.histogram('monitor_loop_lag_ms', "How late the target monitor wakes after its wait")
+        trigger.on_fire = lambda reason: loop.call_soon_threadsafe(fired.set)
+        try:
+            while True:
+                if not self.client:
+                    print("Monitor: Disconnected. Stopping monitor.")
+                    return MonitorResult(False, "Disconnected")
+                try:
+                    book = self.position_book; started = time.perf_counter(); trigger.offset = self.session_income()
+                    if self.stream_live():
+                        if trigger.book is not book: trigger.detach(); trigger.attach(book) # Event-driven: decisions happen per tick
+                        try: await asyncio.wait_for(fired.wait(), 0.25) # Wakes immediately when the trigger fires
+                        except asyncio.TimeoutError: lag.record(max(0.0, (time.perf_counter() - started - 0.25) * 1000))
+                        has_positions = trigger.leg_count > 0
+                    else:
+                        if trigger.book: trigger.detach() # Streams down: poll instead
+                        status_msg, current_positions, current_total_pnl = await self.get_shared_pnl_snapshot()
+                        trigger.evaluate(current_total_pnl); has_positions = bool(current_positions); iteration.record((time.perf_counter() - started) * 1000)
+
+                    if trigger.fired.is_set():
+                        trigger.detach()
+                        print(f"Monitor: {trigger.reason} REACHED! (Current: {trigger.total if trigger.legs else 'polled'}) Latency: {TICK_TO_FIRE.summary()}")
+                        notify(f"{trigger.reason} HIT! Attempting MARKET close...")
+                        results, has_errors = await self.close_all()
+                        return MonitorResult(True, trigger.reason, results, has_errors)
+
+                    if not has_positions:
+                        print("Monitor: No open positions found. Stopping monitor.")
+                        return MonitorResult(False, "No open positions")
+
+                    if not trigger.book: # Polling fallback interval
+                        slept = time.perf_counter(); await asyncio.sleep(TARGET_MONITOR_INTERVAL_SECONDS); lag.record(max(0.0, (time.perf_counter() - slept - TARGET_MONITOR_INTERVAL_SECONDS) * 1000))
+                    error_backoff = TARGET_MONITOR_INTERVAL_SECONDS
+                except Exception as e:
+                    print(f"Error in Target Monitor: {e}")
+                    await asyncio.sleep(max(error_backoff, self.limiter.backoff_remaining())); error_backoff = min(error_backoff * 2, 60) # Back off on repeated errors
+        finally:
+            trigger.detach()
+            print(f"Target TP Monitor finished. Tick-to-decision: {TICK_TO_DECISION.summary()}")
@@ -0,0 +1,241 @@
+"""Execution algorithms: work large entries and closes in child orders instead of one market sweep.
+
+ExecutionPolicy.algo picks how each leg (a ParentOrder) is worked:
+  MARKET   one market order (split only at MARKET_LOT_SIZE), as before
+  TWAP     `slices` children spread evenly over duration_seconds
+  ICEBERG  children back to back, interval_seconds apart, each as large as the book allows
+  CHASE    post-only limits at the touch, re-priced every chase_seconds, children back to back like ICEBERG
+With post_only, TWAP and ICEBERG children are chasing post-only limits too. Before every child
+the order book is read and the child is cut to max_participation of the depth within
+max_slippage_bps of the touch, and of the average volume traded per interval (24h ticker).
+What is left at the deadline goes at market when finish_at_market is set. Executor.run()
+works every leg concurrently, all through the client's RateLimiter.
+
+    policy = ExecutionPolicy("TWAP", duration_seconds=120, slices=8)
+    reports = await Executor(engine, policy).run([ParentOrder("BTCUSDC", "BUY", "LONG", Decimal("0.5"))])
+"""
+import asyncio
+import time
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from typing import NamedTuple, Optional
+
+from binance.client import Client
+from binance.exceptions import BinanceAPIException, BinanceOrderException
+
+from metrics import REGISTRY
+from order_engine import OrderRequest, OrderResult, UNKNOWN_ORDER
+from quantizer import to_decimal
+
+# --- Configuration ---
+ALGOS = ("MARKET", "TWAP", "ICEBERG", "CHASE")
+EXEC_DURATION_SECONDS = 60 # TWAP horizon; ICEBERG / CHASE send the rest at market after this
+TWAP_SLICES = 6
+ICEBERG_INTERVAL_SECONDS = 1.0 # Pause between iceberg children so the book can refill
+CHASE_SECONDS = 2.0 # How long a post-only limit rests before it is re-priced
+MAX_CHASES = 20 # Re-prices per child; what it leaves goes into the next child
+MAX_PARTICIPATION = 0.25 # Child <= this share of the depth inside the band and of the volume traded per interval
+MAX_SLIPPAGE_BPS = 10 # Band from the touch that counts as usable depth
+BOOK_LIMIT = 50 # Levels read per depth check (request weight 2)
+BULK_TICKER_SYMBOLS = 40 # From this many legs one all-symbol ticker call is cheaper than one per symbol
+POST_ONLY = "GTX" # timeInForce of a post-only (maker-only) limit
+POST_ONLY_REJECTED = -5022 # GTX order that would have crossed the book
+
+
+class ExecutionPolicy(NamedTuple):
+    """How entries / closes are worked. The default is a plain market order."""
+    algo: str = "MARKET"
+    duration_seconds: float = EXEC_DURATION_SECONDS
+    slices: int = TWAP_SLICES
+    post_only: bool = False
+    max_participation: float = MAX_PARTICIPATION
+    max_slippage_bps: float = MAX_SLIPPAGE_BPS
+    chase_seconds: float = CHASE_SECONDS
+    max_chases: int = MAX_CHASES
+    interval_seconds: float = ICEBERG_INTERVAL_SECONDS
+    finish_at_market: bool = True
+
+    @property
+    def is_market(self): return self.algo == "MARKET"
+
+    def describe(self):
+        if self.is_market: return "MARKET"
+        detail = f"{self.slices} slices/" if self.algo == "TWAP" else ""
+        return f"{self.algo} {detail}{self.duration_seconds:g}s{' post-only' if self.post_only and self.algo != 'CHASE' else ''}"
+
+
+class ParentOrder(NamedTuple):
+    """One leg to work. ref_price is the arrival mark; reports measure slippage against it."""
+    symbol: str
+    side: str
+    position_side: str
+    quantity: Decimal
+    reduce_only: bool = False
+    tag: str = ""
+    ref_price: Optional[Decimal] = None
+
+
+class ExecutionReport(NamedTuple):
+    """Outcome of one worked leg: every child OrderResult, the filled quantity and its average price."""
+    request: ParentOrder
+    target: Decimal # Quantity after snapping to the step
+    filled: Decimal
+    avg_price: Optional[Decimal]
+    children: list
+    error: Optional[str] = None
+
+    @property
+    def ok(self): return self.error is None and self.filled >= self.target > 0
+
+    @property
+    def order_id(self): return next((r.order_id for r in reversed(self.children) if r.ok), None)
+
+    @property
+    def slippage_bps(self):
+        """Average fill vs the arrival mark, positive = worse; None if unknown."""
+        ref = self.request.ref_price
+        if not ref or not self.avg_price: return None
+        return float((self.avg_price - to_decimal(ref)) / to_decimal(ref) * 10000) * (1 if self.request.side == Client.SIDE_BUY else -1)
+
+    def describe(self):
+        label = f"{self.request.tag or 'ORDER'} ({self.request.symbol})"; slip = self.slippage_bps
+        fills = f"{self.filled}/{self.target} in {len(self.children)} orders" + (f", avg {self.avg_price}" if self.avg_price else "") + (f" ({slip:+.1f} bps)" if slip is not None else "")
+        return f"{label}: Success - {fills}" if self.ok else f"{label}: Failed - {self.error or 'Not fully filled'} ({fills})"
+
+
+class _Leg:
+    """Mutable progress of one ParentOrder while it is worked."""
+    def __init__(self, parent, target):
+        self.parent = parent; self.target = target; self.filled = Decimal(0); self.cost = Decimal(0); self.children = []; self.error = None
+
+    @property
+    def left(self): return self.target - self.filled
+
+    def add(self, result, order=None):
+        """Counts a child's fill (order: its final state, if it changed after the response)."""
+        order = order or result.order or {}; executed = to_decimal(order.get('executedQty') or 0)
+        if executed > 0: self.filled += executed; self.cost += executed * to_decimal(order.get('avgPrice') or order.get('price') or 0)
+
+    def report(self):
+        return ExecutionReport(self.parent, self.target, self.filled, (self.cost / self.filled).quantize(Decimal('1e-8')) if self.filled else None, self.children, self.error)
+
+
+class Executor:
+    """Works ParentOrders under one ExecutionPolicy on a connected engine.TradingEngine.
+    Any failure of a book, ticker or cancel call (API error or dropped connection) ends up on the leg, never raised out of run()."""
+    def __init__(self, engine, policy):
+        self.engine = engine; self.policy = policy
+
+    async def run(self, parents):
+        """Works every leg concurrently. Returns one ExecutionReport per parent, in order."""
+        parents = list(parents); algo = self.policy.algo
+        if algo not in ALGOS: raise ValueError(f"Unknown execution algorithm {algo!r}")
+        volumes = await self._daily_volumes({p.symbol for p in parents}) if algo in ("TWAP", "ICEBERG") else {}
+        with REGISTRY.time('stage_duration_ms', stage=f'exec.{algo.lower()}'):
+            return list(await asyncio.gather(*(self._work(p, volumes.get(p.symbol)) for p in parents)))
+
+    async def _daily_volumes(self, symbols):
+        """{symbol: 24h base volume}; missing (no participation cap) if the ticker cannot be read."""
+        client = self.engine.client
+        try:
+            if len(symbols) >= BULK_TICKER_SYMBOLS: rows = await client.futures_ticker()
+            else: rows = await asyncio.gather(*(client.futures_ticker(symbol=s) for s in symbols))
+        except Exception as e: print(f"Execution: volume check unavailable ({e}); participation is capped by depth only."); return {}
+        return {r['symbol']: to_decimal(r['volume']) for r in rows if r.get('symbol') in symbols and r.get('volume')}
+
+    # --- Scheduling ---
+    async def _work(self, parent, daily_volume):
+        quantizer = self.engine.get_quantizer(parent.symbol); policy = self.policy
+        leg = _Leg(parent, quantizer.quantity(parent.quantity) if quantizer else to_decimal(parent.quantity))
+        if quantizer is None: leg.error = "Unknown symbol."; return leg.report()
+        if policy.is_market: await self._market(leg, leg.target); return leg.report()
+        started = time.monotonic(); deadline = started + policy.duration_seconds
+        interval = policy.duration_seconds / max(1, policy.slices) if policy.algo == "TWAP" else policy.interval_seconds
+        slices = 0
+        while leg.left > 0 and not leg.error and time.monotonic() < deadline:
+            want = leg.left if policy.algo != "TWAP" else leg.target * (slices + 1) / policy.slices - leg.filled
+            if want > 0:
+                touch, caps = await self._depth_caps(parent, daily_volume, interval)
+                qty = self._child_qty(quantizer, want, leg.left, caps, touch or parent.ref_price, parent.reduce_only)
+                if policy.algo == "CHASE" or policy.post_only: await self._chase(leg, qty, quantizer, deadline if policy.algo == "CHASE" else min(deadline, time.monotonic() + interval))
+                else: await self._market(leg, qty, touch)
+            slices += 1
+            if policy.algo == "TWAP" and slices >= policy.slices: break
+            await asyncio.sleep(max(0.0, started + slices * interval - time.monotonic()) if policy.algo == "TWAP" else interval)
+        if leg.left > 0 and not leg.error and policy.finish_at_market: await self._market(leg, leg.left) # Deadline: the rest at market
+        return leg.report()
+
+    async def _depth_caps(self, parent, daily_volume, interval):
+        """(touch price, [size caps]) from the book on the side this leg takes, within max_slippage_bps, and from the volume per interval."""
+        policy = self.policy; caps = []
+        if daily_volume: caps.append(daily_volume / 86400 * to_decimal(interval) * to_decimal(policy.max_participation))
+        try: book = await self.engine.client.futures_order_book(symbol=parent.symbol, limit=BOOK_LIMIT)
+        except Exception as e: print(f"Execution ({parent.symbol}): depth check failed ({e}); child not depth-capped."); return None, caps
+        buying = parent.side == Client.SIDE_BUY; levels = [(to_decimal(p), to_decimal(q)) for p, q in book['asks' if buying else 'bids']]
+        if not levels: return None, caps
+        touch = levels[0][0]; band = touch * (1 + to_decimal(policy.max_slippage_bps) / 10000 * (1 if buying else -1))
+        caps.append(sum(q for p, q in levels if (p <= band if buying else p >= band)) * to_decimal(policy.max_participation))
+        return touch, caps
+
+    @staticmethod
+    def _child_qty(quantizer, want, left, caps, price, reduce_only):
+        """Child size: want, cut by the caps, but never below the exchange minimum and never leaving an unsendable rest."""
+        floor = quantizer.min_qty or quantizer.step or Decimal(0)
+        if quantizer.min_notional and price and not reduce_only: floor = max(floor, quantizer.quantity(quantizer.min_notional / to_decimal(price), ROUND_UP))
+        qty = quantizer.quantity(max(min([want, left] + caps), floor))
+        return left if left - qty < max(floor, quantizer.step or Decimal(0)) else min(qty, left)
+
+    # --- Child Orders ---
+    async def _market(self, leg, qty, price=None):
+        parent = leg.parent
+        requests, error = self.engine._market_requests(parent.symbol, parent.side, parent.position_side, qty, parent.tag, price or parent.ref_price, reduce_only=parent.reduce_only)
+        requests = [r._replace(ref_price=to_decimal(parent.ref_price) if parent.ref_price else None) for r in requests] # Slippage vs arrival, not vs this child's touch
+        if error: result = OrderResult(requests[0], False, error=error); self.engine._journal_local(result); leg.children.append(result); leg.error = error; return
+        REGISTRY.counter('exec_child_orders_total', len(requests), algo=self.policy.algo, type='market')
+        for result in await self.engine.dispatcher.submit(requests):
+            leg.children.append(result); leg.add(result)
+            if not result.ok: leg.error = result.error
+
+    async def _chase(self, leg, qty, quantizer, deadline):
+        """Post-only limit at the touch for qty, re-priced until filled, max_chases or the deadline. The rest stays on leg.left."""
+        parent = leg.parent; policy = self.policy; client = self.engine.client; buying = parent.side == Client.SIDE_BUY
+        goal = leg.filled + qty; chases = 0
+        while goal - leg.filled > 0 and chases <= policy.max_chases and time.monotonic() < deadline:
+            try: book = await client.futures_order_book(symbol=parent.symbol, limit=5)
+            except Exception as e: leg.error = f"Order book: {e}"; return
+            side = book['bids' if buying else 'asks']
+            if not side: leg.error = "Empty order book."; return
+            price = quantizer.price(side[0][0], ROUND_DOWN if buying else ROUND_UP) # Join the best bid (buys) / ask (sells)
+            params = {'price': price, 'timeInForce': POST_ONLY, 'newOrderRespType': 'RESULT'}
+            if parent.reduce_only: params['reduceOnly'] = True
+            request = OrderRequest(parent.symbol, parent.side, parent.position_side, Client.FUTURE_ORDER_TYPE_LIMIT, goal - leg.filled, params=params, tag=parent.tag, ref_price=to_decimal(parent.ref_price) if parent.ref_price else None)
+            error = quantizer.check(request.quantity, price, market=False, reduce_only=parent.reduce_only)
+            if error: result = OrderResult(request, False, error=error); self.engine._journal_local(result); leg.children.append(result); leg.error = error; return
+            REGISTRY.counter('exec_child_orders_total', algo=policy.algo, type='post_only'); chases += 1
+            result = (await self.engine.dispatcher.submit([request], journal=False))[0]; leg.children.append(result) # Journaled below, once, in its final state
+            if not result.ok:
+                self.engine._journal_local(result)
+                if result.error_code == POST_ONLY_REJECTED: continue # The touch moved: re-read it
+                leg.error = result.error; return
+            try: final = await self._settle(request.symbol, result.order_id, min(policy.chase_seconds, max(0.0, deadline - time.monotonic())))
+            except Exception as e: # Left unhandled, one leg's dropped connection would fail the whole basket with this order still resting
+                leg.error = f"Cancel failed: {e.message if isinstance(e, (BinanceAPIException, BinanceOrderException)) else e}"; final = await self._abandon(request.symbol, result.order_id)
+                if final is None: self.engine._journal_local(result); return
+            leg.add(result, final); self.engine._journal_local(OrderResult(request, True, order=final, sent_at=result.sent_at, latency_ms=result.latency_ms))
+            if leg.error: return
+
+    async def _settle(self, symbol, order_id, wait):
+        """Lets a resting limit work for `wait` seconds (less if the user stream reports it done), then cancels it. Returns its final state."""
+        await self.engine.wait_order(order_id, wait); client = self.engine.client
+        try: return await client.futures_cancel_order(symbol=symbol, orderId=order_id)
+        except BinanceAPIException as e:
+            if e.code != UNKNOWN_ORDER: raise
+        return await client.futures_get_order(symbol=symbol, orderId=order_id) # Filled before the cancel got there
+
+    async def _abandon(self, symbol, order_id):
+        """After a failed settle: cancels the order once more, else reads it back. Returns its final state, or None if unknown."""
+        client = self.engine.client
+        for call in (client.futures_cancel_order, client.futures_get_order):
+            try: return await call(symbol=symbol, orderId=order_id)
+            except Exception as e:
+                if getattr(e, 'code', None) != UNKNOWN_ORDER: print(f"Execution ({symbol}): order {order_id} cleanup failed: {e}") # Unknown: it filled, read it back
+        print(f"Execution ({symbol}): order {order_id} may still be resting; check open orders."); return None
@@ -0,0 +1,177 @@
+"""Append-only trade journal: one typed record per order request/response.
+
+Journal.record() only enqueues, so the order path never touches the disk.
+A background thread appends batches of fixed-width NumPy records to one
+segment per UTC day (fills-YYYYMMDD.bin), which np.fromfile reads back
+column-wise. Finished days are compacted to Parquet when pyarrow is
+installed. read_fills() loads both formats for analytics; summarize()
+reports latency, slippage against the sizing mark, and rejects.
+
+    python journal.py [DIR] [--days 30]
+"""
+import argparse
+import glob
+import os
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+try: import pyarrow as pa, pyarrow.parquet as pq # Optional: Parquet compaction of finished segments
+except ImportError: pa = pq = None
+
+# --- Configuration ---
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".binance_trader", "journal")
+FLUSH_SECONDS = 1.0 # Max time a record waits in memory before it is appended
+FLUSH_RECORDS = 512 # ...or flush as soon as this many are queued
+FILL_DTYPE = np.dtype([('ts', '<f8'), ('symbol', 'S20'), ('side', 'S4'), ('position_side', 'S5'), ('order_type', 'S24'), ('tag', 'S8'),
+                       ('ok', '?'), ('error_code', '<i4'), ('order_id', '<i8'), ('status', 'S16'), ('latency_ms', '<f4'),
+                       ('intended_qty', '<f8'), ('filled_qty', '<f8'), ('ref_price', '<f8'), ('fill_price', '<f8'), ('slippage_bps', '<f8'), ('error', 'S96')])
+
+
+class FillRecord(NamedTuple):
+    """One order as journaled. Prices/quantities are NaN when unknown; slippage is positive when the fill was worse than ref_price."""
+    ts: float
+    symbol: str
+    side: str
+    position_side: str
+    order_type: str
+    tag: str
+    ok: bool
+    error_code: int
+    order_id: int
+    status: str
+    latency_ms: float
+    intended_qty: float
+    filled_qty: float
+    ref_price: float
+    fill_price: float
+    slippage_bps: float
+    error: str
+
+    @classmethod
+    def from_result(cls, result):
+        """From an order_engine.OrderResult (request.ref_price is the mark used for sizing)."""
+        request = result.request; order = result.order or {}
+        ref = float(request.ref_price) if request.ref_price else np.nan
+        filled = float(order.get('executedQty') or 0) if result.ok else 0.0
+        fill_price = float(order.get('avgPrice') or 0) or np.nan
+        slippage = np.nan
+        if fill_price == fill_price and ref == ref and ref > 0: slippage = (fill_price - ref) / ref * 1e4 * (1 if request.side == 'BUY' else -1)
+        return cls(result.sent_at or time.time(), request.symbol, request.side, request.position_side, request.order_type, request.tag, result.ok,
+                   result.error_code or 0, result.order_id or 0, order.get('status', '') if result.ok else 'REJECTED', result.latency_ms if result.latency_ms is not None else np.nan,
+                   float(request.quantity), filled, ref, fill_price, slippage, result.error or '')
+
+
+def _encode(record):
+    return tuple(v.encode('utf-8', 'replace')[:FILL_DTYPE[i].itemsize] if isinstance(v, str) else v for i, v in enumerate(record))
+
+
+class Journal:
+    """Buffered background appender. record() is thread-safe and never blocks on I/O."""
+    def __init__(self, directory=JOURNAL_DIR, flush_seconds=FLUSH_SECONDS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory; self.flush_seconds = flush_seconds
+        self.queue = queue.SimpleQueue(); self.written = 0; self.dropped = 0; self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name="journal"); self.thread.start()
+
+    def record(self, result):
+        if self.closed: self.dropped += 1; return
+        try: self.queue.put(FillRecord.from_result(result))
+        except Exception as e: self.dropped += 1; print(f"Journal: could not record {result.request.symbol}: {e}")
+
+    def record_many(self, results):
+        for result in results: self.record(result)
+
+    def close(self, timeout=5):
+        """Flushes what is queued and stops the writer thread."""
+        if self.closed: return
+        self.closed = True; self.queue.put(None); self.thread.join(timeout)
+
+    # --- Writer Thread ---
+    def _segment_path(self, ts):
+        return os.path.join(self.directory, time.strftime("fills-%Y%m%d.bin", time.gmtime(ts)))
+
+    def _run(self):
+        compact_segments(self.directory) # Days finished while the app was closed
+        batch = []; deadline = None; current_day = time.strftime("%Y%m%d", time.gmtime())
+        while True:
+            try: item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+            except queue.Empty: item = False
+            if item: batch.append(item); deadline = deadline or time.monotonic() + self.flush_seconds
+            if batch and (item is None or item is False or len(batch) >= FLUSH_RECORDS or time.monotonic() >= deadline): self._append(batch); batch = []; deadline = None
+            day = time.strftime("%Y%m%d", time.gmtime())
+            if day != current_day: current_day = day; compact_segments(self.directory)
+            if item is None: return
+
+    def _append(self, batch):
+        by_segment = {}
+        for record in batch: by_segment.setdefault(self._segment_path(record.ts), []).append(_encode(record))
+        for path, rows in by_segment.items():
+            try:
+                with open(path, 'ab') as f: np.array(rows, dtype=FILL_DTYPE).tofile(f)
+                self.written += len(rows)
+            except OSError as e: self.dropped += len(rows); print(f"Journal write failed ({path}): {e}")
+
+
+# --- Compaction & Analytics ---
+def compact_segments(directory=JOURNAL_DIR):
+    """Converts finished day segments (.bin, not today's) to Parquet when pyarrow is available. A late record can re-create a
+    day's segment after that day was compacted (sent before midnight, answered after): its rows are merged into the Parquet file."""
+    if pq is None: return 0
+    today = time.strftime("fills-%Y%m%d.bin", time.gmtime()); compacted = 0
+    for path in sorted(glob.glob(os.path.join(directory, "fills-*.bin"))):
+        if os.path.basename(path) >= today: continue
+        try:
+            fills = np.fromfile(path, dtype=FILL_DTYPE)
+            columns = {name: (np.char.decode(fills[name], 'utf-8', 'replace') if fills.dtype[name].kind == 'S' else fills[name]) for name in FILL_DTYPE.names}
+            table = pa.table(columns); target = path[:-4] + ".parquet"
+            if os.path.exists(target): existing = pq.read_table(target); table = pa.concat_tables([existing, table.cast(existing.schema)])
+            pq.write_table(table, target + ".tmp", compression='zstd'); os.replace(target + ".tmp", target); os.remove(path); compacted += 1 # Never a half-written day
+        except Exception as e: print(f"Journal compaction failed ({path}): {e}")
+    return compacted
+
+
+def read_fills(directory=JOURNAL_DIR, since=None):
+    """All journaled records (optionally with ts >= since) as one FILL_DTYPE structured array, oldest first."""
+    parts = []
+    for path in sorted(glob.glob(os.path.join(directory, "fills-*.parquet"))):
+        if pq is None: print(f"Skipping {path}: pyarrow not installed"); continue
+        table = pq.read_table(path); part = np.empty(table.num_rows, dtype=FILL_DTYPE)
+        for name in FILL_DTYPE.names:
+            values = table.column(name).to_numpy(zero_copy_only=False)
+            part[name] = np.char.encode(values.astype(str), 'utf-8') if FILL_DTYPE[name].kind == 'S' else values
+        parts.append(part)
+    parts += [np.fromfile(path, dtype=FILL_DTYPE) for path in sorted(glob.glob(os.path.join(directory, "fills-*.bin")))]
+    fills = np.concatenate(parts) if parts else np.empty(0, dtype=FILL_DTYPE)
+    if since is not None: fills = fills[fills['ts'] >= since]
+    return fills[np.argsort(fills['ts'], kind='stable')]
+
+
+def summarize(fills):
+    """Order count, reject rate / top error codes, latency and market-fill slippage percentiles."""
+    if not len(fills): return {'orders': 0}
+    ok = fills['ok']; latency = fills['latency_ms'][~np.isnan(fills['latency_ms'])]
+    slippage = fills['slippage_bps'][ok & ~np.isnan(fills['slippage_bps'])]
+    codes, counts = np.unique(fills['error_code'][~ok], return_counts=True)
+    pct = lambda a, q: float(np.percentile(a, q)) if len(a) else None
+    return {'orders': int(len(fills)), 'ok': int(ok.sum()), 'rejected': int((~ok).sum()), 'reject_codes': {int(c): int(n) for c, n in sorted(zip(codes, counts), key=lambda x: -x[1])},
+            'latency_ms_p50': pct(latency, 50), 'latency_ms_p99': pct(latency, 99), 'slippage_bps_mean': float(slippage.mean()) if len(slippage) else None,
+            'slippage_bps_p50': pct(slippage, 50), 'slippage_bps_p99': pct(slippage, 99), 'filled_notional': float(np.nansum(fills['filled_qty'] * fills['fill_price']))}
+
+
+def open_journal(directory=JOURNAL_DIR):
+    """Journal, or None (with a warning) if the directory is unusable."""
+    try: return Journal(directory)
+    except OSError as e: print(f"Warning: Trade journal unavailable ({e})."); return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the trade journal.")
+    parser.add_argument('directory', nargs='?', default=JOURNAL_DIR)
+    parser.add_argument('--days', type=float, help="Only the last N days")
+    args = parser.parse_args()
+    fills = read_fills(args.directory, time.time() - args.days * 86400 if args.days else None)
+    for key, value in summarize(fills).items(): print(f"{key:<18} {value:.3f}" if isinstance(value, float) else f"{key:<18} {value}")
@@ -0,0 +1,174 @@
+"""Low-overhead in-process metrics with a Prometheus-style /metrics endpoint.
+
+REGISTRY holds labelled counters, callback gauges and fixed-bucket latency
+histograms. Recording is one bisect and a short locked update, so it stays
+on in production. Every exchange call is timed per endpoint by the
+RateLimiter (request latency, limiter wait, errors by Binance code); engine
+stages (basket entry, close-all, PNL fetch, monitor loop) are timed with
+REGISTRY.time(). MetricsServer serves REGISTRY.render() on METRICS_HOST
+(loopback); nothing is served unless a caller starts it.
+
+    with REGISTRY.time('stage_duration_ms', stage='close_all.orders'): ...
+    MetricsServer(9464).start()      # curl localhost:9464/metrics
+"""
+import asyncio
+import bisect
+import contextlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+METRICS_PORT = 9464 # Port of the HTTP endpoint when one is started; 0 disables it
+METRICS_HOST = "127.0.0.1" # Loopback only: the endpoint has no authentication
+REQUEST_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+LOOP_LAG_INTERVAL_SECONDS = 0.5 # How often the event-loop lag probe wakes
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds). Cheap enough to record on every tick."""
+    def __init__(self, buckets=REQUEST_BUCKETS_MS):
+        self.buckets = tuple(buckets); self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0; self.total = 0.0; self.max = 0.0; self.lock = threading.Lock()
+
+    def record(self, ms):
+        index = bisect.bisect_left(self.buckets, ms)
+        with self.lock: self.counts[index] += 1; self.count += 1; self.total += ms; self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Upper bucket bound containing the p-th percentile (max for the overflow bucket)."""
+        with self.lock:
+            if not self.count: return 0.0
+            rank = p / 100 * self.count; seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= rank: return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count: return "no samples"
+        return f"n={self.count} avg={self.total / self.count:.3f}ms p50<={self.percentile(50)}ms p99<={self.percentile(99)}ms max={self.max:.3f}ms"
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """Named, labelled metrics. Thread-safe; metric families are created on first use."""
+    def __init__(self):
+        self.lock = threading.Lock(); self.help = {}
+        self.counters = {}; self.histograms = {}; self.gauges = {} # (name, labels) -> float / LatencyHistogram / callable
+
+    def counter(self, name, amount=1, help="", **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            if help: self.help.setdefault(name, help)
+
+    def histogram(self, name, help="", buckets=REQUEST_BUCKETS_MS, **labels):
+        """The LatencyHistogram for name+labels (created once; keep a reference on hot paths)."""
+        key = (name, _labels(labels)); histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram(buckets))
+                if help: self.help.setdefault(name, help)
+        return histogram
+
+    def observe(self, name, ms, **labels):
+        self.histogram(name, **labels).record(ms)
+
+    def gauge(self, name, fn, help="", **labels):
+        """Registers fn() (evaluated at scrape time) as a gauge; re-registering replaces it."""
+        with self.lock:
+            self.gauges[(name, _labels(labels))] = fn
+            if help: self.help.setdefault(name, help)
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        """Records the enclosed block's duration (ms); works around awaits too."""
+        started = time.perf_counter()
+        try: yield
+        finally: self.observe(name, (time.perf_counter() - started) * 1000, **labels)
+
+    # --- Export ---
+    def render(self):
+        """Prometheus text exposition format."""
+        with self.lock: counters = dict(self.counters); histograms = dict(self.histograms); gauges = dict(self.gauges)
+        lines = []; seen = set()
+        def header(name, kind):
+            if name in seen: return
+            seen.add(name)
+            if name in self.help: lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), value in sorted(counters.items()): header(name, "counter"); lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), fn in sorted(gauges.items(), key=lambda item: item[0]):
+            try: value = float(fn())
+            except Exception: continue
+            header(name, "gauge"); lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), h in sorted(histograms.items(), key=lambda item: item[0]):
+            header(name, "histogram")
+            with h.lock: counts = list(h.counts); count = h.count; total = h.total
+            cumulative = 0
+            for bound, c in zip(h.buckets, counts):
+                cumulative += c; lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}"); lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self, min_count=1):
+        """Human-readable lines for the GUI stats panel."""
+        with self.lock: counters = dict(self.counters); histograms = dict(self.histograms); gauges = dict(self.gauges)
+        lines = [f"{name}{_format_labels(labels)}: {h.summary()}" for (name, labels), h in sorted(histograms.items(), key=lambda item: item[0]) if h.count >= min_count]
+        lines += [f"{name}{_format_labels(labels)}: {value:g}" for (name, labels), value in sorted(counters.items())]
+        for (name, labels), fn in sorted(gauges.items(), key=lambda item: item[0]):
+            try: lines.append(f"{name}{_format_labels(labels)}: {float(fn()):g}")
+            except Exception: pass
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves GET /metrics from a daemon thread on METRICS_HOST."""
+    def __init__(self, port=METRICS_PORT, registry=REGISTRY, host=METRICS_HOST):
+        self.port = port; self.host = host; self.registry = registry; self.httpd = None
+
+    def start(self):
+        registry = self.registry
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics': self.send_error(404); return
+                body = registry.render().encode()
+                self.send_response(200); self.send_header('Content-Type', 'text/plain; version=0.0.4'); self.send_header('Content-Length', str(len(body))); self.end_headers(); self.wfile.write(body)
+            def log_message(self, *args): pass # Keep scrapes out of the console
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler); self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True, name="metrics-http").start()
+        print(f"Metrics at http://{self.host}:{self.httpd.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        if self.httpd: self.httpd.shutdown(); self.httpd.server_close(); self.httpd = None
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """MetricsServer, or None (with a warning) if disabled or the port is taken."""
+    if not port: return None
+    try: return MetricsServer(port, host=host).start()
+    except OSError as e: print(f"Warning: Metrics endpoint not started on port {port}: {e}"); return None
+
+
+def start_loop_lag_probe(loop, interval=LOOP_LAG_INTERVAL_SECONDS, registry=REGISTRY):
+    """Measures how late the event loop runs a timer; high values mean something is blocking the loop."""
+    histogram = registry.histogram('event_loop_lag_ms', "Delay of a periodic timer on the exchange event loop")
+    def tick(expected):
+        now = time.perf_counter(); histogram.record(max(0.0, (now - expected) * 1000))
+        loop.call_later(interval, tick, now + interval)
+    loop.call_soon_threadsafe(lambda: loop.call_later(interval, tick, time.perf_counter() + interval))
+    registry.gauge('event_loop_tasks', lambda: sum(1 for task in asyncio.all_tasks(loop) if not task.done()), "Pending tasks on the exchange event loop")
@@ -0,0 +1,137 @@
+"""Batched, concurrent order dispatch for Binance USD-M futures.
+
+Orders are grouped into batchOrders requests (max 5 orders each) and the
+batches are sent concurrently on the exchange event loop, bounded by a
+semaphore. submit_groups() keeps each group (an entry and its exits) whole
+in one batchOrders request. Cancels go out in bulk, up to 10 order ids per request. Pacing is
+left to the client's rate_limiter.RateLimiter, which every call goes through.
+"""
+import asyncio
+import time
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from binance.exceptions import BinanceAPIException, BinanceOrderException
+
+# --- Configuration ---
+BATCH_SIZE = 5 # Binance batchOrders accepts at most 5 orders per request
+CANCEL_BATCH_SIZE = 10 # ...and batch cancel at most 10 order ids
+MAX_ORDER_WORKERS = 8 # Concurrent requests in flight per dispatcher
+UNKNOWN_ORDER = -2011 # Cancel of an order that already filled / was cancelled
+
+
+def _api_str(value):
+    """Exchange-ready string: plain Decimals (no exponent), lower-case booleans."""
+    if isinstance(value, bool): return str(value).lower()
+    return format(value, 'f') if isinstance(value, Decimal) else str(value)
+
+
+class OrderRequest(NamedTuple):
+    """One order to send. Quantity/prices should already be snapped by quantizer.SymbolQuantizer."""
+    symbol: str
+    side: str
+    position_side: str
+    order_type: str
+    quantity: Decimal
+    params: dict = {} # Extra fields, e.g. stopPrice, reduceOnly, timeInForce
+    tag: str = "" # Caller's label for the order, e.g. "ENTRY", "TP", "CLOSE"
+    ref_price: Optional[Decimal] = None # Mark the order was sized at; the journal measures slippage against it
+
+    def to_payload(self):
+        payload = {'symbol': self.symbol, 'side': self.side, 'positionSide': self.position_side, 'type': self.order_type, 'quantity': _api_str(self.quantity)}
+        for key, value in self.params.items(): payload[key] = _api_str(value)
+        return payload
+
+
+class OrderResult(NamedTuple):
+    """Per-order outcome returned by the dispatcher, in request order."""
+    request: OrderRequest
+    ok: bool
+    order: Optional[dict] = None
+    error_code: Optional[int] = None
+    error: Optional[str] = None
+    sent_at: Optional[float] = None # Epoch seconds the request left
+    latency_ms: Optional[float] = None # Round trip of the request that carried this order
+
+    @property
+    def order_id(self): return self.order.get('orderId') if self.order else None
+
+    def describe(self):
+        label = f"{self.request.tag or 'ORDER'} ({self.request.symbol})"
+        return f"{label}: Success - ID {self.order_id}" if self.ok else f"{label}: Failed - {self.error}"
+
+
+class OrderDispatcher:
+    """Sends OrderRequests through batchOrders, concurrently, on an AsyncClient."""
+    def __init__(self, client, max_workers=MAX_ORDER_WORKERS, journal=None):
+        self.client = client; self.journal = journal # journal.Journal gets every OrderResult (optional)
+        self.slots = asyncio.Semaphore(max_workers)
+
+    async def submit(self, requests, journal=True):
+        """Sends all requests and returns a list of OrderResult in the same order.
+        journal=False: the caller journals the results itself (e.g. once a resting order reaches its final state)."""
+        requests = list(requests)
+        return await self._submit_batches([requests[i:i + BATCH_SIZE] for i in range(0, len(requests), BATCH_SIZE)], journal)
+
+    async def _submit_batches(self, batches, journal=True):
+        results = []
+        for batch_results in await asyncio.gather(*(self._send_batch(b) for b in batches)): results.extend(batch_results)
+        if self.journal and journal: self.journal.record_many(results)
+        return results
+
+    async def submit_groups(self, groups):
+        """Sends groups of requests (an entry and its exits) in one concurrent round of batchOrders requests.
+        A group always travels whole in one request: groups are packed in order and a new batch starts when the
+        next group does not fit (a group larger than BATCH_SIZE cannot, and is split). The exchange does not
+        process a batch in order. Returns one list of OrderResult per group, in the same order."""
+        groups = [list(group) for group in groups]; batches = []
+        for group in groups:
+            if len(group) > BATCH_SIZE: batches += [group[i:i + BATCH_SIZE] for i in range(0, len(group), BATCH_SIZE)]
+            elif batches and len(batches[-1]) + len(group) <= BATCH_SIZE: batches[-1] = batches[-1] + group
+            else: batches.append(group)
+        results = iter(await self._submit_batches(batches))
+        return [[next(results) for _ in group] for group in groups]
+
+    async def cancel(self, orders):
+        """Cancels (symbol, order_id) pairs: one batch-cancel request per symbol and CANCEL_BATCH_SIZE ids, sent concurrently.
+        Returns {order_id: error message} for the ones that failed (orders already gone count as cancelled)."""
+        by_symbol = {}
+        for symbol, order_id in orders: by_symbol.setdefault(symbol, []).append(order_id)
+        chunks = [(symbol, ids[i:i + CANCEL_BATCH_SIZE]) for symbol, ids in by_symbol.items() for i in range(0, len(ids), CANCEL_BATCH_SIZE)]
+        async def cancel_chunk(chunk):
+            symbol, ids = chunk
+            try: responses = await self.client.futures_cancel_orders(symbol=symbol, orderidlist=ids)
+            except (BinanceAPIException, BinanceOrderException) as e: return {i: e.message for i in ids}
+            except Exception as e: return {i: str(e) for i in ids}
+            return {i: r.get('msg', str(r)) for i, r in zip(ids, responses) if isinstance(r, dict) and 'code' in r and r['code'] != UNKNOWN_ORDER}
+        errors = {}
+        for chunk_errors in await self.map(cancel_chunk, chunks): errors.update(chunk_errors)
+        return errors
+
+    async def map(self, fn, items):
+        """Runs coroutine function fn over items concurrently (for per-symbol calls with no batch endpoint)."""
+        async def paced(item):
+            async with self.slots: return await fn(item)
+        return list(await asyncio.gather(*(paced(item) for item in items)))
+
+    async def _send_batch(self, batch):
+        if len(batch) == 1: return [await self._send_single(batch[0])]
+        async with self.slots:
+            sent_at = time.time(); started = time.perf_counter()
+            try: responses = await self.client.futures_place_batch_order(batchOrders=[r.to_payload() for r in batch])
+            except (BinanceAPIException, BinanceOrderException) as e: return [OrderResult(r, False, error_code=e.code, error=e.message, sent_at=sent_at, latency_ms=(time.perf_counter() - started) * 1000) for r in batch]
+            except Exception as e: return [OrderResult(r, False, error=str(e), sent_at=sent_at, latency_ms=(time.perf_counter() - started) * 1000) for r in batch]
+        latency_ms = (time.perf_counter() - started) * 1000; results = []
+        if not isinstance(responses, list): responses = [{'code': responses.get('code'), 'msg': responses.get('msg', str(responses))} if isinstance(responses, dict) else {'msg': str(responses)}] * len(batch) # One error for the whole request
+        responses = responses[:len(batch)] + [{'msg': "No response for this order."}] * (len(batch) - len(responses)) # One result per request, always
+        for request, response in zip(batch, responses):
+            if isinstance(response, dict) and 'orderId' in response: results.append(OrderResult(request, True, order=response, sent_at=sent_at, latency_ms=latency_ms))
+            else: results.append(OrderResult(request, False, error_code=response.get('code') if isinstance(response, dict) else None, error=response.get('msg', str(response)) if isinstance(response, dict) else str(response), sent_at=sent_at, latency_ms=latency_ms))
+        return results
+
+    async def _send_single(self, request):
+        async with self.slots:
+            sent_at = time.time(); started = time.perf_counter(); elapsed = lambda: (time.perf_counter() - started) * 1000
+            try: order = await self.client.futures_create_order(**request.to_payload()); return OrderResult(request, True, order=order, sent_at=sent_at, latency_ms=elapsed())
+            except (BinanceAPIException, BinanceOrderException) as e: return OrderResult(request, False, error_code=e.code, error=e.message, sent_at=sent_at, latency_ms=elapsed())
+            except Exception as e: return OrderResult(request, False, error=str(e), sent_at=sent_at, latency_ms=elapsed())
@@ -0,0 +1,98 @@
+"""Columnar portfolio snapshot: one NumPy pass for PNL, notional, margin and ROE.
+
+A PortfolioSnapshot holds one row per open leg in parallel float64 arrays
+(amount, entry, mark, leverage) and derives unrealized PNL, ROE %, notional,
+margin and the portfolio totals with vectorized arithmetic. Both the REST
+path and the streaming PositionBook build the same structure, and the PNL
+display and target monitor read it. Values stay float64 inside the
+snapshot; use amount_decimal() when a quantity goes back into an order.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+
+class PortfolioSnapshot:
+    """Vectorized view of open legs. Row i is keys[i] ('SYMBOL_SIDE')."""
+    def __init__(self, keys, symbols, sides, amount, entry, mark, leverage, margin_assets=None):
+        self.keys = list(keys); self.symbols = list(symbols); self.sides = list(sides)
+        self.margin_assets = list(margin_assets) if margin_assets is not None else [None] * len(self.keys)
+        self.amount = np.asarray(amount, dtype=np.float64); self.entry = np.asarray(entry, dtype=np.float64)
+        self.mark = np.asarray(mark, dtype=np.float64); self.leverage = np.asarray(leverage, dtype=np.float64) # NaN = unknown mark / leverage
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.liq_price = np.full(len(self.keys), np.nan) # Filled by risk.RiskEngine.observe; NaN = unknown / none
+        self._compute()
+
+    def _compute(self):
+        self.has_mark = ~np.isnan(self.mark) & (self.mark > 0)
+        mark = np.where(self.has_mark, self.mark, 0.0)
+        self.pnl = np.where(self.has_mark, self.amount * (mark - self.entry), 0.0)
+        self.notional = np.abs(self.amount) * mark
+        has_leverage = ~np.isnan(self.leverage) & (self.leverage > 0)
+        self.margin = np.divide(self.notional, self.leverage, out=np.zeros_like(self.notional), where=has_leverage)
+        self.roe = np.divide(self.pnl * 100, self.margin, out=np.zeros_like(self.pnl), where=self.margin > 0)
+        self.total_pnl = float(self.pnl.sum()); self.total_notional = float(self.notional.sum()); self.total_margin = float(self.margin.sum())
+        self.net_notional = float((np.sign(self.amount) * self.notional).sum())
+
+    # --- Builders ---
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [], [], [])
+
+    @classmethod
+    def from_position_info(cls, position_info, marks, leverage=None):
+        """From futures_position_information() rows plus {symbol: mark} and {symbol: leverage}; flat legs are skipped."""
+        leverage = leverage or {}; rows = []
+        for pos in position_info:
+            amount = float(pos.get('positionAmt', 0) or 0)
+            if amount == 0: continue
+            symbol = pos.get('symbol'); side = pos.get('positionSide', 'BOTH')
+            lev = pos.get('leverage') if pos.get('leverage') not in (None, '', 'N/A') else leverage.get(symbol)
+            rows.append((f"{symbol}_{side}", symbol, side, amount, float(pos.get('entryPrice', 0) or 0), float(marks.get(symbol, 'nan')), float(lev) if lev else np.nan, pos.get('marginAsset')))
+        return cls.from_rows(rows)
+
+    @classmethod
+    def from_legs(cls, legs, marks, leverage=None):
+        """From PositionBook legs ({key: {'symbol', 'side', 'amount', 'entry_price', 'margin_asset'}})."""
+        leverage = leverage or {}
+        rows = [(key, leg['symbol'], leg['side'], float(leg['amount']), float(leg['entry_price']), float(marks.get(leg['symbol'], 'nan')),
+                 float(leverage[leg['symbol']]) if leverage.get(leg['symbol']) else np.nan, leg.get('margin_asset')) for key, leg in legs.items()]
+        return cls.from_rows(rows)
+
+    @classmethod
+    def from_rows(cls, rows):
+        if not rows: return cls.empty()
+        keys, symbols, sides, amount, entry, mark, lev, assets = zip(*rows)
+        return cls(keys, symbols, sides, amount, entry, mark, lev, assets)
+
+    @classmethod
+    def concat(cls, snapshots):
+        """One snapshot from {prefix: snapshot}; keys and symbols become 'prefix/...' so the same leg on different accounts stays apart."""
+        parts = [(prefix, s) for prefix, s in snapshots.items() if len(s)]
+        if not parts: return cls.empty()
+        snapshot = cls([f"{p}/{k}" for p, s in parts for k in s.keys], [f"{p}/{sym}" for p, s in parts for sym in s.symbols], [side for _, s in parts for side in s.sides],
+                       np.concatenate([s.amount for _, s in parts]), np.concatenate([s.entry for _, s in parts]), np.concatenate([s.mark for _, s in parts]),
+                       np.concatenate([s.leverage for _, s in parts]), [a for _, s in parts for a in s.margin_assets])
+        snapshot.liq_price = np.concatenate([s.liq_price for _, s in parts])
+        return snapshot
+
+    # --- Access ---
+    def __len__(self): return len(self.keys)
+
+    def row(self, i):
+        """Plain dict for one leg (display / logging)."""
+        if not self.has_mark[i]: return {'symbol': self.symbols[i], 'side': self.sides[i], 'error': 'No mark price yet'}
+        lev = self.leverage[i]
+        return {'symbol': self.symbols[i], 'side': self.sides[i], 'amount': float(self.amount[i]), 'entry_price': float(self.entry[i]), 'mark_price': float(self.mark[i]),
+                'pnl': float(self.pnl[i]), 'pnl_percent': float(self.roe[i]), 'notional': float(self.notional[i]), 'margin': float(self.margin[i]),
+                'leverage': str(int(lev)) if not np.isnan(lev) else 'N/A', 'margin_asset': self.margin_assets[i], 'liq_price': float(self.liq_price[i])}
+
+    def items(self):
+        for i, key in enumerate(self.keys): yield key, self.row(i)
+
+    def amount_decimal(self, i):
+        """Exact Decimal quantity for the order boundary (repr of a float64 round-trips the exchange's string)."""
+        return Decimal(repr(float(self.amount[i])))
+
+    def total_pnl_decimal(self):
+        return Decimal(repr(self.total_pnl))
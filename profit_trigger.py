@@ -0,0 +1,88 @@
+"""Event-driven target-profit / trailing-profit / stop-loss trigger.
+
+ProfitTrigger subscribes to a streaming PositionBook and keeps a running
+total PNL: each mark tick adjusts the total by the changed legs' deltas
+instead of re-summing the whole book. Every decision is timed from frame
+receipt, and the timings are kept in metrics.REGISTRY histograms. With net
+set, thresholds apply to total + offset, where the monitor keeps offset at the
+session's realized PNL, commissions and funding (accounting.IncomeLedger).
+"""
+import threading
+import time
+from decimal import Decimal
+
+from metrics import REGISTRY
+
+# --- Configuration ---
+NET_OF_FEES = True # Thresholds apply to unrealized PNL + session realized PNL, fees and funding
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+TICK_TO_DECISION = REGISTRY.histogram('tick_to_decision_ms', "Mark frame receipt to target threshold evaluated", LATENCY_BUCKETS_MS) # Every tick
+TICK_TO_FIRE = REGISTRY.histogram('tick_to_fire_ms', "Mark frame receipt to close-all signalled", LATENCY_BUCKETS_MS) # Once per trigger
+
+
+class ProfitTrigger:
+    """Watches total PNL and fires once when a threshold is crossed.
+    target: fire when total >= target (or, with trailing, when it falls `trailing` below its peak after reaching target).
+    stop_loss: fire when total <= -stop_loss. Thresholds are Decimals in the quote asset; None disables.
+    net: add `offset` (session income, set by the monitor) to the unrealized total before comparing.
+    on_fire(reason) is called once, from whichever thread made the decision."""
+    def __init__(self, target, trailing=None, stop_loss=None, on_fire=None, net=NET_OF_FEES):
+        self.target = target; self.on_fire = on_fire; self.trailing = trailing or None; self.stop_loss = stop_loss or None
+        self.net = net; self.offset = Decimal(0) # Realized PNL + fees + funding of the session; only read when net
+        self.book = None; self.legs = {}; self.leg_pnl = {}; self.by_symbol = {}; self.total = Decimal(0)
+        self.peak = None; self.reason = None; self.fired = threading.Event()
+
+    # --- Decision ---
+    def evaluate(self, total):
+        """Checks thresholds against a total (unrealized) PNL, plus offset when net. Returns the fire reason or None."""
+        if self.fired.is_set(): return self.reason
+        reason = None
+        if self.net: total += self.offset
+        if self.stop_loss is not None and total <= -self.stop_loss: reason = f"STOP LOSS <= -{self.stop_loss:.4f}"
+        elif total >= self.target or self.peak is not None:
+            if self.trailing is None: reason = f"TARGET >= {self.target:.4f}"
+            else:
+                self.peak = total if self.peak is None else max(self.peak, total)
+                if total <= self.peak - self.trailing: reason = f"TRAILING {self.trailing:.4f} off peak {self.peak:.4f}"
+        if reason:
+            self.reason = reason; self.fired.set()
+            if self.on_fire: self.on_fire(reason)
+        return reason
+
+    # --- Streaming (incremental) mode ---
+    def attach(self, book):
+        self.book = book; self._rebuild(); book.subscribe(self.on_book_event); self._decide(None)
+
+    def detach(self):
+        if self.book and self.on_book_event in self.book.listeners: self.book.listeners.remove(self.on_book_event)
+        self.book = None
+
+    @property
+    def leg_count(self): return len(self.legs)
+
+    def _rebuild(self):
+        with self.book.lock: legs = {k: (v['symbol'], v['amount'], v['entry_price']) for k, v in self.book.positions.items()}; marks = dict(self.book.marks)
+        self.legs = legs; self.by_symbol = {}; self.leg_pnl = {}
+        for key, (symbol, amount, entry) in legs.items():
+            self.by_symbol.setdefault(symbol, []).append(key)
+            self.leg_pnl[key] = amount * (marks[symbol] - entry) if symbol in marks else Decimal(0)
+        self.total = sum(self.leg_pnl.values(), Decimal(0))
+
+    def on_book_event(self, kind, payload):
+        if self.fired.is_set(): return
+        if kind == 'mark':
+            for symbol, mark in payload.items():
+                for key in self.by_symbol.get(symbol, ()):
+                    _, amount, entry = self.legs[key]; new_pnl = amount * (mark - entry)
+                    self.total += new_pnl - self.leg_pnl[key]; self.leg_pnl[key] = new_pnl
+        elif kind in ('seed', 'account'): self._rebuild() # Position set changed: O(legs), but rare
+        else: return
+        self._decide(getattr(self.book, 'last_frame_at', None))
+
+    def _decide(self, frame_at):
+        reason = self.evaluate(self.total)
+        if frame_at is None: return
+        elapsed_ms = (time.perf_counter() - frame_at) * 1000
+        TICK_TO_DECISION.record(elapsed_ms)
+        if reason: TICK_TO_FIRE.record(elapsed_ms)
@@ -0,0 +1,76 @@
+"""Per-symbol order quantizer built once from the exchange filters.
+
+SymbolQuantizer snaps quantities to LOT_SIZE stepSize and prices to
+PRICE_FILTER tickSize (any quantum, e.g. 0.5 or 5, not only powers of ten)
+with the Decimal quanta precomputed, checks minQty / MIN_NOTIONAL /
+MARKET_LOT_SIZE before an order is sent, splits oversized market orders
+into compliant chunks and formats values as exchange-ready strings.
+"""
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP, ROUND_UP
+
+ONE = Decimal(1)
+
+
+def to_decimal(value):
+    """Decimal from a Decimal, str or float (floats go through str so 0.1 stays 0.1)."""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def format_decimal(value):
+    """Plain (never exponent) string, as the API expects."""
+    return format(value, 'f')
+
+
+class SymbolQuantizer:
+    """Precomputed step/tick quanta and limits for one symbol. Missing filters disable the matching rule."""
+    __slots__ = ('symbol', 'step', 'tick', 'min_qty', 'max_qty', 'market_min_qty', 'market_max_qty', 'min_notional')
+
+    def __init__(self, symbol, step=None, tick=None, min_qty=None, max_qty=None, market_min_qty=None, market_max_qty=None, min_notional=None):
+        self.symbol = symbol; self.step = step if step else None; self.tick = tick if tick else None
+        self.min_qty = min_qty; self.max_qty = max_qty; self.market_min_qty = market_min_qty or min_qty
+        self.market_max_qty = market_max_qty or max_qty; self.min_notional = min_notional if min_notional else None
+
+    @classmethod
+    def from_filters(cls, symbol, filters):
+        """From exchangeInfo's filter list (or a {filterType: filter} dict)."""
+        if not isinstance(filters, dict): filters = {f['filterType']: f for f in filters}
+        lot = filters.get('LOT_SIZE', {}); market_lot = filters.get('MARKET_LOT_SIZE', {}); price = filters.get('PRICE_FILTER', {})
+        notional = filters.get('MIN_NOTIONAL', {}).get('notional')
+        dec = lambda f, k: Decimal(f[k]) if f.get(k) not in (None, '') else None
+        return cls(symbol, dec(lot, 'stepSize'), dec(price, 'tickSize'), dec(lot, 'minQty'), dec(lot, 'maxQty'), dec(market_lot, 'minQty'), dec(market_lot, 'maxQty'),
+                   Decimal(notional) if notional not in (None, '') else None)
+
+    # --- Rounding ---
+    def quantity(self, qty, rounding=ROUND_DOWN):
+        """Quantity snapped to a whole number of steps (down by default, so margin is never exceeded)."""
+        qty = to_decimal(qty)
+        if not self.step: return qty
+        return ((qty / self.step).to_integral_value(rounding) * self.step).quantize(self.step)
+
+    def price(self, price, rounding=ROUND_HALF_UP):
+        """Price snapped to a whole number of ticks."""
+        price = to_decimal(price)
+        if not self.tick: return price
+        return ((price / self.tick).to_integral_value(rounding) * self.tick).quantize(self.tick)
+
+    # --- Validation ---
+    def check(self, qty, price=None, market=True, reduce_only=False):
+        """Reason the exchange would reject this (already snapped) order, or None.
+        price is the expected fill/mark for the MIN_NOTIONAL check; reduce-only orders are exempt from it."""
+        if qty <= 0: return "Qty=0."
+        min_qty = self.market_min_qty if market else self.min_qty
+        max_qty = self.market_max_qty if market else self.max_qty
+        if min_qty and qty < min_qty: return f"Qty {format_decimal(qty)} below minimum {format_decimal(min_qty)}."
+        if max_qty and qty > max_qty: return f"Qty {format_decimal(qty)} above maximum {format_decimal(max_qty)}."
+        if self.min_notional and price and not reduce_only and qty * to_decimal(price) < self.min_notional:
+            return f"Notional {qty * to_decimal(price):.2f} below minimum {format_decimal(self.min_notional)}."
+        return None
+
+    def split_market(self, qty):
+        """Splits a snapped quantity into near-equal chunks no larger than MARKET_LOT_SIZE maxQty (one chunk if it fits)."""
+        limit = self.market_max_qty
+        if not limit or qty <= limit: return [qty]
+        n = int((qty / limit).to_integral_value(ROUND_UP)); step = self.step or ONE
+        base = self.quantity(qty / n); extra = int((qty - base * n) / step) # Leftover steps go one each to the first chunks
+        return [base + step if i < extra else base for i in range(n)]
+
@@ -0,0 +1,182 @@
+"""Client-side request-weight and order-count limiter shared by every exchange call.
+
+LimitedClient wraps an AsyncClient (or SimClient) so each futures_* call
+first takes its request weight (and order count, for order endpoints) from a
+RateLimiter. The limiter paces with token buckets, re-syncs them to the
+X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* response headers, and backs off
+exponentially after a 429 (or 418 ban) before retrying. Closes and cancels
+run at PRIORITY_CRITICAL: informational polls yield to them and keep part of
+the budget in reserve so a target-triggered close never waits behind a poll.
+
+    with request_priority(PRIORITY_CRITICAL): await client.futures_cancel_all_open_orders(symbol=s)
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+
+from binance.exceptions import BinanceAPIException
+
+from metrics import REGISTRY
+
+# --- Configuration ---
+REQUEST_WEIGHT_PER_MINUTE = 2400 # Futures IP weight limit
+ORDERS_PER_10_SECONDS = 300 # Futures account order-count limits
+ORDERS_PER_MINUTE = 1200
+BURST_SECONDS = 10 # Weight bucket capacity = this many seconds of the per-minute average
+BACKOFF_MIN_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+BAN_BACKOFF_SECONDS = 120.0 # Floor after a 418 (IP auto-ban) when no Retry-After is given
+RATE_LIMIT_RETRIES = 3 # Re-sends after a 429/418 before the error reaches the caller
+PRIORITY_CRITICAL, PRIORITY_TRADE, PRIORITY_INFO = 0, 1, 2 # Closes/cancels, entries/leverage, polls
+PRIORITY_NAMES = {PRIORITY_CRITICAL: 'critical', PRIORITY_TRADE: 'trade', PRIORITY_INFO: 'info'}
+RESERVE_FRACTION = {PRIORITY_CRITICAL: 0.0, PRIORITY_TRADE: 0.1, PRIORITY_INFO: 0.25} # Share of each bucket a priority may not spend
+REQUEST_WEIGHTS = {'futures_exchange_info': 1, 'futures_mark_price': 10, 'futures_position_information': 5, 'futures_account_balance': 5,
+                   'futures_get_position_mode': 30, 'futures_symbol_config': 5, 'futures_change_leverage': 1, 'futures_create_order': 1,
+                   'futures_place_batch_order': 5, 'futures_cancel_order': 1, 'futures_cancel_orders': 1, 'futures_cancel_all_open_orders': 1, 'futures_get_open_orders': 40,
+                   'futures_income_history': 30, 'futures_open_interest': 1, 'futures_ticker': 40, 'futures_order_book': 10} # Approximate Binance weights; others cost 1
+ORDER_ENDPOINTS = ('futures_create_order', 'futures_place_batch_order')
+
+_priority = contextvars.ContextVar('request_priority', default=None)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Runs the enclosed calls (and tasks they spawn) at `priority`."""
+    token = _priority.set(priority)
+    try: yield
+    finally: _priority.reset(token)
+
+
+def request_cost(name, kwargs):
+    """(weight, order count) of one client call."""
+    if name == 'futures_mark_price' and kwargs.get('symbol'): return 1, 0
+    if name == 'futures_get_open_orders' and kwargs.get('symbol'): return 1, 0
+    if name == 'futures_ticker' and kwargs.get('symbol'): return 1, 0
+    if name == 'futures_order_book': limit = int(kwargs.get('limit') or 500); return (2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20), 0
+    weight = REQUEST_WEIGHTS.get(name, 1)
+    if name == 'futures_place_batch_order': return weight, len(kwargs.get('batchOrders') or ())
+    return weight, 1 if name in ORDER_ENDPOINTS else 0
+
+
+def default_priority(name, kwargs):
+    if 'cancel' in name: return PRIORITY_CRITICAL
+    if name in ORDER_ENDPOINTS:
+        orders = kwargs.get('batchOrders') or [kwargs]
+        return PRIORITY_CRITICAL if all(str(o.get('reduceOnly', '')).lower() == 'true' for o in orders) else PRIORITY_TRADE
+    return PRIORITY_TRADE if name == 'futures_change_leverage' else PRIORITY_INFO
+
+
+class TokenBucket:
+    """Token bucket refilled continuously; the RateLimiter takes tokens once a request may go."""
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity); self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity); self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second); self.updated_at = now
+
+    def wait_for(self, tokens, reserve=0.0):
+        """Seconds until `tokens` can be taken while leaving `reserve` of capacity untouched (0 = now)."""
+        self._refill(); floor = self.capacity * reserve; tokens = min(float(tokens), self.capacity - floor)
+        return max(0.0, (tokens + floor - self.tokens) / self.refill_per_second)
+
+
+class RateLimiter:
+    """Weight and order-count budgets for one API key / IP. Use from a single event loop.
+    weight_bucket: share another limiter's weight bucket (request weight is per IP, order counts per account)."""
+    def __init__(self, weight_per_minute=REQUEST_WEIGHT_PER_MINUTE, orders_per_10s=ORDERS_PER_10_SECONDS, orders_per_minute=ORDERS_PER_MINUTE, weight_bucket=None):
+        self.weight_per_minute = weight_per_minute; self.orders_per_10s = orders_per_10s; self.orders_per_minute = orders_per_minute
+        burst = weight_per_minute / 60 * BURST_SECONDS; order_burst = orders_per_10s / 2
+        # Burst + one window of refill stays within each sliding-window limit
+        self.weight = weight_bucket or TokenBucket(burst, (weight_per_minute - burst) / 60)
+        self.orders = TokenBucket(order_burst, min((orders_per_10s - order_burst) / 10, (orders_per_minute - order_burst) / 60))
+        self.waiting = {PRIORITY_CRITICAL: 0, PRIORITY_TRADE: 0, PRIORITY_INFO: 0}
+        self.backoff_until = 0.0; self.backoff_seconds = 0.0
+        self.used_weight = None; self.order_count_10s = None; self.order_count_1m = None # Last values reported by the exchange
+        self.throttled_seconds = 0.0; self.rate_limited = 0 # Wait time summed over callers; 429/418 responses seen
+
+    def _delay(self, weight, orders, priority):
+        now = time.monotonic()
+        if now < self.backoff_until: return self.backoff_until - now
+        if any(self.waiting[p] for p in self.waiting if p < priority): return 0.01 # Yield to more urgent callers
+        reserve = RESERVE_FRACTION[priority]
+        return max(self.weight.wait_for(weight, reserve), self.orders.wait_for(orders, reserve) if orders else 0.0)
+
+    async def acquire(self, weight=1, orders=0, priority=PRIORITY_INFO):
+        """Waits until the request fits the budgets (and any back-off has passed), then spends them."""
+        self.waiting[priority] += 1
+        try:
+            while True:
+                delay = self._delay(weight, orders, priority)
+                if delay <= 0: self.weight.tokens -= weight; self.orders.tokens -= orders; return
+                self.throttled_seconds += min(delay, 1.0); await asyncio.sleep(min(delay, 1.0)) # Re-check: priorities and headers change meanwhile
+        finally: self.waiting[priority] -= 1
+
+    def observe(self, headers):
+        """Syncs the buckets down to the usage the exchange reports (other processes may share the IP/key)."""
+        if not headers: return
+        used = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('x-mbx-used-weight-1m')
+        if used is not None:
+            self.used_weight = int(used); self.weight._refill()
+            self.weight.tokens = min(self.weight.tokens, float(self.weight_per_minute - self.used_weight))
+        count_10s = headers.get('X-MBX-ORDER-COUNT-10S') or headers.get('x-mbx-order-count-10s')
+        count_1m = headers.get('X-MBX-ORDER-COUNT-1M') or headers.get('x-mbx-order-count-1m')
+        if count_1m is not None: self.order_count_1m = int(count_1m)
+        if count_10s is not None:
+            self.order_count_10s = int(count_10s); self.orders._refill()
+            self.orders.tokens = min(self.orders.tokens, float(self.orders_per_10s - self.order_count_10s))
+
+    def on_rate_limited(self, status, retry_after=None):
+        """Exponential back-off after a 429/418; Retry-After (seconds) wins when longer."""
+        self.rate_limited += 1
+        self.backoff_seconds = min(BACKOFF_MAX_SECONDS, max(BACKOFF_MIN_SECONDS, self.backoff_seconds * 2))
+        wait = max(self.backoff_seconds, float(retry_after or 0), BAN_BACKOFF_SECONDS if status == 418 else 0.0)
+        self.backoff_until = max(self.backoff_until, time.monotonic() + wait); self.weight.tokens = min(self.weight.tokens, 0.0)
+        print(f"Rate limited (HTTP {status}): backing off {wait:.1f}s")
+
+    def backoff_remaining(self):
+        return max(0.0, self.backoff_until - time.monotonic())
+
+    async def call(self, name, fn, args=(), kwargs=None):
+        """Runs client coroutine fn under the budgets, retrying after 429/418 responses."""
+        kwargs = kwargs or {}; weight, orders = request_cost(name, kwargs)
+        priority = _priority.get(); priority = default_priority(name, kwargs) if priority is None else priority
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            waited = time.perf_counter(); await self.acquire(weight, orders, priority); started = time.perf_counter()
+            REGISTRY.observe('binance_limiter_wait_ms', (started - waited) * 1000, priority=PRIORITY_NAMES[priority])
+            try: result = await fn(*args, **kwargs)
+            except BinanceAPIException as e:
+                REGISTRY.observe('binance_request_duration_ms', (time.perf_counter() - started) * 1000, endpoint=name); REGISTRY.counter('binance_request_errors_total', endpoint=name, code=e.code)
+                headers = getattr(e.response, 'headers', None); self.observe(headers)
+                if e.status_code not in (429, 418) or attempt == RATE_LIMIT_RETRIES: raise
+                self.on_rate_limited(e.status_code, headers.get('Retry-After') if headers else None); continue
+            except Exception: REGISTRY.counter('binance_request_errors_total', endpoint=name, code='transport'); raise
+            REGISTRY.observe('binance_request_duration_ms', (time.perf_counter() - started) * 1000, endpoint=name)
+            self.backoff_seconds = 0.0
+            return result
+
+    def register_metrics(self, registry=REGISTRY, **labels):
+        """Exports the budgets as gauges (labels tell limiters apart, e.g. account=...)."""
+        registry.gauge('binance_used_weight_1m', lambda: self.used_weight or 0, "Request weight used in the last minute, as reported by the exchange", **labels)
+        registry.gauge('binance_weight_tokens', lambda: self.weight.tokens, "Request weight the limiter can spend now", **labels)
+        registry.gauge('binance_backoff_seconds', self.backoff_remaining, "Remaining 429/418 back-off", **labels)
+        registry.gauge('binance_rate_limited_total', lambda: self.rate_limited, "429/418 responses received", **labels)
+        for priority, name in PRIORITY_NAMES.items(): registry.gauge('binance_limiter_waiting', lambda p=priority: self.waiting[p], "Calls queued in the limiter", priority=name, **labels)
+
+    def summary(self):
+        return f"used weight {self.used_weight if self.used_weight is not None else '?'}/{self.weight_per_minute}, throttled {self.throttled_seconds:.1f}s, 429s {self.rate_limited}"
+
+
+class LimitedClient:
+    """Proxy that sends every futures_* coroutine of client through limiter; other attributes pass through."""
+    def __init__(self, client, limiter=None):
+        self.client = client; self.limiter = limiter or RateLimiter()
+        if hasattr(client, 'header_listener'): client.header_listener = self.limiter.observe # Headers of successful responses
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not name.startswith('futures_') or not asyncio.iscoroutinefunction(attr): return attr
+        async def limited(*args, **kwargs): return await self.limiter.call(name, attr, args, kwargs)
+        return limited
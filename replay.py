@@ -0,0 +1,325 @@
+"""Historical replay of the basket + target-TP workflow on recorded prices.
+
+import_prices() converts kline or mark-price files (CSV or Parquet, read in
+chunks) into one float64 matrix on a fixed time grid, rows = timestamps and
+columns = symbols, forward-filled and saved as a .npy with a .json sidecar.
+Replayer memory-maps that matrix and walks it in growing row blocks. A
+basket is sized the way TradingEngine.open_basket sizes it (amount * leverage
+/ mark, snapped by the symbol's quantizer, legs the exchange would reject
+dropped). Per-coin TP / SL exits fire when the price crosses them. Basket PNL
+is one vectorized pass over all legs per block, and the exit uses
+ProfitTrigger's rules (stop loss first, target, trailing off the peak).
+Like the live monitor, the trigger sees the open legs' unrealized PNL, and in
+net mode (the default, as NET_OF_FEES) also the realized PNL of legs that
+already exited, minus the fees paid so far.
+Fills pay a taker fee and optional slippage.
+
+    python replay.py import prices.npy data/BTCUSDC-1s-2024-*.csv data/ETHUSDC-1s-2024-*.csv
+    python replay.py run prices.npy basket.csv --amount 100 --target 5 --trail 1 --repeat
+
+Kline files are named SYMBOL-... (Binance public data layout; header optional) and use the close
+of each bar, stamped with its open time. Mark-price files carry a header with a symbol, a time
+(ts / time / timestamp, ms) and a price column (mark_price / markPrice / price).
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+try: import pyarrow as pa, pyarrow.csv as pa_csv, pyarrow.parquet as pq # Optional: fast CSV and Parquet input
+except ImportError: pa = pa_csv = pq = None
+
+from engine import TradingEngine, LEVERAGE, QUOTE_ASSET
+from profit_trigger import NET_OF_FEES
+from state_store import open_store
+
+# --- Configuration ---
+TAKER_FEE_RATE = 0.0004 # Market orders (entries, TP/SL, closes) pay taker; check your fee tier
+CHUNK_ROWS = 1 << 20 # Rows per block when importing files
+MIN_BLOCK_ROWS = 256 # First block read after an entry; doubles up to MAX_BLOCK_ROWS while the round lasts
+MAX_BLOCK_ROWS = 1 << 16
+KLINE_COLUMNS = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore')
+TIME_COLUMNS = ('ts', 'time', 'timestamp', 'open_time', 'E')
+PRICE_COLUMNS = ('mark_price', 'markPrice', 'price', 'p', 'close')
+
+
+# --- Import ---
+def _is_number(text):
+    try: float(text); return True
+    except ValueError: return False
+
+
+def _read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yields {column: numpy array} blocks of a CSV or Parquet file without loading all of it. Headerless CSVs are klines."""
+    if path.endswith('.parquet'):
+        if pq is None: raise RuntimeError(f"{path}: pyarrow is needed for Parquet input")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows): yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(batch.schema.names)}
+        return
+    with open(path, newline='') as f: fields = next(csv.reader([f.readline()]), [])
+    header = bool(fields) and not _is_number(fields[0]); names = [n.strip() for n in fields] if header else [KLINE_COLUMNS[i] if i < len(KLINE_COLUMNS) else f"c{i}" for i in range(len(fields))]
+    if pa_csv is not None:
+        options = pa_csv.ReadOptions(column_names=names, skip_rows=1 if header else 0, block_size=chunk_rows * 64)
+        for batch in pa_csv.open_csv(path, read_options=options): yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(names)}
+        return
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        if header: next(reader)
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if not rows: return
+            yield {name: np.array(column) for name, column in zip(names, zip(*rows))}
+
+
+def _columns(chunk, path):
+    """(time ms int64, price float64, symbols or None) from a chunk, whatever the layout calls them."""
+    time_name = next((n for n in TIME_COLUMNS if n in chunk), None); price_name = next((n for n in PRICE_COLUMNS if n in chunk), None)
+    if not time_name or not price_name: raise ValueError(f"{path}: need a time column {TIME_COLUMNS} and a price column {PRICE_COLUMNS}, got {list(chunk)}")
+    ts = chunk[time_name].astype(np.float64).astype(np.int64); ts = np.where(ts > 10 ** 14, ts // 1000, ts) # Microsecond klines -> ms
+    symbols = chunk['symbol'].astype(str) if 'symbol' in chunk else None
+    return ts, chunk[price_name].astype(np.float64), symbols
+
+
+def _file_symbol(path):
+    return os.path.basename(path).replace('_', '-').replace('.', '-').split('-')[0].upper()
+
+
+def import_prices(paths, out_path, step_ms=None, chunk_rows=CHUNK_ROWS):
+    """Builds the replay matrix from kline / mark-price files. step_ms defaults to the smallest time step seen.
+    Returns the ReplayData opened on the result."""
+    first = {}; last = {}; steps = []
+    for path in paths: # Pass 1: time range, symbols and grid step
+        for chunk in _read_chunks(path, chunk_rows):
+            ts, _, symbols = _columns(chunk, path)
+            if not len(ts): continue
+            for symbol in (np.unique(symbols) if symbols is not None else [_file_symbol(path)]):
+                own = ts[symbols == symbol] if symbols is not None else ts
+                first[symbol] = min(first.get(symbol, own.min()), own.min()); last[symbol] = max(last.get(symbol, own.max()), own.max())
+                diffs = np.diff(np.unique(own)); diffs = diffs[diffs > 0]
+                if len(diffs): steps.append(int(diffs.min()))
+    if not first: raise ValueError("No price rows found.")
+    step_ms = int(step_ms or min(steps or [1000])); symbols = sorted(first); column = {s: i for i, s in enumerate(symbols)}
+    start = min(first.values()) // step_ms * step_ms; rows = int((max(last.values()) - start) // step_ms) + 1
+    prices = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float64, shape=(rows, len(symbols)))
+    for i in range(0, rows, chunk_rows): prices[i:i + chunk_rows] = np.nan
+    for path in paths: # Pass 2: place every price on the grid (the last one wins inside a step)
+        for chunk in _read_chunks(path, chunk_rows):
+            ts, price, chunk_symbols = _columns(chunk, path)
+            cols = np.array([column[s] for s in chunk_symbols]) if chunk_symbols is not None else column[_file_symbol(path)]
+            prices[(ts - start) // step_ms, cols] = price
+    carry = np.full(len(symbols), np.nan)
+    for i in range(0, rows, chunk_rows): # Pass 3: forward-fill gaps, block by block
+        block = np.vstack([carry, prices[i:i + chunk_rows]]); index = np.where(np.isnan(block), 0, np.arange(len(block))[:, None])
+        np.maximum.accumulate(index, axis=0, out=index); block = block[index, np.arange(len(symbols))]
+        prices[i:i + chunk_rows] = block[1:]; carry = block[-1]
+    prices.flush(); del prices
+    with open(out_path + '.json', 'w') as f: json.dump({'symbols': symbols, 'start_ms': int(start), 'step_ms': step_ms}, f)
+    print(f"Imported {len(symbols)} symbols x {rows} steps of {step_ms} ms into {out_path}")
+    return ReplayData.open(out_path)
+
+
+class ReplayData:
+    """Memory-mapped price matrix (rows = timestamps on a fixed grid, columns = symbols) written by import_prices()."""
+    def __init__(self, prices, symbols, start_ms, step_ms):
+        self.prices = prices; self.symbols = list(symbols); self.start_ms = start_ms; self.step_ms = step_ms
+        self.column = {s: i for i, s in enumerate(self.symbols)}
+
+    @classmethod
+    def open(cls, path):
+        with open(path + '.json') as f: meta = json.load(f)
+        return cls(np.load(path, mmap_mode='r'), meta['symbols'], meta['start_ms'], meta['step_ms'])
+
+    def __len__(self): return len(self.prices)
+
+    def timestamp(self, row): return (self.start_ms + row * self.step_ms) / 1000
+
+    def row_at(self, epoch_seconds):
+        return min(len(self) - 1, max(0, int((epoch_seconds * 1000 - self.start_ms) // self.step_ms)))
+
+
+# --- Replay ---
+class ReplayConfig(NamedTuple):
+    """The basket action and its target monitor, as entered in the GUI. amount is the total margin, split equally."""
+    amount: Decimal
+    target: Decimal
+    trailing: Optional[Decimal] = None
+    stop_loss: Optional[Decimal] = None
+    sl_percent: Optional[Decimal] = None
+    leverage: int = LEVERAGE
+    fee_rate: float = TAKER_FEE_RATE
+    slippage_bps: float = 0.0 # Adverse, on every fill
+    exit_lag_steps: int = 0 # Steps between the trigger and the close-all fill
+    repeat: bool = False # Re-open the basket after every exit until the data ends
+    cooldown_steps: int = 1 # Steps between an exit and the next entry
+    tp_percent: Optional[float] = None # Legs without a TP price get one this many percent beyond the entry mark (None / 0 = none)
+    net: bool = NET_OF_FEES # Thresholds apply to unrealized + realized PNL of exited legs - fees (False: unrealized only)
+
+
+class ReplayRound(NamedTuple):
+    """One basket from entry to exit. PNL in the quote asset; net = gross - fees."""
+    entry_ts: float
+    exit_ts: float
+    reason: str
+    legs: int
+    gross_pnl: float
+    fees: float
+    net_pnl: float
+    leg_exits: int # Legs closed by their own TP / SL before the basket exit
+
+
+def trigger_index(total, target, trailing=None, stop_loss=None, peak=None):
+    """ProfitTrigger.evaluate over a PNL series. Returns (index or None, reason, peak carried to the next block)."""
+    n = len(total); stops = np.flatnonzero(total <= -stop_loss) if stop_loss else ()
+    first_stop = stops[0] if len(stops) else n
+    armed = 0 if peak is not None else next(iter(np.flatnonzero(total >= target)), n)
+    fire = n; reason = None
+    if armed < n and trailing is None: fire = armed; reason = f"TARGET >= {target:.4f}"
+    elif armed < n:
+        peaks = np.maximum.accumulate(total[armed:]) if peak is None else np.maximum.accumulate(np.maximum(total[armed:], peak))
+        hits = np.flatnonzero(total[armed:] <= peaks - trailing)
+        if len(hits): fire = armed + hits[0]; reason = f"TRAILING {trailing:.4f} off peak {peaks[hits[0]]:.4f}"
+        peak = float(peaks[min(fire - armed, len(peaks) - 1)])
+    if first_stop <= fire and first_stop < n: return int(first_stop), f"STOP LOSS <= -{stop_loss:.4f}", peak
+    return (int(fire), reason, peak) if fire < n else (None, None, peak)
+
+
+class Replayer:
+    """Replays one basket (cli.load_basket selections) on ReplayData under a ReplayConfig."""
+    def __init__(self, data, basket, config, exchange_info=None, verbose=True):
+        self.data = data; self.basket = [b for b in basket if b['symbol'] in data.column]; self.config = config
+        self.engine = TradingEngine(leverage=config.leverage, use_streaming=False) # Sizing and quantizer rules only; never connected
+        if exchange_info: self.engine.update_symbol_cache(exchange_info)
+        if not verbose: return
+        missing = [b['symbol'] for b in basket if b['symbol'] not in data.column]
+        if missing: print(f"Replay: no price data for {', '.join(missing)}; skipped.")
+        unknown = [b['symbol'] for b in self.basket if not self.engine.get_quantizer(b['symbol'])]
+        if unknown: print(f"Replay: no exchange rules for {', '.join(unknown)}; their quantities are not snapped.")
+
+    def _open(self, row):
+        """Sizes the basket at row's prices like TradingEngine.open_basket. Returns (columns, signed qty, entry, tp, sl, fees) arrays."""
+        config = self.config; marks = self.data.prices[row]; amount = config.amount / len(self.basket); slip = config.slippage_bps / 10000
+        legs = []
+        for leg in self.basket:
+            symbol = leg['symbol']; side = leg['position_side']; mark = marks[self.data.column[symbol]]
+            if not mark > 0: continue # Not listed yet at this row
+            mark = Decimal(repr(float(mark))); quantity = self.engine.entry_quantity(amount, mark)
+            if self.engine.get_quantizer(symbol):
+                requests, error = self.engine._market_requests(symbol, "BUY" if side == "LONG" else "SELL", side, quantity, "ENTRY", mark)
+                if error: continue # The exchange would reject this leg
+                quantity = sum(r.quantity for r in requests)
+            sl = leg.get('sl_price') or (self.engine.stop_price(mark, side, config.sl_percent) if config.sl_percent else None)
+            tp = leg.get('tp_price') or (self.engine.stop_price(mark, side, -Decimal(repr(config.tp_percent))) if config.tp_percent else None) # A stop on the winning side
+            quantizer = self.engine.get_quantizer(symbol); snap = (lambda p: float(quantizer.price(p))) if quantizer else float
+            sign = 1.0 if side == "LONG" else -1.0; fill = float(mark) * (1 + sign * slip)
+            legs.append((self.data.column[symbol], sign * float(quantity), fill, snap(tp) if tp else np.nan, snap(sl) if sl else np.nan))
+        if not legs: return None
+        columns, qty, entry, tp, sl = (np.array(v) for v in zip(*legs))
+        return columns.astype(np.intp), qty, entry, tp, sl, float((np.abs(qty) * entry).sum() * config.fee_rate)
+
+    def run_round(self, row):
+        """One basket opened at row. Returns (ReplayRound, exit row) or None if nothing could be opened / the data ends first."""
+        opened = self._open(row)
+        if opened is None: return None
+        columns, qty, entry, tp, sl, fees = opened; config = self.config; data = self.data; slip = config.slippage_bps / 10000
+        thresholds = [float(config.target)] + [float(v) if v else None for v in (config.trailing, config.stop_loss)] # 0 disables, as in ProfitTrigger
+        long = qty > 0; is_open = np.ones(len(qty), dtype=bool); realized = np.zeros(len(qty)); peak = None
+        start = row + 1; size = MIN_BLOCK_ROWS
+        while start < len(data):
+            block = data.prices[start:start + size, columns]; n = len(block); steps = np.arange(n)[:, None]
+            tp_hit = np.where(long, block >= tp, block <= tp); sl_hit = np.where(long, block <= sl, block >= sl) # NaN levels never hit
+            hit = (tp_hit | sl_hit) & is_open; exit_at = np.where(hit.any(axis=0), hit.argmax(axis=0), n) # Leg's own exit, per leg
+            alive = is_open & (steps <= exit_at) # A leg still counts on the tick that fills its exit, as in the live book
+            total = np.where(alive, (block - entry) * qty, 0.0).sum(axis=1)
+            exit_price = block[np.minimum(exit_at, n - 1), np.arange(len(qty))] * (1 - np.sign(qty) * slip) # Fill of each leg's own exit, if in this block
+            if config.net: # From the tick after a leg's exit fills, its PNL and fee count as realized
+                locked = np.where(is_open & (exit_at < n), (exit_price - entry) * qty - np.abs(qty) * exit_price * config.fee_rate, 0.0)
+                total = total + (realized.sum() - fees) + np.where(steps > exit_at, locked, 0.0).sum(axis=1)
+            last_exit = exit_at[is_open].max() if is_open.any() else -1
+            fire, reason, peak = trigger_index(total[:last_exit + 1] if last_exit < n else total, *thresholds, peak)
+            leg_exits = is_open & (exit_at < n) & (exit_at <= (fire if fire is not None else n))
+            for j in np.flatnonzero(leg_exits): # Filled by the exchange at the crossing tick
+                price = exit_price[j]; realized[j] = (price - entry[j]) * qty[j]; fees += abs(qty[j]) * price * config.fee_rate
+            is_open &= ~leg_exits
+            if fire is None and is_open.any(): start += n; size = min(size * 2, MAX_BLOCK_ROWS); continue
+            if fire is None: exit_row = start + int(last_exit); reason = "ALL LEGS EXITED" # Monitor stops: no open positions
+            else:
+                exit_row = min(len(data) - 1, start + fire + config.exit_lag_steps)
+                prices = data.prices[exit_row, columns[is_open]] * (1 - np.sign(qty[is_open]) * slip)
+                realized[is_open] = (prices - entry[is_open]) * qty[is_open]; fees += float((np.abs(qty[is_open]) * prices).sum() * config.fee_rate)
+            gross = float(realized.sum())
+            return ReplayRound(data.timestamp(row), data.timestamp(exit_row), reason, len(qty), gross, fees, gross - fees, int((~is_open).sum()) if fire is not None else len(qty)), exit_row
+        return None
+
+    def run(self, start_row=0, end_row=None):
+        """Rounds from start_row: one, or back to back while config.repeat is set. A round still open at the data end is dropped."""
+        rounds = []; row = start_row; end_row = len(self.data) if end_row is None else end_row
+        while row < end_row - 1:
+            outcome = self.run_round(row)
+            if outcome is None: break
+            rounds.append(outcome[0]); row = outcome[1] + self.config.cooldown_steps
+            if not self.config.repeat: break
+        return rounds
+
+
+def summarize(rounds):
+    """Round count, win rate, PNL totals, average hold and the worst peak-to-trough drop of cumulative net PNL."""
+    if not rounds: return {'rounds': 0}
+    net = np.array([r.net_pnl for r in rounds]); equity = np.cumsum(net); held = np.array([r.exit_ts - r.entry_ts for r in rounds])
+    reasons = {}
+    for r in rounds: key = r.reason.split(' ')[0]; reasons[key] = reasons.get(key, 0) + 1
+    return {'rounds': len(rounds), 'win_rate': float((net > 0).mean()), 'net_pnl': float(net.sum()), 'gross_pnl': float(sum(r.gross_pnl for r in rounds)), 'fees': float(sum(r.fees for r in rounds)),
+            'mean_net': float(net.mean()), 'max_drawdown': float((np.maximum.accumulate(np.maximum(equity, 0)) - equity).max()), 'mean_hold_s': float(held.mean()), 'exits': reasons}
+
+
+def load_exchange_info(path=None):
+    """exchangeInfo from a JSON file, else the copy cached in the state store (any age), else None."""
+    if path:
+        with open(path) as f: return json.load(f)
+    store = open_store()
+    if not store: return None
+    exchange_info, _ = store.load_exchange_info("mainnet", max_age=float('inf')); store.close()
+    return exchange_info
+
+
+if __name__ == "__main__":
+    from cli import load_basket, decimal_arg
+    parser = argparse.ArgumentParser(description="Replay the basket + target-TP workflow on recorded prices.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="Convert kline / mark-price CSV or Parquet files into a replay matrix")
+    importer.add_argument('out', help="Output .npy (a .json sidecar is written next to it)")
+    importer.add_argument('files', nargs='+')
+    importer.add_argument('--step-ms', type=int, help="Grid step (default: smallest step in the data)")
+    runner = commands.add_parser('run', help="Replay a basket")
+    runner.add_argument('data', help=".npy written by import")
+    runner.add_argument('basket', help="Basket file, as for cli.py trade")
+    runner.add_argument('--amount', type=decimal_arg, required=True, help=f"Total margin in {QUOTE_ASSET}, split equally")
+    runner.add_argument('--target', type=decimal_arg, required=True)
+    runner.add_argument('--trail', type=decimal_arg)
+    runner.add_argument('--stop-loss', type=decimal_arg)
+    runner.add_argument('--sl-percent', type=decimal_arg)
+    runner.add_argument('--tp-percent', type=float, help="TP this many percent beyond the entry for legs without a TP price")
+    runner.add_argument('--leverage', type=int, default=LEVERAGE)
+    runner.add_argument('--fee', type=float, default=TAKER_FEE_RATE, help="Taker fee rate per fill")
+    runner.add_argument('--slippage-bps', type=float, default=0.0)
+    runner.add_argument('--exit-lag', type=int, default=0, metavar='STEPS', help="Steps from trigger to close fill")
+    runner.add_argument('--repeat', action='store_true', help="Re-open the basket after every exit")
+    runner.add_argument('--gross', action='store_true', help="Compare unrealized PNL only (default: plus realized PNL of exited legs, minus fees)")
+    runner.add_argument('--start', type=float, help="Epoch seconds of the first entry")
+    runner.add_argument('--exchange-info', help="exchangeInfo JSON for quantity rules (default: the cached copy)")
+    runner.add_argument('--rounds', action='store_true', help="Print every round")
+    args = parser.parse_args()
+    if args.command == 'import': import_prices(args.files, args.out, args.step_ms)
+    else:
+        data = ReplayData.open(args.data)
+        config = ReplayConfig(args.amount, args.target, args.trail, args.stop_loss, args.sl_percent, args.leverage, args.fee, args.slippage_bps, args.exit_lag, args.repeat, tp_percent=args.tp_percent, net=not args.gross)
+        replayer = Replayer(data, load_basket(args.basket), config, load_exchange_info(args.exchange_info))
+        started = time.perf_counter(); rounds = replayer.run(data.row_at(args.start) if args.start else 0)
+        if args.rounds:
+            for r in rounds: print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(r.entry_ts))} -> {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(r.exit_ts))}  {r.reason:<36} net {r.net_pnl:>10.4f}  fees {r.fees:.4f}")
+        for key, value in summarize(rounds).items(): print(f"{key:<14} {value:.4f}" if isinstance(value, float) else f"{key:<14} {value}")
+        print(f"Replayed {len(data)} steps x {len(data.symbols)} symbols in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,174 @@
+"""Local pre-trade risk: margin usage, liquidation prices and exposure without REST calls.
+
+RiskEngine caches the cross wallet balance (account balance at connect, then the
+user-data stream's ACCOUNT_UPDATE balances), every symbol's leverage brackets
+(maintenance margin tiers from futures_leverage_bracket at connect) as padded
+NumPy tables, and the open legs of the latest PortfolioSnapshot. check_basket()
+merges the proposed entries into those legs and, in one vectorized pass, works out
+initial margin (notional / leverage), maintenance margin (notional * mmr - cum of the
+leg's tier), each leg's cross-margin liquidation price and the gross / net exposure.
+A basket that does not fit MAX_MARGIN_USAGE or the bracket notional caps is scaled
+down (or rejected, with RISK_ACTION = "reject"). It is also rejected when a leg would
+end up within MIN_LIQ_DISTANCE_PERCENT of liquidation.
+
+Liquidation prices hold every other leg at its mark and use the tier of the leg's
+current notional. A tier change on the way there moves the true level slightly.
+"""
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from portfolio import PortfolioSnapshot
+
+# --- Configuration ---
+QUOTE_ASSET = "USDC"
+MAX_MARGIN_USAGE = 0.8 # Post-trade initial margin may use at most this share of equity
+MIN_LIQ_DISTANCE_PERCENT = 2.0 # Reject when a traded leg's projected liquidation is closer than this to its mark (0 = off)
+RISK_ACTION = "scale" # "scale" an oversized basket down to fit, or "reject" it
+MIN_SCALE = 0.05 # Scaling below this rejects instead
+TAKER_FEE_RATE = 0.0004 # Entry fees reserved out of equity
+DEFAULT_MAINT_MARGIN_RATIO = 0.01 # For symbols with no bracket data (warned)
+
+
+class BracketTable:
+    """Maintenance tiers of every symbol as padded [symbols x tiers] arrays. Padding tiers start at +inf;
+    the last row is the default for unknown symbols."""
+    def __init__(self, rows=()):
+        tiers = {}
+        for row in rows:
+            brackets = sorted(row.get('brackets') or (), key=lambda b: float(b['notionalFloor']))
+            if brackets: tiers[row['symbol']] = [(float(b['notionalFloor']), float(b['notionalCap']), float(b['maintMarginRatio']), float(b['cum']), float(b['initialLeverage'])) for b in brackets]
+        width = max((len(t) for t in tiers.values()), default=1); default = [(0.0, np.inf, DEFAULT_MAINT_MARGIN_RATIO, 0.0, np.inf)]
+        padded = [t + [(np.inf, np.inf, t[-1][2], t[-1][3], 0.0)] * (width - len(t)) for t in list(tiers.values()) + [default + [(np.inf, np.inf, DEFAULT_MAINT_MARGIN_RATIO, 0.0, 0.0)] * (width - 1)]]
+        self.floor, self.cap, self.mmr, self.cum, self.max_leverage = (np.array(column, dtype=np.float64) for column in np.moveaxis(np.array(padded, dtype=np.float64), 2, 0))
+        self.index = {symbol: i for i, symbol in enumerate(tiers)}
+
+    def __contains__(self, symbol): return symbol in self.index
+
+    def lookup(self, symbols, notional, leverage):
+        """(mmr, cum, max notional at `leverage`) per leg, from the tier each notional falls in."""
+        rows = np.array([self.index.get(s, -1) for s in symbols], dtype=np.intp)
+        tier = np.maximum((self.floor[rows] <= notional[:, None]).sum(axis=1) - 1, 0)
+        allowed = np.where(self.max_leverage[rows] >= leverage[:, None], self.cap[rows], 0.0).max(axis=1)
+        return self.mmr[rows, tier], self.cum[rows, tier], allowed
+
+
+def margin_state(wallet, amount, entry, mark, leverage, mmr, cum):
+    """Per-leg initial margin, maintenance margin and cross-margin liquidation price (NaN = none) plus the account
+    equity, for signed amounts. With every other leg held at mark, leg i liquidates where
+    wallet + uPNL_others + amount_i * (P - entry_i) = MM_others + |amount_i| * P * mmr_i - cum_i."""
+    qty = np.abs(amount); side = np.sign(amount); notional = qty * mark
+    upnl = amount * (mark - entry); im = notional / leverage; mm = notional * mmr - cum
+    equity = wallet + upnl.sum(); others = equity - upnl - (mm.sum() - mm)
+    with np.errstate(divide='ignore', invalid='ignore'): liq = (others + cum - side * qty * entry) / (qty * (mmr - side))
+    return im, mm, np.where(liq > 0, liq, np.nan), equity
+
+
+class RiskCheck(NamedTuple):
+    """Outcome of check_basket. scale < 1: quantities must be multiplied by it.
+    liquidation: {'SYMBOL_SIDE': price} of the traded legs, closest to its mark first."""
+    ok: bool
+    scale: float
+    reasons: list
+    margin_usage: float # Initial margin / equity, after the trade
+    maint_ratio: float # Maintenance margin / equity, after the trade
+    equity: float
+    gross_notional: float
+    net_notional: float
+    liquidation: dict
+    elapsed_us: float
+
+    def describe(self):
+        if not self.ok: return f"Risk: REJECTED - {'; '.join(self.reasons)}"
+        closest = ", ".join(f"{k} {p:.6g}" for k, p in list(self.liquidation.items())[:3]) + (", ..." if len(self.liquidation) > 3 else "")
+        lines = [f"Risk: margin {self.margin_usage:.0%} of equity {self.equity:.2f} {QUOTE_ASSET}, maint {self.maint_ratio:.1%}, gross {self.gross_notional:.2f} (x{self.gross_notional / self.equity if self.equity > 0 else 0:.1f}), net {self.net_notional:+.2f}"
+                 + (f"; liq {closest}" if closest else "")]
+        if self.scale < 1: lines.append(f"Risk: basket scaled to {self.scale:.1%} to fit")
+        return "\n".join(lines + [f"Risk: {r}" for r in self.reasons])
+
+
+class RiskEngine:
+    """Cached account state for pre-trade checks. Feed it balances, brackets and snapshots; the checks never call out."""
+    def __init__(self, max_margin_usage=MAX_MARGIN_USAGE, min_liq_distance_percent=MIN_LIQ_DISTANCE_PERCENT, action=RISK_ACTION):
+        self.max_margin_usage = max_margin_usage; self.min_liq_distance_percent = min_liq_distance_percent; self.action = action
+        self.wallet = None # Cross wallet balance of QUOTE_ASSET (None = unknown: checks pass with a warning)
+        self.brackets = BracketTable(); self.snapshot = PortfolioSnapshot.empty()
+
+    def clear(self):
+        self.wallet = None; self.brackets = BracketTable(); self.snapshot = PortfolioSnapshot.empty()
+
+    # --- Cached State ---
+    def update_balances(self, rows):
+        """From futures_account_balance() rows."""
+        for row in rows:
+            if row.get('asset') == QUOTE_ASSET: self.wallet = float(row.get('crossWalletBalance') or row.get('balance') or 0)
+
+    def update_brackets(self, rows):
+        """From futures_leverage_bracket() (every symbol)."""
+        self.brackets = BracketTable(rows)
+
+    def on_account_event(self, kind, payload):
+        """PositionBook listener: ACCOUNT_UPDATE carries the new wallet balances."""
+        if kind != 'account': return
+        for balance in payload.get('a', {}).get('B', []):
+            if balance.get('a') == QUOTE_ASSET: self.wallet = float(balance.get('cw') or balance.get('wb') or 0)
+
+    def observe(self, snapshot):
+        """Keeps snapshot as the current open legs and fills its liq_price column."""
+        self.snapshot = snapshot
+        if not len(snapshot) or self.wallet is None: return snapshot
+        mark = np.where(snapshot.has_mark, snapshot.mark, snapshot.entry); leverage = np.nan_to_num(snapshot.leverage, nan=1.0)
+        mmr, cum, _ = self.brackets.lookup(snapshot.symbols, np.abs(snapshot.amount) * mark, leverage)
+        snapshot.liq_price = margin_state(self.wallet, snapshot.amount, snapshot.entry, mark, leverage, mmr, cum)[2]
+        return snapshot
+
+    # --- Pre-trade Check ---
+    def check_basket(self, trades, leverage):
+        """trades: dicts with symbol, position_side, quantity and mark (as built by TradingEngine.open_basket); leverage applies
+        to the traded symbols. Returns a RiskCheck for the whole basket merged into the cached legs."""
+        started = time.perf_counter(); book = self.snapshot; reasons = []
+        if self.wallet is None: return RiskCheck(True, 1.0, ["wallet balance unknown; not checked"], 0.0, 0.0, 0.0, 0.0, 0.0, {}, 0.0)
+        keys = list(book.keys); symbols = list(book.symbols); rows = dict(book.index)
+        amount = list(book.amount); entry = list(book.entry); mark = list(np.where(book.has_mark, book.mark, book.entry)); lev = list(np.nan_to_num(book.leverage, nan=float(leverage)))
+        added = [0.0] * len(keys)
+        for t in trades:
+            key = f"{t['symbol']}_{t['position_side']}"; qty = float(t['quantity']) * (1 if t['position_side'] == "LONG" else -1)
+            if key not in rows: rows[key] = len(keys); keys.append(key); symbols.append(t['symbol']); amount.append(0.0); entry.append(float(t['mark'])); mark.append(0.0); lev.append(float(leverage)); added.append(0.0)
+            i = rows[key]; mark[i] = float(t['mark']); added[i] += qty
+        traded_symbols = {t['symbol'] for t in trades}; lev = np.where([s in traded_symbols for s in symbols], float(leverage), lev) # Leverage is per symbol: both hedge legs change
+        traded = np.zeros(len(keys), dtype=bool); traded[[rows[f"{t['symbol']}_{t['position_side']}"] for t in trades]] = True
+        amount, entry, mark, lev, added = (np.array(v, dtype=np.float64) for v in (amount, entry, mark, lev, added))
+        # The new quantity enters at mark, moving the average entry
+        fees = float((np.abs(added) * mark).sum() * TAKER_FEE_RATE)
+
+        def state(scale):
+            total = amount + scale * added
+            new_entry = np.divide(amount * entry + scale * added * mark, total, out=mark.copy(), where=total != 0)
+            mmr, cum, allowed = self.brackets.lookup(symbols, np.abs(total) * mark, lev)
+            return total, allowed, margin_state(self.wallet - scale * fees, total, new_entry, mark, lev, mmr, cum)
+
+        total, allowed, (im, mm, liq, equity) = state(1.0); scale = 1.0
+        if equity <= 0: reasons.append(f"equity {equity:.2f} {QUOTE_ASSET} after fees")
+        fixed_im = float((np.abs(amount) * mark / lev).sum()); new_im = float((np.abs(added) * mark / lev).sum()); base_equity = equity + fees # Both linear in scale
+        if new_im > 0 and im.sum() > self.max_margin_usage * equity:
+            scale = min(scale, (self.max_margin_usage * base_equity - fixed_im) / (new_im + self.max_margin_usage * fees))
+            reasons.append(f"margin usage {im.sum() / equity:.0%} > {self.max_margin_usage:.0%}" if equity > 0 else "no free margin")
+        over = traded & (np.abs(total) * mark > allowed)
+        if over.any():
+            caps = (allowed - np.abs(amount) * mark) / np.maximum(np.abs(added) * mark, 1e-12)
+            scale = min(scale, float(caps[over].min())); reasons.append(f"over the {'/'.join(sorted({f'{int(l)}x' for l in lev[over]}))} bracket cap: {', '.join(np.array(keys)[over])}")
+        if scale < 1:
+            if self.action == "reject" or scale < MIN_SCALE: return self._result(False, 0.0, reasons, im, mm, liq, equity, total, mark, keys, traded, started)
+            total, allowed, (im, mm, liq, equity) = state(scale)
+        if self.min_liq_distance_percent:
+            distance = np.abs(mark - liq) / mark * 100; close = traded & (distance < self.min_liq_distance_percent) # NaN (no liquidation) never counts
+            if close.any(): return self._result(False, scale, reasons + [f"liquidation within {self.min_liq_distance_percent:g}% of mark: {', '.join(f'{k} {p:.6g}' for k, p in zip(np.array(keys)[close], liq[close]))}"], im, mm, liq, equity, total, mark, keys, traded, started)
+        return self._result(equity > 0, scale, reasons if scale < 1 or equity <= 0 else [], im, mm, liq, equity, total, mark, keys, traded, started)
+
+    def _result(self, ok, scale, reasons, im, mm, liq, equity, total, mark, keys, traded, started):
+        unknown = sorted({k.rsplit('_', 1)[0] for k, t in zip(keys, traded) if t} - set(self.brackets.index))
+        if unknown and len(self.brackets.index): reasons = reasons + [f"no leverage brackets for {', '.join(unknown)}; maintenance assumed {DEFAULT_MAINT_MARGIN_RATIO:.1%}"]
+        signed = total * mark; legs = np.flatnonzero(traded & ~np.isnan(liq))
+        return RiskCheck(bool(ok), float(scale), reasons, float(im.sum() / equity) if equity > 0 else float('inf'), float(mm.sum() / equity) if equity > 0 else float('inf'), float(equity),
+                         float(np.abs(signed).sum()), float(signed.sum()), {keys[i]: float(liq[i]) for i in legs[np.argsort(np.abs(mark[legs] - liq[legs]) / mark[legs])]}, (time.perf_counter() - started) * 1e6)
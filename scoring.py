@@ -0,0 +1,153 @@
+"""Market-data basket selection: rank every perpetual and pick the basket in one pass.
+
+MarketSnapshot holds the 24h ticker and premium index (mark, last funding rate)
+of every symbol as NumPy columns, from two bulk requests (weight ~50), and is
+cached for SNAPSHOT_TTL_SECONDS. Open interest has no bulk endpoint. It is fetched
+per symbol (weight 1 each) only when the open_interest factor has a weight, and
+it is cached too. Factors are plain functions snapshot -> column. rank_scores()
+rank-normalizes every column to [-1, 1], so weights compare across units, and
+sums them with one matrix product. Directional factors (momentum, funding) flip
+sign for shorts. Quality factors (liquidity, volatility, open interest) count
+the same for both sides.
+
+    scorer = BasketScorer(engine)
+    basket = await scorer.select(10, sides="BOTH")   # [{'symbol', 'position_side', 'tp_price', 'sl_price', 'score'}]
+"""
+import asyncio
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from quantizer import to_decimal
+
+# --- Configuration ---
+SNAPSHOT_TTL_SECONDS = 60 # Repeated selections within this reuse the last snapshot
+BASKET_SIZE = 10
+SIDES = ("LONG", "SHORT", "BOTH")
+MIN_QUOTE_VOLUME = 1000000 # 24h quote volume below this is never picked
+TP_RANGE_FRACTION = 0.5 # Default TP distance from the mark, as a share of the 24h high-low range
+MIN_TP_PERCENT = 0.2 # TP at least this many percent from the mark
+DEFAULT_WEIGHTS = {'momentum': 1.0, 'funding': 0.5, 'liquidity': 0.5, 'volatility': -0.25} # open_interest: per-symbol requests, off by default
+
+
+class MarketSnapshot(NamedTuple):
+    """Per-symbol market data, one NumPy column per field, rows in `symbols` order. open_interest is in quote (NaN = not fetched)."""
+    symbols: list
+    mark: np.ndarray
+    last: np.ndarray
+    change: np.ndarray # 24h price change, fraction
+    high: np.ndarray
+    low: np.ndarray
+    quote_volume: np.ndarray
+    funding: np.ndarray # Last funding rate
+    open_interest: np.ndarray
+    fetched_at: float
+
+    @classmethod
+    def from_rows(cls, symbols, tickers, premiums, open_interest=None):
+        """From futures_ticker() and futures_mark_price() rows (any order, extra symbols ignored)."""
+        tickers = {t['symbol']: t for t in tickers}; premiums = {p['symbol']: p for p in premiums}; open_interest = open_interest or {}
+        symbols = [s for s in symbols if s in tickers and s in premiums]
+        column = lambda rows, key: np.array([float(rows[s].get(key) or 'nan') for s in symbols], dtype=np.float64)
+        mark = column(premiums, 'markPrice')
+        return cls(symbols, mark, column(tickers, 'lastPrice'), column(tickers, 'priceChangePercent') / 100, column(tickers, 'highPrice'), column(tickers, 'lowPrice'),
+                   column(tickers, 'quoteVolume'), column(premiums, 'lastFundingRate'), np.array([open_interest.get(s, np.nan) for s in symbols], dtype=np.float64) * mark, time.monotonic())
+
+
+# --- Factors ---
+def momentum(s): return s.change
+def funding(s): return -s.funding # Longs collect funding when the rate is negative
+def liquidity(s): return np.log1p(s.quote_volume)
+def volatility(s): return (s.high - s.low) / s.last
+def open_interest(s): return np.log1p(s.open_interest)
+
+FACTORS = {'momentum': (momentum, True), 'funding': (funding, True), 'liquidity': (liquidity, False), 'volatility': (volatility, False),
+           'open_interest': (open_interest, False)} # name -> (fn(snapshot) -> column, directional)
+
+
+def rank_normalize(matrix):
+    """Each column's values ranked (ties share their average rank) and scaled to [-1, 1]; NaN -> 0."""
+    scaled = np.zeros_like(matrix)
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j]; valid = ~np.isnan(column); ordered = np.sort(column[valid])
+        if len(ordered) < 2 or ordered[0] == ordered[-1]: continue
+        ranks = (np.searchsorted(ordered, column[valid], 'left') + np.searchsorted(ordered, column[valid], 'right') - 1) / 2
+        scaled[valid, j] = 2 * ranks / (len(ordered) - 1) - 1
+    return scaled
+
+
+def rank_scores(snapshot, weights=None):
+    """(long score, short score) arrays over the snapshot rows: weighted rank-normalized factors, directional ones negated for shorts."""
+    weights = {name: w for name, w in (DEFAULT_WEIGHTS if weights is None else weights).items() if w}
+    unknown = set(weights) - set(FACTORS)
+    if unknown: raise ValueError(f"Unknown factors: {', '.join(sorted(unknown))} (have {', '.join(FACTORS)})")
+    names = list(weights)
+    if not names: zero = np.zeros(len(snapshot.symbols)); return zero, zero
+    with np.errstate(divide='ignore', invalid='ignore'): matrix = np.column_stack([FACTORS[n][0](snapshot) for n in names])
+    matrix[~np.isfinite(matrix)] = np.nan
+    weighted = rank_normalize(matrix) * np.array([weights[n] for n in names]); directional = np.array([FACTORS[n][1] for n in names])
+    direction = weighted[:, directional].sum(axis=1); quality = weighted[:, ~directional].sum(axis=1)
+    return quality + direction, quality - direction
+
+
+class BasketScorer:
+    """Scores the engine's tradable symbols from cached market snapshots. Coroutines run on the engine's loop."""
+    def __init__(self, engine, ttl=SNAPSHOT_TTL_SECONDS):
+        self.engine = engine; self.ttl = ttl
+        self.snapshot = None; self.open_interest = {}; self.open_interest_at = 0.0 # symbol -> base qty
+        self.requested = set(); self.open_interest_requested = set() # Symbols each cache was fetched for, including ones the exchange had no data for
+        self.lock = None
+
+    def invalidate(self):
+        self.snapshot = None; self.open_interest = {}; self.open_interest_at = 0.0; self.requested = set(); self.open_interest_requested = set()
+
+    async def get_snapshot(self, symbols=None, with_open_interest=False):
+        """Bulk ticker + premium index (and open interest if asked), refetched only when older than the TTL."""
+        if not self.engine.connected: raise RuntimeError("Not connected.")
+        self.lock = self.lock or asyncio.Lock(); symbols = list(symbols or self.engine.tradable_symbols())
+        async with self.lock:
+            now = time.monotonic(); snapshot = self.snapshot
+            fresh = snapshot is not None and now - snapshot.fetched_at < self.ttl and set(symbols) <= self.requested # A symbol missing from the data stays missing until the TTL
+            oi_fresh = not with_open_interest or (now - self.open_interest_at < self.ttl and set(symbols) <= self.open_interest_requested)
+            if fresh and oi_fresh: return snapshot
+            client = self.engine.client; tickers = premiums = None
+            if not fresh: tickers, premiums = await asyncio.gather(client.futures_ticker(), client.futures_mark_price())
+            if not oi_fresh:
+                rows = await asyncio.gather(*(client.futures_open_interest(symbol=s) for s in symbols), return_exceptions=True)
+                self.open_interest = {s: float(r['openInterest']) for s, r in zip(symbols, rows) if not isinstance(r, Exception)}; self.open_interest_at = now; self.open_interest_requested = set(symbols)
+                failed = sum(isinstance(r, Exception) for r in rows)
+                if failed: print(f"Open interest unavailable for {failed} symbols; they score neutral on it.")
+            if fresh: snapshot = snapshot._replace(open_interest=np.array([self.open_interest.get(s, np.nan) for s in snapshot.symbols]) * snapshot.mark)
+            else: snapshot = MarketSnapshot.from_rows(symbols, tickers, premiums, self.open_interest if with_open_interest else None); self.requested = set(symbols)
+            self.snapshot = snapshot
+            return snapshot
+
+    def tp_price(self, symbol, side, mark, range_fraction, tp_percent=None):
+        """TP tp_percent (else TP_RANGE_FRACTION of the 24h range, at least MIN_TP_PERCENT) beyond the mark, snapped to the tick."""
+        distance = tp_percent / 100 if tp_percent is not None else max(MIN_TP_PERCENT / 100, TP_RANGE_FRACTION * range_fraction)
+        price = to_decimal(mark) * (1 + to_decimal(distance) if side == "LONG" else 1 - to_decimal(distance))
+        quantizer = self.engine.get_quantizer(symbol)
+        return quantizer.price(price) if quantizer else price
+
+    async def select(self, count=BASKET_SIZE, sides="LONG", weights=None, tp_percent=None, symbols=None, min_quote_volume=MIN_QUOTE_VOLUME):
+        """Top `count` symbols as GUI-style selections, best first. sides: LONG, SHORT or BOTH (half each, longs
+        only where the directional factors point up and shorts where they point down). tp_percent: fixed TP distance
+        (None = scaled by the 24h range; 0 = no TP)."""
+        if sides not in SIDES: raise ValueError(f"sides must be one of {', '.join(SIDES)}")
+        weights = DEFAULT_WEIGHTS if weights is None else weights
+        snapshot = await self.get_snapshot(symbols, with_open_interest=bool(weights.get('open_interest')))
+        long_score, short_score = rank_scores(snapshot, weights)
+        eligible = (snapshot.quote_volume >= min_quote_volume) & (snapshot.mark > 0)
+        if symbols is not None: eligible &= np.isin(snapshot.symbols, list(symbols)) # A cached snapshot may cover more
+        wanted = {"LONG": (count, 0), "SHORT": (0, count), "BOTH": (count - count // 2, count // 2)}[sides]
+        both = sides == "BOTH"; picks = []
+        for side, n, score, other in (("LONG", wanted[0], long_score, short_score), ("SHORT", wanted[1], short_score, long_score)):
+            if not n: continue
+            candidates = eligible & (score > other if both else True)
+            order = np.flatnonzero(candidates)[np.argsort(-score[candidates], kind='stable')][:n]
+            picks += [(side, i, float(score[i])) for i in order]
+        range_fraction = (snapshot.high - snapshot.low) / snapshot.last
+        return [{'symbol': snapshot.symbols[i], 'position_side': side, 'sl_price': None, 'score': score,
+                 'tp_price': self.tp_price(snapshot.symbols[i], side, snapshot.mark[i], float(np.nan_to_num(range_fraction[i])), tp_percent) if tp_percent != 0 else None}
+                for side, i, score in picks]
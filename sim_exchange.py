@@ -0,0 +1,344 @@
+"""In-process fake Binance USD-M futures exchange for offline tests and benchmarks.
+
+SimClient implements the AsyncClient methods the app calls (exchangeInfo,
+mark price, position info, create/batch orders, leverage, position mode,
+balance, symbol config, leverage brackets, 24h ticker, open interest, income history) against local state. Every call pays a configurable,
+seeded latency and request weight; exceeding the weight or order-count limit
+raises the same 429 BinanceAPIException the real API would, and every
+response reports usage through the X-MBX-* headers (to header_listener). MARKET orders fill
+immediately at the mark price (plus optional slippage); with book_depth set
+they walk a seeded order book instead, whose depth is used up by fills and
+refills with a half-life of book_refill_seconds. LIMIT orders (GTX =
+post-only, rejected when they would cross) and TAKE_PROFIT_MARKET /
+STOP_MARKET orders rest until step_marks() moves the mark through their
+price. They can be cancelled singly, in bulk or per symbol. With
+unordered_batches=True a batchOrders request is processed in random order,
+as the real API does not guarantee it. Fills book REALIZED_PNL and COMMISSION
+(fee_rate of the notional) income records into the wallet balance;
+settle_funding() books FUNDING_FEE for open legs.
+
+    sim = SimClient(n_symbols=200, latency_ms=20)
+    await connect_binance(None, None, client=sim)
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from decimal import Decimal, ROUND_DOWN
+
+from binance.exceptions import BinanceAPIException
+
+# --- Configuration ---
+QUOTE_ASSET = "USDC"
+WEIGHT_LIMIT_PER_MINUTE = 2400
+ORDER_LIMIT_PER_10_SECONDS = 300
+ENDPOINT_WEIGHTS = {'exchangeInfo': 1, 'markPrice': 10, 'markPrice_symbol': 1, 'positionRisk': 5, 'order': 1, 'batchOrders': 5,
+                    'leverage': 1, 'positionSide': 30, 'balance': 5, 'symbolConfig': 5, 'income': 30, 'openOrders': 1, 'depth': 2,
+                    'ticker': 40, 'ticker_symbol': 1, 'openInterest': 1} # Approximate Binance weights
+BOOK_LEVELS = 100 # Price levels per side of the simulated book
+DAILY_VOLUME = 50000000 # Simulated 24h quote volume per symbol
+TAKER_FEE_RATE = Decimal('0.0004') # Commission on every simulated fill
+LEVERAGE_BRACKETS = ((50000, 125, '0.004'), (250000, 100, '0.005'), (3000000, 50, '0.01'), (20000000, 20, '0.025'), (50000000, 10, '0.05'), (100000000, 5, '0.1')) # (notional cap, max leverage, maint margin ratio)
+
+
+class SimResponse:
+    """Minimal stand-in for the aiohttp response attached to API errors."""
+    def __init__(self, status, text, headers=None):
+        self.status = status; self.text = text; self.headers = headers or {}
+
+
+class SimClient:
+    """Fake AsyncClient backed by in-memory exchange state. Deterministic for a given seed."""
+    header_listener = None # Called with the X-MBX-* headers of every successful response, like async_core.MeteredAsyncClient
+
+    def __init__(self, n_symbols=50, latency_ms=5.0, jitter_ms=2.0, weight_limit=WEIGHT_LIMIT_PER_MINUTE, order_limit=ORDER_LIMIT_PER_10_SECONDS,
+                 slippage_bps=0.0, reject_rate=0.0, hedge_mode=True, balance=100000, leverage=20, seed=42, unordered_batches=False,
+                 book_depth=None, level_bps=1.0, book_refill_seconds=5.0, daily_volume=DAILY_VOLUME, fee_rate=TAKER_FEE_RATE):
+        self.rng = random.Random(seed); self.latency_ms = latency_ms; self.jitter_ms = jitter_ms
+        self.weight_limit = weight_limit; self.order_limit = order_limit; self.slippage_bps = slippage_bps; self.reject_rate = reject_rate
+        self.hedge_mode = hedge_mode; self.balance = Decimal(str(balance)); self.unordered_batches = unordered_batches
+        self.book_depth = Decimal(str(book_depth)) if book_depth else None; self.level_bps = Decimal(str(level_bps)); self.book_refill_seconds = book_refill_seconds # Quote notional per book level (None = unlimited)
+        self.daily_volume = Decimal(str(daily_volume)) # 24h quote volume reported by the ticker
+        self.consumed = {} # (symbol, side taken) -> (base qty eaten from the top of the book, monotonic time)
+        self.symbols = {}; self.marks = {}; self.leverage = {}; self.funding = {}; self.open_interest = {}
+        for i in range(n_symbols):
+            symbol = f"SIM{i:03d}{QUOTE_ASSET}"; price = Decimal(str(round(self.rng.uniform(0.05, 50000), 2 if i % 3 else 4)))
+            tick = Decimal('0.0001') if price < 10 else Decimal('0.01'); step = Decimal('1') if price < 10 else Decimal('0.001')
+            self.symbols[symbol] = {'tick': tick, 'step': step, 'min_qty': step, 'max_qty': Decimal('1000000')}
+            self.marks[symbol] = price.quantize(tick); self.leverage[symbol] = leverage
+            self.funding[symbol] = Decimal(str(round(self.rng.uniform(-0.0005, 0.0005), 6))); self.open_interest[symbol] = (self.daily_volume * Decimal(str(round(self.rng.uniform(0.05, 0.5), 3))) / price).quantize(step)
+        self.day_open = dict(self.marks); self.highs = dict(self.marks); self.lows = dict(self.marks) # 24h ticker stats since start
+        self.positions = {} # (symbol, positionSide) -> {'amount': Decimal, 'entry': Decimal}
+        self.open_orders = {} # orderId -> order dict (resting LIMIT / TAKE_PROFIT_MARKET / STOP_MARKET)
+        self.orders = {} # orderId -> every order placed, for futures_get_order
+        self.fee_rate = Decimal(str(fee_rate)); self.income = []; self.next_tran_id = 1 # Income records, oldest first
+        self.next_order_id = 1; self.weight_log = deque(); self.order_log = deque(); self.calls = {}; self.rejected = 0; self.closed = False
+
+    # --- Plumbing ---
+    async def _call(self, endpoint, weight_key=None, orders=0):
+        """Charges request weight (and order count), enforces the limits and sleeps the simulated round trip."""
+        weight = ENDPOINT_WEIGHTS.get(weight_key or endpoint, 1); now = time.monotonic()
+        while self.weight_log and now - self.weight_log[0][0] >= 60: self.weight_log.popleft()
+        while self.order_log and now - self.order_log[0][0] >= 60: self.order_log.popleft()
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.used_weight() + weight > self.weight_limit:
+            self.rejected += 1; self._raise(429, -1003, "Too many requests; current limit is %d request weight per 1 MINUTE." % self.weight_limit, retry_after=60 - (now - self.weight_log[0][0]) if self.weight_log else 1)
+        if orders and self.order_count(10) + orders > self.order_limit:
+            self.rejected += 1; self._raise(429, -1015, "Too many new orders; current limit is %d orders per TEN_SECONDS." % self.order_limit)
+        self.weight_log.append((now, weight))
+        if orders: self.order_log.append((now, orders))
+        delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if delay: await asyncio.sleep(delay)
+        if self.header_listener: self.header_listener(self.usage_headers())
+
+    def used_weight(self):
+        return sum(w for _, w in self.weight_log)
+
+    def order_count(self, seconds):
+        now = time.monotonic()
+        return sum(n for t, n in self.order_log if now - t < seconds)
+
+    def usage_headers(self):
+        return {'X-MBX-USED-WEIGHT-1M': str(self.used_weight()), 'X-MBX-ORDER-COUNT-10S': str(self.order_count(10)), 'X-MBX-ORDER-COUNT-1M': str(self.order_count(60))}
+
+    def _raise(self, status, code, msg, retry_after=None):
+        text = json.dumps({'code': code, 'msg': msg}); headers = self.usage_headers()
+        if retry_after is not None: headers['Retry-After'] = str(max(1, int(retry_after)))
+        raise BinanceAPIException(SimResponse(status, text, headers), status, text)
+
+    def _check_symbol(self, symbol):
+        if symbol not in self.symbols: self._raise(400, -1121, "Invalid symbol.")
+
+    # --- Market Data ---
+    async def futures_exchange_info(self):
+        await self._call('exchangeInfo')
+        return {'symbols': [{'symbol': s, 'quoteAsset': QUOTE_ASSET, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+                             'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': str(f['tick'])}, {'filterType': 'LOT_SIZE', 'stepSize': str(f['step']), 'minQty': str(f['min_qty']), 'maxQty': str(f['max_qty'])},
+                                         {'filterType': 'MARKET_LOT_SIZE', 'stepSize': str(f['step']), 'minQty': str(f['min_qty']), 'maxQty': str(f['max_qty'])}, {'filterType': 'MIN_NOTIONAL', 'notional': '5'}]}
+                            for s, f in self.symbols.items()]}
+
+    async def futures_mark_price(self, symbol=None):
+        if symbol: await self._call('markPrice', 'markPrice_symbol'); self._check_symbol(symbol); return {'symbol': symbol, 'markPrice': str(self.marks[symbol])}
+        await self._call('markPrice')
+        return [{'symbol': s, 'markPrice': str(m), 'lastFundingRate': str(self.funding[s])} for s, m in self.marks.items()]
+
+    async def futures_order_book(self, symbol, limit=500):
+        await self._call('depth'); self._check_symbol(symbol)
+        bids, asks = self._book(symbol, int(limit))
+        return {'lastUpdateId': self.next_order_id, 'bids': [[str(p), str(q)] for p, q in bids], 'asks': [[str(p), str(q)] for p, q in asks]}
+
+    async def futures_ticker(self, symbol=None):
+        if symbol: await self._call('ticker', 'ticker_symbol'); self._check_symbol(symbol)
+        else: await self._call('ticker')
+        rows = [{'symbol': s, 'lastPrice': str(m), 'openPrice': str(self.day_open[s]), 'highPrice': str(self.highs[s]), 'lowPrice': str(self.lows[s]),
+                 'priceChangePercent': str(((m / self.day_open[s] - 1) * 100).quantize(Decimal('0.001'))), 'volume': str((self.daily_volume / m).quantize(self.symbols[s]['step'])), 'quoteVolume': str(self.daily_volume)}
+                for s, m in self.marks.items() if not symbol or s == symbol]
+        return rows[0] if symbol else rows
+
+    async def futures_open_interest(self, symbol):
+        await self._call('openInterest'); self._check_symbol(symbol)
+        return {'symbol': symbol, 'openInterest': str(self.open_interest[symbol]), 'time': int(time.time() * 1000)}
+
+    def _book(self, symbol, levels=BOOK_LEVELS):
+        """(bids, asks) as [(price, qty)], best first: level_bps apart around the mark, minus the depth recent fills used up."""
+        mark = self.marks[symbol]; rules = self.symbols[symbol]; tick = rules['tick']
+        gap = max(tick, (mark * self.level_bps / 10000).quantize(tick)); bid = ((mark - gap / 2) / tick).to_integral_value(ROUND_DOWN) * tick
+        sides = []
+        for side, best, sign in (('SELL', bid, -1), ('BUY', bid + gap, 1)): # Sells hit the bids, buys lift the asks
+            eaten = self._consumed(symbol, side); book = []
+            for i in range(levels):
+                price = best + sign * gap * i; qty = max(rules['step'], (self.book_depth / price).quantize(rules['step'], rounding=ROUND_DOWN)) if self.book_depth else rules['max_qty']
+                if eaten >= qty: eaten -= qty; continue
+                book.append((price, qty - eaten)); eaten = 0
+            sides.append(book or [(price, rules['step'])])
+        return sides[0], sides[1]
+
+    def _consumed(self, symbol, side):
+        qty, at = self.consumed.get((symbol, side), (Decimal(0), 0.0))
+        if not qty or not self.book_refill_seconds: return Decimal(0)
+        return (qty * Decimal(str(0.5 ** ((time.monotonic() - at) / self.book_refill_seconds)))).quantize(self.symbols[symbol]['step'], rounding=ROUND_DOWN)
+
+    def _walk(self, symbol, side, qty):
+        """Average price of a market order sweeping the book; the depth it takes refills over time."""
+        levels = self._book(symbol)[1 if side == 'BUY' else 0]; left = qty; cost = Decimal(0)
+        for price, available in levels:
+            take = min(left, available); cost += take * price; left -= take
+            if not left: break
+        cost += left * levels[-1][0] # Beyond the simulated depth: the last level's price
+        self.consumed[(symbol, side)] = (self._consumed(symbol, side) + qty, time.monotonic())
+        return (cost / qty).quantize(Decimal('1e-8'))
+
+    def step_marks(self, volatility=0.001, symbols=None):
+        """Random-walks mark prices one step (seeded) and fills any crossed resting orders. Returns {symbol: new mark}."""
+        changed = {}
+        for symbol in symbols or self.marks:
+            tick = self.symbols[symbol]['tick']
+            self.marks[symbol] = max(tick, (self.marks[symbol] * Decimal(str(1 + self.rng.gauss(0, volatility)))).quantize(tick)); changed[symbol] = self.marks[symbol]
+            self.highs[symbol] = max(self.highs[symbol], self.marks[symbol]); self.lows[symbol] = min(self.lows[symbol], self.marks[symbol])
+        for order_id, order in list(self.open_orders.items()):
+            mark = self.marks[order['symbol']]; limit = order['type'] == 'LIMIT'; stop = Decimal(order['price' if limit else 'stopPrice'])
+            above = order['side'] == ('SELL' if limit or order['type'] == 'TAKE_PROFIT_MARKET' else 'BUY')
+            if (above and mark >= stop) or (not above and mark <= stop):
+                del self.open_orders[order_id]
+                try:
+                    price = self._fill(order['symbol'], order['side'], order['positionSide'], Decimal(order['origQty']), order['reduceOnly'], stop if limit else None)
+                    order.update(status='FILLED', executedQty=order['origQty'], avgPrice=str(price))
+                except BinanceAPIException: order.update(status='EXPIRED') # Reduce-only with nothing left to reduce
+        return changed
+
+    # --- Account ---
+    async def futures_account_balance(self):
+        await self._call('balance')
+        return [{'asset': QUOTE_ASSET, 'balance': str(self.balance), 'crossWalletBalance': str(self.balance), 'availableBalance': str(self.balance)}]
+
+    async def futures_income_history(self, **params):
+        await self._call('income')
+        limit = min(int(params.get('limit', 100)), 1000); start = int(params.get('startTime', 0)); end = int(params.get('endTime', 2 ** 63))
+        rows = [r for r in self.income if start <= r['time'] <= end and (not params.get('symbol') or r['symbol'] == params['symbol'])
+                and (not params.get('incomeType') or r['incomeType'] == params['incomeType'])]
+        skip = (max(1, int(params.get('page', 1))) - 1) * limit
+        return [dict(r) for r in rows[skip:skip + limit]]
+
+    def _book_income(self, symbol, income_type, amount, trade_id=""):
+        amount = amount.quantize(Decimal('1e-8')); self.balance += amount
+        self.income.append({'symbol': symbol, 'incomeType': income_type, 'income': str(amount), 'asset': QUOTE_ASSET, 'info': income_type,
+                            'time': int(time.time() * 1000), 'tranId': self.next_tran_id, 'tradeId': str(trade_id)}); self.next_tran_id += 1
+
+    def settle_funding(self):
+        """Books one funding payment (position notional x funding rate; longs pay positive rates) for every open leg."""
+        for (symbol, _), leg in self.positions.items():
+            if leg['amount']: self._book_income(symbol, 'FUNDING_FEE', -leg['amount'] * self.marks[symbol] * self.funding[symbol])
+
+    async def futures_leverage_bracket(self, symbol=None):
+        await self._call('leverageBracket')
+        brackets = []; floor = Decimal(0); cum = Decimal(0); previous = Decimal(0)
+        for i, (cap, leverage, ratio) in enumerate(LEVERAGE_BRACKETS):
+            ratio = Decimal(ratio); cum += floor * (ratio - previous); previous = ratio
+            brackets.append({'bracket': i + 1, 'initialLeverage': leverage, 'notionalCap': cap, 'notionalFloor': int(floor), 'maintMarginRatio': float(ratio), 'cum': float(cum)}); floor = Decimal(cap)
+        return [{'symbol': s, 'brackets': brackets} for s in self.symbols if not symbol or s == symbol]
+
+    async def futures_get_position_mode(self):
+        await self._call('positionSide')
+        return {'dualSidePosition': self.hedge_mode}
+
+    async def futures_symbol_config(self, **params):
+        await self._call('symbolConfig')
+        return [{'symbol': s, 'leverage': self.leverage[s], 'marginType': 'CROSSED'} for s in self.symbols]
+
+    async def futures_change_leverage(self, symbol, leverage):
+        await self._call('leverage'); self._check_symbol(symbol)
+        if not 1 <= int(leverage) <= 125: self._raise(400, -4028, "Leverage is not valid")
+        self.leverage[symbol] = int(leverage)
+        return {'symbol': symbol, 'leverage': int(leverage), 'maxNotionalValue': '1000000'}
+
+    async def futures_position_information(self, **params):
+        await self._call('positionRisk')
+        return [{'symbol': s, 'positionSide': side, 'positionAmt': str(p['amount']), 'entryPrice': str(p['entry']), 'markPrice': str(self.marks[s]),
+                 'unRealizedProfit': str(p['amount'] * (self.marks[s] - p['entry'])), 'marginAsset': QUOTE_ASSET}
+                for (s, side), p in self.positions.items() if p['amount'] != 0 and (not params.get('symbol') or params['symbol'] == s)]
+
+    async def close_connection(self):
+        self.closed = True
+
+    # --- Orders ---
+    async def futures_create_order(self, **params):
+        await self._call('order', orders=1)
+        return self._place(params)
+
+    async def futures_place_batch_order(self, batchOrders):
+        await self._call('order', 'batchOrders', orders=len(batchOrders))
+        if len(batchOrders) > 5: self._raise(400, -1102, "Param 'batchOrders' too long.")
+        order = list(range(len(batchOrders)))
+        if self.unordered_batches: self.rng.shuffle(order)
+        results = [None] * len(batchOrders)
+        for i in order:
+            try: results[i] = self._place(batchOrders[i])
+            except BinanceAPIException as e: results[i] = {'code': e.code, 'msg': e.message} # Per-order errors come back inline
+        return results
+
+    async def futures_get_order(self, symbol, orderId):
+        await self._call('order')
+        order = self.orders.get(int(orderId))
+        if not order or order['symbol'] != symbol: self._raise(400, -2013, "Order does not exist.")
+        return dict(order)
+
+    async def futures_get_open_orders(self, symbol=None):
+        await self._call('openOrders')
+        return [dict(o) for o in self.open_orders.values() if not symbol or o['symbol'] == symbol]
+
+    async def futures_cancel_order(self, symbol, orderId):
+        await self._call('order')
+        return self._cancel(symbol, orderId)
+
+    async def futures_cancel_orders(self, symbol, orderidlist):
+        await self._call('order', 'batchOrders')
+        if len(orderidlist) > 10: self._raise(400, -1102, "Param 'orderIdList' too long.")
+        results = []
+        for order_id in orderidlist:
+            try: results.append(self._cancel(symbol, order_id))
+            except BinanceAPIException as e: results.append({'code': e.code, 'msg': e.message})
+        return results
+
+    async def futures_cancel_all_open_orders(self, symbol):
+        await self._call('order')
+        for order_id in [i for i, o in self.open_orders.items() if o['symbol'] == symbol]: del self.open_orders[order_id]
+        return {'code': 200, 'msg': "The operation of cancel all open order is done."}
+
+    def _cancel(self, symbol, order_id):
+        order = self.open_orders.get(int(order_id))
+        if not order or order['symbol'] != symbol: self._raise(400, -2011, "Unknown order sent.")
+        del self.open_orders[int(order_id)]; order.update(status='CANCELED')
+        return dict(order)
+
+    def _place(self, params):
+        symbol = params['symbol']; self._check_symbol(symbol); rules = self.symbols[symbol]
+        side = params['side']; position_side = params.get('positionSide', 'BOTH'); order_type = params['type']
+        qty = Decimal(str(params['quantity'])); reduce_only = str(params.get('reduceOnly', 'false')).lower() == 'true'
+        if qty <= 0 or qty < rules['min_qty'] or qty > rules['max_qty']: self._raise(400, -4003, "Quantity less than or equal to zero." if qty <= 0 else "Quantity out of range.")
+        if qty != qty.quantize(rules['step'], rounding=ROUND_DOWN): self._raise(400, -1111, "Precision is over the maximum defined for this asset.")
+        if self.reject_rate and self.rng.random() < self.reject_rate: self._raise(400, -2019, "Margin is insufficient.")
+        if self.hedge_mode and position_side == 'BOTH': self._raise(400, -4061, "Order's position side does not match user's setting.")
+        order = {'orderId': self.next_order_id, 'symbol': symbol, 'side': side, 'positionSide': position_side, 'type': order_type,
+                 'origQty': str(qty), 'reduceOnly': reduce_only, 'updateTime': int(time.time() * 1000)}
+        if order_type == 'MARKET':
+            order.update(status='FILLED', executedQty=str(qty), avgPrice=str(self._fill(symbol, side, position_side, qty, reduce_only)))
+        elif order_type == 'LIMIT':
+            price = Decimal(str(params['price']))
+            if price != price.quantize(rules['tick']) or price <= 0: self._raise(400, -1111, "Precision is over the maximum defined for this asset.")
+            bids, asks = self._book(symbol, 1)
+            if (side == 'BUY' and price >= asks[0][0]) or (side == 'SELL' and price <= bids[0][0]):
+                if params.get('timeInForce') == 'GTX': self._raise(400, -5022, "Due to the order could not be executed as maker, the Post Only order will be rejected.")
+                order.update(status='FILLED', executedQty=str(qty), avgPrice=str(self._fill(symbol, side, position_side, qty, reduce_only))) # Marketable: takes the book
+            else:
+                if reduce_only and not self.positions.get((symbol, position_side), {}).get('amount'): self._raise(400, -2022, "ReduceOnly Order is rejected.")
+                order.update(status='NEW', executedQty='0', price=str(price), timeInForce=params.get('timeInForce', 'GTC')); self.open_orders[order['orderId']] = order
+        elif order_type in ('TAKE_PROFIT_MARKET', 'STOP_MARKET'):
+            if reduce_only and not self.positions.get((symbol, position_side), {}).get('amount'): self._raise(400, -2022, "ReduceOnly Order is rejected.")
+            order.update(status='NEW', executedQty='0', stopPrice=str(Decimal(str(params['stopPrice'])).quantize(rules['tick']))); self.open_orders[order['orderId']] = order
+        else: self._raise(400, -1116, "Invalid orderType.")
+        self.orders[order['orderId']] = order; self.next_order_id += 1
+        return order
+
+    def _fill(self, symbol, side, position_side, qty, reduce_only, price=None):
+        key = (symbol, position_side); leg = self.positions.setdefault(key, {'amount': Decimal(0), 'entry': Decimal(0)})
+        signed = qty if side == 'BUY' else -qty
+        if reduce_only and (leg['amount'] == 0 or (leg['amount'] > 0) == (signed > 0) or qty > abs(leg['amount'])): self._raise(400, -2022, "ReduceOnly Order is rejected.")
+        slip = Decimal(str(self.slippage_bps)) / 10000
+        if price is None and self.book_depth: price = self._walk(symbol, side, qty)
+        elif price is None: price = (self.marks[symbol] * (1 + slip if side == 'BUY' else 1 - slip)).quantize(self.symbols[symbol]['tick'])
+        new_amount = leg['amount'] + signed
+        if leg['amount'] and (leg['amount'] > 0) != (signed > 0): self._book_income(symbol, 'REALIZED_PNL', min(qty, abs(leg['amount'])) * (price - leg['entry']) * (1 if leg['amount'] > 0 else -1))
+        if self.fee_rate: self._book_income(symbol, 'COMMISSION', -qty * price * self.fee_rate)
+        if leg['amount'] == 0 or (leg['amount'] > 0) == (signed > 0): leg['entry'] = (leg['amount'] * leg['entry'] + signed * price) / new_amount # Adding: weighted entry
+        leg['amount'] = new_amount
+        if new_amount == 0: leg['entry'] = Decimal(0)
+        return price
+
+    def open_positions(self, n, notional=100):
+        """Seeds n hedge-mode legs directly (no latency / weight), alternating LONG and SHORT over the symbol list."""
+        symbols = list(self.symbols)
+        for i in range(n):
+            symbol = symbols[i % len(symbols)]; side = 'LONG' if (i // len(symbols)) % 2 == 0 else 'SHORT'; rules = self.symbols[symbol]
+            qty = max(rules['min_qty'], (Decimal(notional) / self.marks[symbol]).quantize(rules['step'], rounding=ROUND_DOWN))
+            self._fill(symbol, 'BUY' if side == 'LONG' else 'SELL', side, qty, False)
@@ -0,0 +1,105 @@
+"""Persistent local state in one SQLite file, for warm starts.
+
+Holds the last exchangeInfo per network (with a content hash as its version,
+since the endpoint sends no ETag), the leverage last seen per account and
+symbol, the futures income history (realized PNL, fees, funding) per account,
+and small JSON settings such as the last basket selection and the monitor
+configuration. API keys are never stored; accounts are keyed by a
+hash of the API key. Safe to share between the Tk thread and the exchange
+loop thread.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Configuration ---
+STATE_DB_PATH = os.path.join(os.path.expanduser("~"), ".binance_trader", "state.db")
+EXCHANGE_INFO_MAX_AGE_SECONDS = 7 * 24 * 3600 # Older cached exchangeInfo is ignored at warm start
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchange_info (network TEXT PRIMARY KEY, version TEXT NOT NULL, payload TEXT NOT NULL, saved_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leverage (account TEXT NOT NULL, symbol TEXT NOT NULL, leverage INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (account, symbol));
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS income (account TEXT NOT NULL, tran_id INTEGER NOT NULL, income_type TEXT NOT NULL, symbol TEXT NOT NULL, asset TEXT NOT NULL, income TEXT NOT NULL, time INTEGER NOT NULL, PRIMARY KEY (account, tran_id, income_type));
+CREATE INDEX IF NOT EXISTS income_time ON income (account, time);
+"""
+
+
+def account_id(api_key, testnet=False):
+    """Stable, non-reversible key for an account's rows."""
+    return ("testnet:" if testnet else "mainnet:") + hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def exchange_info_version(exchange_info):
+    """Content hash of the symbol rules (serverTime and rate limits excluded), used like an ETag."""
+    return hashlib.sha1(json.dumps(exchange_info.get('symbols', []), sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class StateStore:
+    """Small key/value + table store over sqlite3."""
+    def __init__(self, path=STATE_DB_PATH):
+        if path != ":memory:": os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path; self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None) # Autocommit; writes are single statements or explicit transactions
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL"); self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock: self.db.close()
+
+    # --- Exchange Metadata ---
+    def load_exchange_info(self, network, max_age=EXCHANGE_INFO_MAX_AGE_SECONDS):
+        """(payload, version) of the cached exchangeInfo, or (None, None) if missing or too old."""
+        with self.lock: row = self.db.execute("SELECT payload, version, saved_at FROM exchange_info WHERE network = ?", (network,)).fetchone()
+        if not row or time.time() - row[2] > max_age: return None, None
+        try: return json.loads(row[0]), row[1]
+        except ValueError: return None, None
+
+    def save_exchange_info(self, network, exchange_info):
+        """Stores exchangeInfo if its version changed. Returns (version, changed)."""
+        version = exchange_info_version(exchange_info)
+        with self.lock:
+            row = self.db.execute("SELECT version FROM exchange_info WHERE network = ?", (network,)).fetchone()
+            if row and row[0] == version: self.db.execute("UPDATE exchange_info SET saved_at = ? WHERE network = ?", (time.time(), network)); return version, False
+            self.db.execute("INSERT OR REPLACE INTO exchange_info VALUES (?, ?, ?, ?)", (network, version, json.dumps(exchange_info, separators=(',', ':')), time.time()))
+        return version, True
+
+    # --- Leverage ---
+    def load_leverage(self, account):
+        with self.lock: return {symbol: leverage for symbol, leverage in self.db.execute("SELECT symbol, leverage FROM leverage WHERE account = ?", (account,))}
+
+    def save_leverage(self, account, leverage):
+        """Upserts {symbol: leverage} in one transaction."""
+        if not leverage: return
+        now = time.time()
+        with self.lock, self.db: # `with db` wraps the executemany in BEGIN/COMMIT
+            self.db.execute("BEGIN"); self.db.executemany("INSERT OR REPLACE INTO leverage VALUES (?, ?, ?, ?)", [(account, s, int(l), now) for s, l in leverage.items()])
+
+    # --- Income ---
+    def load_income(self, account, since_ms=0):
+        """[(tran_id, income_type, symbol, income, time)] of the account from since_ms on, oldest first; income is the exact decimal string."""
+        with self.lock: return self.db.execute("SELECT tran_id, income_type, symbol, income, time FROM income WHERE account = ? AND time >= ? ORDER BY time", (account, since_ms)).fetchall()
+
+    def save_income(self, account, rows):
+        """Inserts [(tran_id, income_type, symbol, asset, income, time)] in one transaction; rows already stored are skipped."""
+        if not rows: return
+        with self.lock, self.db:
+            self.db.execute("BEGIN"); self.db.executemany("INSERT OR IGNORE INTO income VALUES (?, ?, ?, ?, ?, ?, ?)", [(account, *row) for row in rows])
+
+    # --- Settings ---
+    def get(self, key, default=None):
+        with self.lock: row = self.db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        if not row: return default
+        try: return json.loads(row[0])
+        except ValueError: return default
+
+    def put(self, key, value):
+        with self.lock: self.db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+
+
+def open_store(path=STATE_DB_PATH):
+    """StateStore, or None (with a warning) when the file cannot be opened; the app then simply starts cold."""
+    try: return StateStore(path)
+    except (sqlite3.Error, OSError) as e: print(f"Warning: State store unavailable ({e}); starting without cache."); return None
@@ -0,0 +1,235 @@
+"""WebSocket streaming data layer: mark prices + user-data stream into a local position book.
+
+The book is seeded from a REST snapshot each time the user stream connects
+(frames arriving meanwhile are buffered and applied after it) and kept current from
+!markPrice@arr@1s (mark prices) and the user-data stream (ACCOUNT_UPDATE /
+ORDER_TRADE_UPDATE). Unrealized PNL is computed locally on every tick.
+
+For offline testing, `python streaming.py replay frames.jsonl` serves recorded
+frames on a local websocket; point MarketStream at it with ws_base_url="ws://127.0.0.1:8765"
+and client=None.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import websockets
+
+from portfolio import PortfolioSnapshot
+
+# --- Configuration ---
+FUTURES_WS_URLS = {False: "wss://fstream.binance.com", True: "wss://stream.binancefuture.com"} # keyed by testnet
+MARK_PRICE_STREAM = "!markPrice@arr@1s"
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60 # Listen keys expire after 60 minutes without a keepalive
+RECONNECT_BACKOFF_SECONDS = (1, 30) # Initial and max delay between reconnect attempts
+STREAM_STALE_SECONDS = 5 # Book is considered stale if no mark tick arrived for this long
+QUOTE_ASSET = "USDC"
+
+
+# --- Position Book ---
+class PositionBook:
+    """Thread-safe in-memory book of open legs, keyed by 'SYMBOL_SIDE'."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {} # key -> {'symbol', 'side', 'amount', 'entry_price', 'leverage', 'margin_asset'}
+        self.marks = {} # symbol -> Decimal mark price
+        self.open_orders = {} # orderId -> last ORDER_TRADE_UPDATE 'o' payload for working orders
+        self.leverage = {} # symbol -> int, from REST seed and ACCOUNT_CONFIG_UPDATE
+        self.listeners = []
+        self.last_mark_at = 0.0
+        self.last_frame_at = 0.0 # perf_counter() when the frame being applied was received
+
+    def subscribe(self, callback):
+        """callback(kind, payload) is called after every applied update, from the stream thread."""
+        self.listeners.append(callback)
+
+    def _notify(self, kind, payload):
+        for callback in list(self.listeners):
+            try: callback(kind, payload)
+            except Exception as e: print(f"PositionBook listener error: {e}")
+
+    def seed(self, position_info):
+        """Replaces positions from a futures_position_information() response."""
+        with self.lock:
+            positions = {}
+            for pos in position_info:
+                symbol = pos.get('symbol'); side = pos.get('positionSide', 'BOTH')
+                if pos.get('leverage') not in (None, 'N/A'): self.leverage[symbol] = int(pos['leverage'])
+                amount = Decimal(pos.get('positionAmt', '0'))
+                if amount == 0: continue
+                positions[f"{symbol}_{side}"] = {'symbol': symbol, 'side': side, 'amount': amount, 'entry_price': Decimal(pos.get('entryPrice', '0')), 'margin_asset': pos.get('marginAsset', QUOTE_ASSET)}
+                if pos.get('markPrice') and Decimal(pos['markPrice']) > 0: self.marks.setdefault(symbol, Decimal(pos['markPrice']))
+            self.positions = positions
+        self._notify('seed', None)
+
+    def apply_mark_prices(self, updates):
+        """Applies a !markPrice@arr frame (list of markPriceUpdate events)."""
+        changed = {}
+        with self.lock:
+            for u in updates:
+                mark = Decimal(u['p'])
+                if self.marks.get(u['s']) != mark: self.marks[u['s']] = mark; changed[u['s']] = mark
+            self.last_mark_at = time.time()
+        if changed: self._notify('mark', changed)
+
+    def apply_account_update(self, event):
+        """Applies an ACCOUNT_UPDATE event: positions carried in the event replace our legs."""
+        with self.lock:
+            for p in event.get('a', {}).get('P', []):
+                key = f"{p['s']}_{p['ps']}"; amount = Decimal(p['pa'])
+                if amount == 0: self.positions.pop(key, None); continue
+                leg = self.positions.setdefault(key, {'symbol': p['s'], 'side': p['ps'], 'margin_asset': QUOTE_ASSET})
+                leg['amount'] = amount; leg['entry_price'] = Decimal(p['ep'])
+        self._notify('account', event)
+
+    def apply_order_update(self, event):
+        order = event.get('o', {})
+        with self.lock:
+            if order.get('X') in ('NEW', 'PARTIALLY_FILLED'): self.open_orders[order.get('i')] = order
+            else: self.open_orders.pop(order.get('i'), None)
+        self._notify('order', event)
+
+    def apply_config_update(self, event):
+        config = event.get('ac')
+        if config:
+            with self.lock: self.leverage[config['s']] = int(config['l'])
+        self._notify('config', event)
+
+    def handle_frame(self, frame):
+        """Dispatches one decoded websocket frame to the right update."""
+        self.last_frame_at = time.perf_counter()
+        if isinstance(frame, dict) and 'stream' in frame and 'data' in frame: frame = frame['data'] # Combined-stream envelope
+        if isinstance(frame, list): self.apply_mark_prices([u for u in frame if u.get('e') == 'markPriceUpdate']); return
+        event = frame.get('e')
+        if event == 'markPriceUpdate': self.apply_mark_prices([frame])
+        elif event == 'ACCOUNT_UPDATE': self.apply_account_update(frame)
+        elif event == 'ORDER_TRADE_UPDATE': self.apply_order_update(frame)
+        elif event == 'ACCOUNT_CONFIG_UPDATE': self.apply_config_update(frame)
+        elif event == 'listenKeyExpired': self._notify('listen_key_expired', frame)
+
+    def snapshot(self):
+        """Same shape as get_open_positions_pnl(): (status, PortfolioSnapshot, total_pnl), computed locally."""
+        with self.lock: legs = dict(self.positions); marks = dict(self.marks); leverage = dict(self.leverage)
+        portfolio = PortfolioSnapshot.from_legs(legs, marks, leverage); total_pnl = portfolio.total_pnl_decimal()
+        status = f"PNL ({len(portfolio)} Pos, streaming). Total: {total_pnl:.4f} {QUOTE_ASSET}" if len(portfolio) else "No active positions."
+        return status, portfolio, total_pnl
+
+
+# --- Stream Connection ---
+class MarketStream:
+    """Runs the mark-price and user-data websockets as tasks on an asyncio loop.
+    client: an AsyncClient used for listen keys and REST re-seeding (None disables the user stream)."""
+    def __init__(self, client, book, ws_base_url):
+        self.client = client; self.book = book; self.ws_base_url = ws_base_url.rstrip('/')
+        self.loop = None; self.tasks = []; self.stopping = False
+        self.listen_key = None; self.connected = {'market': False, 'user': client is None}
+        self.reconnects = 0
+        book.subscribe(self._on_book_event)
+
+    def start(self, loop=None):
+        """Runs on the given (already running) loop, or on a private loop thread if None."""
+        if loop: asyncio.run_coroutine_threadsafe(self.run(), loop)
+        else: threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True, name="market-stream").start()
+
+    def stop(self):
+        self.stopping = True
+        if self.loop and self.loop.is_running():
+            for task in self.tasks: self.loop.call_soon_threadsafe(task.cancel)
+
+    def is_live(self):
+        """True when both sockets are up and mark prices are flowing."""
+        return all(self.connected.values()) and time.time() - self.book.last_mark_at < STREAM_STALE_SECONDS
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.tasks = [asyncio.ensure_future(self._stream_forever('market', self._market_url))]
+        if self.client: self.tasks += [asyncio.ensure_future(self._stream_forever('user', self._user_url)), asyncio.ensure_future(self._keepalive_forever())]
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        print("Market stream stopped.")
+
+    async def _market_url(self):
+        return f"{self.ws_base_url}/ws/{MARK_PRICE_STREAM}"
+
+    async def _user_url(self):
+        self.listen_key = await self.client.futures_stream_get_listen_key()
+        return f"{self.ws_base_url}/ws/{self.listen_key}"
+
+    async def _seed_buffered(self, ws):
+        """Seeds the book from REST once the user socket is open (events may have been missed while disconnected).
+        Frames arriving during the REST call are buffered and applied after the seed, so none falls in between."""
+        buffered = []
+        async def buffer():
+            async for message in ws: buffered.append(json.loads(message))
+        reader = asyncio.ensure_future(buffer())
+        try: positions = await self.client.futures_position_information()
+        finally: reader.cancel(); await asyncio.gather(reader, return_exceptions=True) # Cancelling a recv loses no message
+        self.book.seed(positions)
+        for frame in buffered: self.book.handle_frame(frame)
+
+    async def _stream_forever(self, name, url_factory):
+        backoff = RECONNECT_BACKOFF_SECONDS[0]
+        while not self.stopping:
+            try:
+                url = await url_factory()
+                async with websockets.connect(url, ping_interval=20, max_size=None) as ws:
+                    if name == 'user': await self._seed_buffered(ws)
+                    self.connected[name] = True; backoff = RECONNECT_BACKOFF_SECONDS[0]; print(f"Stream '{name}' connected.")
+                    async for message in ws:
+                        self.book.handle_frame(json.loads(message))
+                        if name == 'user' and self.listen_key is None: break # listenKeyExpired: reconnect with a fresh key
+            except asyncio.CancelledError: break
+            except Exception as e: print(f"Stream '{name}' error: {e}")
+            self.connected[name] = False
+            if self.stopping: break
+            self.reconnects += 1; print(f"Stream '{name}' reconnecting in {backoff}s...")
+            await asyncio.sleep(backoff); backoff = min(backoff * 2, RECONNECT_BACKOFF_SECONDS[1])
+
+    async def _keepalive_forever(self):
+        while not self.stopping:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE_SECONDS)
+            if not self.listen_key: continue
+            try: await self.client.futures_stream_keepalive(listenKey=self.listen_key)
+            except Exception as e: print(f"Listen key keepalive failed: {e}")
+
+    def _on_book_event(self, kind, payload):
+        if kind == 'listen_key_expired': print("Listen key expired."); self.listen_key = None
+
+
+# --- Recording / Replay Stand-in ---
+async def _record(url, out_path, seconds):
+    deadline = time.time() + seconds
+    async with websockets.connect(url, max_size=None) as ws:
+        with open(out_path, 'a') as out:
+            while time.time() < deadline:
+                try: message = await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.time()))
+                except asyncio.TimeoutError: break
+                out.write(json.dumps({'t': time.time(), 'frame': json.loads(message)}) + "\n")
+
+def record_frames(out_path, seconds=60, url=f"{FUTURES_WS_URLS[False]}/ws/{MARK_PRICE_STREAM}"):
+    """Appends frames from a live stream to a JSONL file for later replay."""
+    asyncio.run(_record(url, out_path, seconds))
+
+def load_frames(path):
+    with open(path) as f: return [json.loads(line) for line in f if line.strip()]
+
+async def serve_frames(frames, host="127.0.0.1", port=8765, speed=1.0, loop_forever=False):
+    """Local websocket stand-in: replays recorded frames to every client, preserving timing / speed."""
+    async def handler(ws, *args):
+        while True:
+            previous_t = None
+            for entry in frames:
+                if previous_t is not None and speed > 0: await asyncio.sleep(max(0.0, (entry['t'] - previous_t) / speed))
+                previous_t = entry['t']; await ws.send(json.dumps(entry['frame']))
+            if not loop_forever: break
+        await ws.wait_closed()
+    async with websockets.serve(handler, host, port):
+        print(f"Replaying {len(frames)} frames on ws://{host}:{port}"); await asyncio.Future()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "record": record_frames(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 60)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "replay": asyncio.run(serve_frames(load_frames(sys.argv[2]), port=int(sys.argv[3]) if len(sys.argv) > 3 else 8765, loop_forever=True))
+    else: print("Usage: python streaming.py record <frames.jsonl> [seconds] | replay <frames.jsonl> [port]")
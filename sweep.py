@@ -0,0 +1,191 @@
+"""Multi-core parameter sweep of the basket + target-TP workflow over recorded prices.
+
+Every combination of leverage, target profit, basket size and TP offset in
+the grid is replayed with replay.Replayer and summarized. Replays run in
+repeat mode: the basket is re-opened after every exit until the tape ends.
+A basket of size N is the first N lines of the basket file, so rank it
+best first (cli.py select --out writes one). The price matrix is copied once
+into a multiprocessing.shared_memory block, holding only the basket's columns
+and the requested rows. Pool workers attach to it by name when they start,
+so each task is a small SweepPoint and no prices are pickled. The results
+table is ranked by net PNL (or --rank-by).
+
+    python sweep.py prices.npy basket.csv --amount 10 --leverage 5,10,20 --target 1:10:1 --size 5,10,20 --tp-offset 0,0.5,1
+"""
+import argparse
+import csv
+import itertools
+import os
+import time
+from decimal import Decimal
+from multiprocessing import Pool, shared_memory
+from typing import NamedTuple
+
+import numpy as np
+
+from engine import LEVERAGE, QUOTE_ASSET
+from replay import ReplayConfig, ReplayData, Replayer, summarize, load_exchange_info, TAKER_FEE_RATE
+from scoring import BASKET_SIZE
+
+# --- Configuration ---
+RANK_KEYS = ('net_pnl', 'mean_net', 'win_rate', 'net_per_drawdown') # net_per_drawdown = net PNL / max(max drawdown, 1)
+TABLE_ROWS = 20 # Rows of the ranked table printed
+PROGRESS_SECONDS = 10 # Progress line interval
+TASKS_PER_WORKER = 8 # Grid split into about this many chunks per worker (fewer round trips, still balanced)
+
+
+class SweepPoint(NamedTuple):
+    """One grid combination. tp_offset: per-leg TP in percent beyond the entry mark (0 = none)."""
+    leverage: int
+    target: Decimal
+    size: int
+    tp_offset: float
+
+
+def grid_values(text, cast=float):
+    """'5,10,20' or 'start:stop:step' (stop included) -> sorted unique values."""
+    values = []
+    for part in text.split(','):
+        if ':' not in part: values.append(cast(part)); continue
+        start, stop, step = (Decimal(v) for v in part.split(':'))
+        if step <= 0: raise ValueError(f"step must be positive: {part!r}")
+        values += [cast(start + i * step) for i in range(int((stop - start) / step) + 1)]
+    return sorted(set(values))
+
+
+def expand_grid(leverages, targets, sizes, tp_offsets):
+    return [SweepPoint(*combo) for combo in itertools.product(leverages, targets, sizes, tp_offsets)]
+
+
+# --- Shared price data ---
+def share_prices(data, symbols, start_row=0, end_row=None):
+    """Copies rows start_row..end_row of the symbols' columns into a new shared-memory block.
+    Returns (SharedMemory, spec); the caller closes and unlinks the block, workers attach with spec."""
+    columns = [data.column[s] for s in symbols]; end_row = len(data) if end_row is None else end_row
+    shape = (end_row - start_row, len(columns)); block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    prices = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    for i in range(0, shape[0], 1 << 18): prices[i:i + (1 << 18)] = data.prices[start_row + i:start_row + i + (1 << 18), columns] # Chunked: the memmap is never read whole
+    spec = {'name': block.name, 'shape': shape, 'symbols': list(symbols), 'start_ms': data.start_ms + start_row * data.step_ms, 'step_ms': data.step_ms}
+    return block, spec
+
+
+WORKER = {} # Per-process state set by _init_worker: the attached block, ReplayData over it, basket, rules and base config
+
+
+def _init_worker(spec, basket, exchange_info, base):
+    block = shared_memory.SharedMemory(name=spec['name']) # Kept attached (in WORKER) while the process lives
+    data = ReplayData(np.ndarray(spec['shape'], dtype=np.float64, buffer=block.buf), spec['symbols'], spec['start_ms'], spec['step_ms'])
+    WORKER.update(block=block, data=data, basket=basket, exchange_info=exchange_info, base=base)
+
+
+def _run_point(point):
+    base = WORKER['base']; basket = WORKER['basket'][:point.size]
+    config = base._replace(leverage=point.leverage, target=point.target, amount=base.amount * len(basket), tp_percent=point.tp_offset or None) # amount: margin of the coins actually opened
+    replayer = Replayer(WORKER['data'], basket, config, WORKER['exchange_info'], verbose=False)
+    return point, summarize(replayer.run())
+
+
+def _run_points(points): return [_run_point(p) for p in points]
+
+
+# --- Sweep ---
+def run_sweep(data, basket, points, base, exchange_info=None, workers=None, start_row=0, end_row=None):
+    """Replays every SweepPoint on `workers` processes (default: all cores). base: ReplayConfig with the fixed
+    settings, amount = margin per coin. Returns [(SweepPoint, summary dict)] in completion order."""
+    basket = [b for b in basket if b['symbol'] in data.column]
+    if not basket: raise ValueError("No basket symbol has price data.")
+    if any(p.size > len(basket) for p in points): # A bigger size would replay the same coins again: keep one point at the full basket
+        print(f"Sweep: basket has {len(basket)} symbols with price data; larger sizes are replayed once at {len(basket)}.")
+        points = list(dict.fromkeys(p._replace(size=min(p.size, len(basket))) for p in points))
+    symbols = list(dict.fromkeys(b['symbol'] for b in basket[:max(p.size for p in points)]))
+    if exchange_info: exchange_info = dict(exchange_info, symbols=[s for s in exchange_info.get('symbols', []) if s.get('symbol') in symbols]) # Workers parse only these
+    else: print("Sweep: no exchangeInfo; quantities are not snapped to the exchange rules.")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(points))); base = base._replace(repeat=True)
+    if workers == 1: # In-process, straight off the memory map
+        WORKER.update(data=ReplayData(data.prices[start_row:end_row], data.symbols, data.start_ms + start_row * data.step_ms, data.step_ms), basket=basket, exchange_info=exchange_info, base=base)
+        return _collect(map(_run_points, ([p] for p in points)), len(points), workers)
+    block, spec = share_prices(data, symbols, start_row, end_row)
+    try:
+        with Pool(workers, _init_worker, (spec, basket, exchange_info, base)) as pool:
+            chunk = max(1, len(points) // (workers * TASKS_PER_WORKER))
+            return _collect(pool.imap_unordered(_run_points, [points[i:i + chunk] for i in range(0, len(points), chunk)]), len(points), workers)
+    finally: block.close(); block.unlink()
+
+
+def _collect(batches, total, workers):
+    started = reported = time.perf_counter(); results = []
+    for batch in batches:
+        results += batch; now = time.perf_counter()
+        if now - reported >= PROGRESS_SECONDS or len(results) == total:
+            rate = len(results) / max(now - started, 1e-9); reported = now
+            print(f"Sweep: {len(results)}/{total} combinations, {rate:.1f}/s on {workers} workers, ~{(total - len(results)) / rate:.0f}s left")
+    return results
+
+
+def rank(results, key='net_pnl'):
+    """Results best first by key (RANK_KEYS); combinations without a finished round go last."""
+    def value(summary):
+        if not summary.get('rounds'): return -np.inf
+        if key == 'net_per_drawdown': return summary['net_pnl'] / max(summary['max_drawdown'], 1.0)
+        return summary[key]
+    return sorted(results, key=lambda r: value(r[1]), reverse=True)
+
+
+def result_row(point, summary):
+    """Flat dict of one result for the table and the CSV."""
+    return {'leverage': point.leverage, 'target': float(point.target), 'size': point.size, 'tp_offset': point.tp_offset, 'rounds': summary.get('rounds', 0),
+            'win_rate': summary.get('win_rate', np.nan), 'net_pnl': summary.get('net_pnl', 0.0), 'fees': summary.get('fees', 0.0), 'mean_net': summary.get('mean_net', np.nan),
+            'max_drawdown': summary.get('max_drawdown', 0.0), 'mean_hold_s': summary.get('mean_hold_s', np.nan), 'exits': " ".join(f"{k}={v}" for k, v in summary.get('exits', {}).items())}
+
+
+def format_table(ranked, limit=TABLE_ROWS):
+    lines = [f"{'#':>4} {'lev':>4} {'target':>8} {'size':>4} {'tp%':>6} {'rounds':>7} {'win':>6} {'net':>12} {'fees':>10} {'mean':>9} {'max dd':>10} {'hold s':>8}  exits"]
+    for i, (point, summary) in enumerate(ranked[:limit], 1):
+        r = result_row(point, summary)
+        lines.append(f"{i:>4} {r['leverage']:>4} {r['target']:>8.4g} {r['size']:>4} {r['tp_offset']:>6.3g} {r['rounds']:>7} {r['win_rate']:>6.1%} {r['net_pnl']:>12.2f} {r['fees']:>10.2f} "
+                     f"{r['mean_net']:>9.4f} {r['max_drawdown']:>10.2f} {r['mean_hold_s']:>8.1f}  {r['exits']}")
+    return "\n".join(lines)
+
+
+def write_csv(path, ranked):
+    with open(path, 'w', newline='') as f:
+        rows = [result_row(p, s) for p, s in ranked]; writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['leverage'])
+        writer.writeheader(); writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    from cli import load_basket, decimal_arg
+    parser = argparse.ArgumentParser(description="Sweep leverage x target x basket size x TP offset over recorded prices (values: 'a,b,c' or 'start:stop:step').")
+    parser.add_argument('data', help=".npy written by replay.py import")
+    parser.add_argument('basket', help="Basket file, best first; size N uses its first N lines")
+    parser.add_argument('--amount', type=decimal_arg, required=True, help=f"Margin per coin in {QUOTE_ASSET}")
+    parser.add_argument('--leverage', default=str(LEVERAGE))
+    parser.add_argument('--target', required=True, help=f"Target total PNL in {QUOTE_ASSET}")
+    parser.add_argument('--size', default=str(BASKET_SIZE), help="Basket sizes")
+    parser.add_argument('--tp-offset', default="0", help="Per-leg TP in percent beyond the entry (0 = none; TP prices in the basket file win)")
+    parser.add_argument('--trail', type=decimal_arg)
+    parser.add_argument('--stop-loss', type=decimal_arg)
+    parser.add_argument('--sl-percent', type=decimal_arg)
+    parser.add_argument('--fee', type=float, default=TAKER_FEE_RATE, help="Taker fee rate per fill")
+    parser.add_argument('--slippage-bps', type=float, default=0.0)
+    parser.add_argument('--exit-lag', type=int, default=0, metavar='STEPS')
+    parser.add_argument('--gross', action='store_true', help="Thresholds on unrealized PNL only (default: net of realized PNL and fees)")
+    parser.add_argument('--start', type=float, help="Epoch seconds where the tape starts")
+    parser.add_argument('--end', type=float, help="Epoch seconds where it ends")
+    parser.add_argument('--workers', type=int, help="Processes (default: all cores)")
+    parser.add_argument('--rank-by', default='net_pnl', choices=RANK_KEYS)
+    parser.add_argument('--top', type=int, default=TABLE_ROWS, help="Rows printed")
+    parser.add_argument('--out', metavar='FILE', help="Write every ranked result as CSV")
+    parser.add_argument('--exchange-info', help="exchangeInfo JSON for quantity rules (default: the cached copy)")
+    args = parser.parse_args()
+    try: grid = expand_grid(grid_values(args.leverage, int), grid_values(args.target, lambda v: Decimal(str(v))), grid_values(args.size, int), grid_values(args.tp_offset))
+    except (ValueError, ArithmeticError) as e: parser.error(f"Bad grid value: {e}")
+    if any(p.leverage < 1 or p.target <= 0 or p.size < 1 or p.tp_offset < 0 for p in grid): parser.error("leverage, target and size must be positive, tp-offset not negative")
+    data = ReplayData.open(args.data); basket = load_basket(args.basket)
+    base = ReplayConfig(args.amount, Decimal(1), args.trail, args.stop_loss, args.sl_percent, fee_rate=args.fee, slippage_bps=args.slippage_bps, exit_lag_steps=args.exit_lag, net=not args.gross)
+    start_row = data.row_at(args.start) if args.start else 0; end_row = data.row_at(args.end) + 1 if args.end else len(data)
+    print(f"Sweeping {len(grid)} combinations over {end_row - start_row} steps...")
+    started = time.perf_counter(); results = run_sweep(data, basket, grid, base, load_exchange_info(args.exchange_info), args.workers, start_row, end_row)
+    ranked = rank(results, args.rank_by); print(format_table(ranked, args.top))
+    if args.out: write_csv(args.out, ranked); print(f"Wrote {len(ranked)} results to {args.out}")
+    print(f"Swept {len(results)} combinations in {time.perf_counter() - started:.1f}s")
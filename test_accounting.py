@@ -0,0 +1,24 @@
+"""IncomeLedger paging against the simulated exchange's income history."""
+import asyncio
+import time
+from decimal import Decimal
+
+from accounting import INCOME_PAGE_LIMIT, IncomeLedger
+from sim_exchange import SimClient
+
+
+def book(sim, at, income_type='COMMISSION', amount='-0.01', asset='USDC'):
+    sim.income.append({'symbol': 'SIM000USDC', 'incomeType': income_type, 'income': amount, 'asset': asset, 'info': income_type, 'time': at, 'tranId': sim.next_tran_id, 'tradeId': ''})
+    sim.next_tran_id += 1
+
+
+def test_sync_pages_through_rows_sharing_a_timestamp():
+    sim = SimClient(n_symbols=1, latency_ms=0, jitter_ms=0, weight_limit=10 ** 9); now = int(time.time() * 1000)
+    for _ in range(INCOME_PAGE_LIMIT * 2 + 500): book(sim, now - 5000) # More than two full pages in one millisecond
+    for i in range(INCOME_PAGE_LIMIT + 1): book(sim, now - 4000 + 3 * i // INCOME_PAGE_LIMIT, 'REALIZED_PNL', '0.5') # Over a few ms, a page ending mid-millisecond
+    book(sim, now - 3000, 'COMMISSION', '-7', asset='BNB') # Paid in BNB: not quote income
+    ledger = IncomeLedger()
+    assert asyncio.run(ledger.sync(sim)) == INCOME_PAGE_LIMIT * 3 + 501
+    assert ledger.totals == {'COMMISSION': Decimal('-0.01') * (INCOME_PAGE_LIMIT * 2 + 500), 'REALIZED_PNL': Decimal('0.5') * (INCOME_PAGE_LIMIT + 1)}
+    book(sim, int(time.time() * 1000), 'FUNDING_FEE', '-0.2')
+    assert asyncio.run(ledger.sync(sim)) == 1 and ledger.totals['FUNDING_FEE'] == Decimal('-0.2') # The overlap is not counted twice
@@ -0,0 +1,131 @@
+"""Execution algorithms against the simulated exchange's order book (sim_exchange.SimClient)."""
+import asyncio
+import queue
+from decimal import Decimal
+
+from binance.client import Client
+
+from engine import TradingEngine
+from execution import Executor, ExecutionPolicy, ParentOrder
+from sim_exchange import SimClient
+
+
+class ListJournal:
+    """journal.Journal stand-in keeping every recorded OrderResult."""
+    def __init__(self): self.queue = queue.Queue(); self.results = []
+    def record(self, result): self.results.append(result)
+    def record_many(self, results): self.results.extend(results)
+
+
+async def connect(journal=None, **sim_args):
+    sim = SimClient(n_symbols=3, latency_ms=0, jitter_ms=0, **sim_args)
+    engine = TradingEngine(use_streaming=False, journal=journal); ok, message, _ = await engine.connect(None, None, client=sim)
+    assert ok, message
+    return sim, engine
+
+
+def leg(sim, engine, notional, side=Client.SIDE_BUY):
+    """ParentOrder of about `notional` quote on the sim's priciest symbol (finest quantity step)."""
+    symbol = max(sim.marks, key=sim.marks.get); mark = sim.marks[symbol]
+    return ParentOrder(symbol, side, "LONG" if side == Client.SIDE_BUY else "SHORT", engine.get_quantizer(symbol).quantity(Decimal(notional) / mark), tag="ENTRY", ref_price=mark)
+
+
+async def step_marks(sim, volatility=0.002):
+    while True: sim.step_marks(volatility); await asyncio.sleep(0.005)
+
+
+def band_depth(sim, parent, policy):
+    """Base quantity inside max_slippage_bps of the touch on the side parent takes, from an untouched book."""
+    bids, asks = sim._book(parent.symbol); levels = asks if parent.side == Client.SIDE_BUY else bids; touch = levels[0][0]
+    band = touch * (1 + Decimal(str(policy.max_slippage_bps)) / 10000 * (1 if parent.side == Client.SIDE_BUY else -1))
+    return sum(q for p, q in levels if (p <= band if parent.side == Client.SIDE_BUY else p >= band))
+
+
+def test_twap_sends_one_child_per_slice():
+    async def main():
+        sim, engine = await connect(daily_volume=10 ** 15) # Deep enough that no cap binds
+        policy = ExecutionPolicy("TWAP", duration_seconds=0.4, slices=4); parent = leg(sim, engine, 40000)
+        report, = await Executor(engine, policy).run([parent]); step = engine.get_quantizer(parent.symbol).step
+        await engine.disconnect()
+        assert report.ok and report.filled == report.target
+        assert len(report.children) == 4 and all(r.request.order_type == Client.FUTURE_ORDER_TYPE_MARKET for r in report.children)
+        assert max(r.request.quantity for r in report.children) - min(r.request.quantity for r in report.children) <= step
+    asyncio.run(main())
+
+
+def test_depth_caps_cover_the_band_on_the_taken_side():
+    async def main():
+        sim, engine = await connect(book_depth=5000, level_bps=1.0)
+        policy = ExecutionPolicy("ICEBERG", max_participation=0.25, max_slippage_bps=10); executor = Executor(engine, policy)
+        for side in (Client.SIDE_BUY, Client.SIDE_SELL):
+            parent = leg(sim, engine, 100000, side); bids, asks = sim._book(parent.symbol)
+            touch, caps = await executor._depth_caps(parent, None, 1.0)
+            assert touch == (asks if side == Client.SIDE_BUY else bids)[0][0]
+            assert caps == [band_depth(sim, parent, policy) * Decimal('0.25')]
+        await engine.disconnect()
+    asyncio.run(main())
+
+
+def test_iceberg_children_stay_within_participation():
+    async def main():
+        sim, engine = await connect(book_depth=5000, level_bps=1.0, book_refill_seconds=0.05, daily_volume=10 ** 15)
+        policy = ExecutionPolicy("ICEBERG", duration_seconds=2, interval_seconds=0.02, max_participation=0.25); parent = leg(sim, engine, 60000)
+        cap = band_depth(sim, parent, policy) * Decimal('0.25')
+        report, = await Executor(engine, policy).run([parent])
+        await engine.disconnect()
+        assert report.ok and len(report.children) > 2
+        assert all(r.request.quantity <= cap for r in report.children[:-1]) # The last child may carry an unsendable rest
+    asyncio.run(main())
+
+
+def test_deadline_leaves_the_rest_or_sweeps_it():
+    async def main():
+        outcomes = {}
+        for finish in (False, True):
+            sim, engine = await connect(book_depth=2000, level_bps=1.0, book_refill_seconds=60, daily_volume=10 ** 15) # Depth barely refills
+            policy = ExecutionPolicy("ICEBERG", duration_seconds=0.3, interval_seconds=0.05, finish_at_market=finish); parent = leg(sim, engine, 200000)
+            cap = band_depth(sim, parent, policy) * Decimal('0.25')
+            outcomes[finish] = (await Executor(engine, policy).run([parent]))[0], cap
+            await engine.disconnect()
+        left, cap = outcomes[False]
+        assert not left.ok and 0 < left.filled < left.target and all(r.request.quantity <= cap for r in left.children)
+        swept, cap = outcomes[True]
+        assert swept.ok and swept.filled == swept.target and swept.children[-1].request.quantity > cap # The rest went at market
+    asyncio.run(main())
+
+
+def test_chase_keeps_posting_children_until_filled():
+    async def main():
+        journal = ListJournal(); sim, engine = await connect(journal, book_depth=5000, level_bps=1.0)
+        stepper = asyncio.ensure_future(step_marks(sim))
+        policy = ExecutionPolicy("CHASE", duration_seconds=10, chase_seconds=0.05, interval_seconds=0.01); parent = leg(sim, engine, 20000)
+        cap = band_depth(sim, parent, policy) * Decimal('0.25')
+        try: report, = await Executor(engine, policy).run([parent])
+        finally: stepper.cancel(); await engine.disconnect()
+        assert report.ok and report.filled == report.target
+        assert all(r.request.order_type == Client.FUTURE_ORDER_TYPE_LIMIT for r in report.children) # No market sweep before the deadline
+        assert all(r.request.quantity <= cap for r in report.children) and len({r.request.quantity for r in report.children}) > 1
+        ids = [r.order_id for r in journal.results if r.order_id]
+        assert len(ids) == len(set(ids)) == sum(1 for r in report.children if r.ok) # Each chase child journaled once, in its final state
+        assert sum(Decimal(r.order.get('executedQty') or 0) for r in journal.results if r.order) == report.filled
+    asyncio.run(main())
+
+
+def test_chase_survives_a_dropped_connection_on_cancel():
+    async def main():
+        sim, engine = await connect(book_depth=5000, level_bps=1.0); stepper = asyncio.ensure_future(step_marks(sim, 0.0005))
+        cancel = sim.futures_cancel_order; cancels = []
+        async def flaky_cancel(symbol, orderId):
+            cancels.append(orderId)
+            if len(cancels) == 2: raise ConnectionResetError("Connection reset by peer")
+            return await cancel(symbol=symbol, orderId=orderId)
+        sim.futures_cancel_order = flaky_cancel
+        trades = [{'symbol': s, 'side': Client.SIDE_BUY, 'position_side': "LONG", 'quantity': engine.get_quantizer(s).quantity(Decimal(20000) / m), 'tp_price': m * Decimal('1.05'), 'mark': m} for s, m in sim.marks.items()]
+        policy = ExecutionPolicy("CHASE", duration_seconds=1, chase_seconds=0.05, interval_seconds=0.01)
+        try: brackets = await engine.place_brackets(trades, policy)
+        finally: stepper.cancel(); await engine.disconnect()
+        assert len(brackets) == 3 and sum((b.entry.error or "").startswith("Cancel failed: Connection reset") for b in brackets) == 1
+        assert not [o for o in sim.open_orders.values() if o['type'] == Client.FUTURE_ORDER_TYPE_LIMIT] # The interrupted limit was cancelled
+        for (symbol, _), leg in sim.positions.items(): # Every filled entry, the interrupted one included, got its TP
+            if leg['amount']: assert [Decimal(o['origQty']) for o in sim.open_orders.values() if o['symbol'] == symbol and o['type'] == Client.FUTURE_ORDER_TYPE_TAKE_PROFIT_MARKET] == [leg['amount']]
+    asyncio.run(main())
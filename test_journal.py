@@ -0,0 +1,22 @@
+"""Journal segment compaction (needs pyarrow)."""
+import numpy as np
+import pytest
+
+from journal import FILL_DTYPE, compact_segments, read_fills
+
+pytest.importorskip("pyarrow")
+
+
+def segment(directory, day, *timestamps):
+    fills = np.zeros(len(timestamps), dtype=FILL_DTYPE); fills['ts'] = timestamps; fills['symbol'] = b"BTCUSDC"; fills['ok'] = True
+    with open(directory / f"fills-{day}.bin", 'ab') as f: fills.tofile(f)
+
+
+def test_late_records_are_merged_into_a_compacted_day(tmp_path):
+    segment(tmp_path, "20240101", 1704067100.0, 1704153598.0)
+    assert compact_segments(str(tmp_path)) == 1 and (tmp_path / "fills-20240101.parquet").exists()
+    segment(tmp_path, "20240101", 1704153599.5) # Sent at 23:59:59, journaled after the rollover compaction
+    assert compact_segments(str(tmp_path)) == 1 and not (tmp_path / "fills-20240101.bin").exists()
+    fills = read_fills(str(tmp_path))
+    assert list(fills['ts']) == [1704067100.0, 1704153598.0, 1704153599.5] and set(fills['symbol']) == {b"BTCUSDC"}
+    assert [p.name for p in tmp_path.iterdir()] == ["fills-20240101.parquet"] # No temp file left behind
@@ -0,0 +1,54 @@
+"""OrderDispatcher batching against a stub client and the simulated exchange."""
+import asyncio
+from decimal import Decimal
+
+from engine import TradingEngine
+from order_engine import OrderDispatcher, OrderRequest
+from sim_exchange import SimClient
+
+
+class BatchStub:
+    """Answers every futures_place_batch_order with `response` (a callable of the batch)."""
+    def __init__(self, response): self.response = response; self.batches = []
+    async def futures_place_batch_order(self, batchOrders): self.batches.append(batchOrders); return self.response(batchOrders)
+
+
+def requests(n, symbol="BTCUSDC"):
+    return [OrderRequest(symbol, "BUY", "LONG", "MARKET", Decimal('0.001') * (i + 1), tag=f"E{i}") for i in range(n)]
+
+
+def test_short_or_malformed_batch_responses_fail_the_missing_orders():
+    async def main(response):
+        return await OrderDispatcher(BatchStub(response)).submit(requests(4))
+    short = asyncio.run(main(lambda batch: [{'orderId': i} for i in range(len(batch) - 1)])) # One entry missing
+    assert len(short) == 4 and [r.ok for r in short] == [True, True, True, False] and short[3].error == "No response for this order."
+    error = asyncio.run(main(lambda batch: {'code': -1000, 'msg': "An unknown error occurred."})) # An error object, not a list
+    assert len(error) == 4 and not any(r.ok for r in error) and {(r.error_code, r.error) for r in error} == {(-1000, "An unknown error occurred.")}
+    odd = asyncio.run(main(lambda batch: [{'orderId': 1}, "garbage", None] + [{'orderId': 2}] * 3)) # Unparseable entries, one too many
+    assert [r.ok for r in odd] == [True, False, False, True]
+
+
+def test_brackets_send_each_entry_with_its_exits_in_one_request():
+    async def main():
+        sim = SimClient(n_symbols=6, latency_ms=0, jitter_ms=0); engine = TradingEngine(use_streaming=False); await engine.connect(None, None, client=sim)
+        place = sim.futures_place_batch_order; batches = []
+        async def recording_place(batchOrders): batches.append([(o['symbol'], o['type']) for o in batchOrders]); return await place(batchOrders)
+        sim.futures_place_batch_order = recording_place
+        trades = [{'symbol': s, 'side': "BUY", 'position_side': "LONG", 'quantity': engine.get_quantizer(s).quantity(Decimal(1000) / m), 'mark': m,
+                   'tp_price': m * Decimal('1.05'), 'sl_price': m * Decimal('0.95') if i % 3 else None} for i, (s, m) in enumerate(sim.marks.items())] # Groups of 2 and 3
+        brackets = await engine.place_brackets(trades)
+        await engine.disconnect()
+        assert all(b.entry.ok and b.tp.ok for b in brackets) and all(len(batch) <= 5 for batch in batches)
+        for t in trades: # Entry, TP and SL of a symbol all in the same request
+            assert sum(any(symbol == t['symbol'] for symbol, _ in batch) for batch in batches) == 1
+            batch, = [b for b in batches if any(symbol == t['symbol'] for symbol, _ in b)]
+            assert sorted(kind for symbol, kind in batch if symbol == t['symbol']) == sorted(["MARKET", "TAKE_PROFIT_MARKET"] + (["STOP_MARKET"] if t['sl_price'] else []))
+    asyncio.run(main())
+
+
+def test_groups_are_packed_whole_and_results_keep_group_order():
+    stub = BatchStub(lambda batch: [{'orderId': o['quantity']} for o in batch]); orders = requests(12); sizes = [3, 3, 2, 1, 3]
+    groups = [orders[sum(sizes[:i]):sum(sizes[:i + 1])] for i in range(len(sizes))]
+    results = asyncio.run(OrderDispatcher(stub).submit_groups(groups))
+    assert [len(b) for b in stub.batches] == [3, 5, 4] # 3 | 3+2 | 1+3
+    assert [[r.request for r in group_results] for group_results in results] == groups
@@ -0,0 +1,33 @@
+"""SymbolQuantizer rounding, rule checks and market-order splitting."""
+from decimal import Decimal, ROUND_UP
+
+from quantizer import SymbolQuantizer
+
+FILTERS = [{'filterType': 'PRICE_FILTER', 'tickSize': '0.50'}, {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '1000'},
+           {'filterType': 'MARKET_LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '120'}, {'filterType': 'MIN_NOTIONAL', 'notional': '100'}]
+
+
+def test_rounding_snaps_to_step_and_tick():
+    q = SymbolQuantizer.from_filters("BTCUSDC", FILTERS)
+    assert q.quantity(Decimal('0.0129')) == Decimal('0.012') and str(q.quantity(0.1)) == "0.100" # Down by default; floats via str
+    assert q.quantity(Decimal('0.0121'), ROUND_UP) == Decimal('0.013')
+    assert q.price(Decimal('64000.74')) == Decimal('64000.50') and q.price(Decimal('64000.75')) == Decimal('64001.00') # Half up, to a 0.5 tick
+    assert SymbolQuantizer("X").quantity(Decimal('1.23456')) == Decimal('1.23456') # No filters: untouched
+
+
+def test_check_applies_quantity_and_notional_limits():
+    q = SymbolQuantizer.from_filters("BTCUSDC", FILTERS)
+    assert q.check(Decimal('0.002'), Decimal(60000)) is None
+    assert q.check(Decimal('0.001'), Decimal(60000)).startswith("Notional 60.00 below minimum 100")
+    assert q.check(Decimal('0.001'), Decimal(60000), reduce_only=True) is None # Closes are exempt from MIN_NOTIONAL
+    assert "above maximum 120" in q.check(Decimal('150'), market=True) and q.check(Decimal('150'), market=False) is None # MARKET_LOT_SIZE vs LOT_SIZE
+    assert q.check(Decimal(0)) == "Qty=0."
+
+
+def test_split_market_chunks_stay_within_the_market_lot():
+    q = SymbolQuantizer.from_filters("BTCUSDC", FILTERS)
+    assert q.split_market(Decimal('120')) == [Decimal('120')]
+    for qty in (Decimal('120.001'), Decimal('250'), Decimal('360.002'), Decimal('999.999')):
+        chunks = q.split_market(qty)
+        assert sum(chunks) == qty and max(chunks) <= 120 and max(chunks) - min(chunks) <= q.step and len(chunks) == (qty / 120).to_integral_value(ROUND_UP)
+        assert all(c == q.quantity(c) for c in chunks) # Every chunk on the step grid
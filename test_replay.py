@@ -0,0 +1,67 @@
+"""Replayer exits and trigger_index, against hand-built tapes and ProfitTrigger."""
+from decimal import Decimal
+
+import numpy as np
+
+from profit_trigger import ProfitTrigger
+from replay import ReplayConfig, ReplayData, Replayer, trigger_index
+
+
+def steps_tape(rows, **changes):
+    """Two symbols at 100; changes: symbol -> [(from_row, price)] applied in order."""
+    prices = np.full((rows, 2), 100.0); symbols = ['AUSDC', 'BUSDC']
+    for symbol, moves in changes.items():
+        for row, price in moves: prices[row:, symbols.index(symbol)] = price
+    return ReplayData(prices, symbols, 0, 1000)
+
+
+def test_net_mode_counts_exited_legs_and_fees():
+    # A's TP fills at row 300 (+1, in the second block); B drifts up later. Fees: 0.2 entry + 0.101 for A's exit
+    data = steps_tape(1500, AUSDC=[(300, 101.0)], BUSDC=[(1000, 100.5), (1300, 101.3)])
+    basket = [{'symbol': 'AUSDC', 'position_side': 'LONG', 'tp_price': 101.0, 'sl_price': None}, {'symbol': 'BUSDC', 'position_side': 'LONG', 'tp_price': None, 'sl_price': None}]
+    config = ReplayConfig(Decimal(200), Decimal('1.1'), leverage=1, fee_rate=0.001)
+    (net_round, net_exit), (gross_round, gross_exit) = (Replayer(data, basket, config._replace(net=net), verbose=False).run_round(0) for net in (True, False))
+    assert net_exit == 1000 and net_round.reason.startswith("TARGET") and net_round.leg_exits == 1 # 1 + 0.5 - 0.301 >= 1.1
+    assert gross_exit == 1300 # Unrealized only: B alone has to reach 1.1
+    assert np.isclose(net_round.gross_pnl, 1.5) and np.isclose(net_round.fees, 0.2 + 0.101 + 0.1005) and np.isclose(net_round.net_pnl, 1.5 - 0.4015)
+
+
+def test_leg_exits_fill_at_their_crossing_tick():
+    data = steps_tape(1000, AUSDC=[(100, 100.6), (120, 101.2)], BUSDC=[(700, 102.5)]) # A's TP in block 0, B's SL in block 1
+    basket = [{'symbol': 'AUSDC', 'position_side': 'LONG', 'tp_price': 101.0, 'sl_price': None}, {'symbol': 'BUSDC', 'position_side': 'SHORT', 'tp_price': None, 'sl_price': 102.0}]
+    (round_, exit_row) = Replayer(data, basket, ReplayConfig(Decimal(200), Decimal(100), leverage=1, fee_rate=0.0), verbose=False).run_round(0)
+    assert exit_row == 700 and round_.reason == "ALL LEGS EXITED" and round_.leg_exits == 2
+    assert np.isclose(round_.gross_pnl, 1.2 - 2.5) # Each leg at the price on its crossing tick, not at its trigger level
+
+
+def reference_fire(total, target, trailing=None, stop_loss=None):
+    """Index and reason of the first tick ProfitTrigger.evaluate fires on, fed one total at a time."""
+    trigger = ProfitTrigger(target, trailing, stop_loss, net=False)
+    for i, value in enumerate(total):
+        reason = trigger.evaluate(Decimal(repr(float(value))))
+        if reason: return i, reason
+    return None, None
+
+
+def blockwise_fire(total, target, trailing=None, stop_loss=None, first_block=7):
+    """trigger_index over doubling blocks with the peak carried across, as Replayer.run_round walks the tape (float thresholds)."""
+    start = 0; size = first_block; peak = None; target, trailing, stop_loss = (float(v) if v else None for v in (target, trailing, stop_loss))
+    while start < len(total):
+        fire, reason, peak = trigger_index(total[start:start + size], target, trailing, stop_loss, peak)
+        if fire is not None: return start + fire, reason
+        start += size; size *= 2
+    return None, None
+
+
+def test_trailing_peak_carries_across_blocks():
+    total = np.array([0.0, 3.0, 5.5, 6.0, 5.8, 5.9, 6.5, 6.2, 5.9, 5.5, 5.4, 2.0]) # Arms at 5.5, peaks 6.5 in block 0, falls 1 below it in block 1
+    assert blockwise_fire(total, Decimal(5), Decimal(1), first_block=7) == (9, "TRAILING 1.0000 off peak 6.5000")
+    assert trigger_index(total[7:], 5.0, 1.0, None, None)[0] == 4 # Without the carried peak block 1 re-arms at 6.2 and fires late
+
+
+def test_trigger_index_matches_profit_trigger():
+    rng = np.random.default_rng(3)
+    for trial in range(40):
+        total = np.round(np.cumsum(rng.normal(0, 0.4, 600)), 6)
+        target, trailing, stop_loss = Decimal(int(rng.integers(1, 8))), [None, Decimal('0.5'), Decimal(2)][trial % 3], [None, Decimal(6)][trial % 2]
+        assert blockwise_fire(total, target, trailing, stop_loss) == reference_fire(total, target, trailing, stop_loss), trial
@@ -0,0 +1,25 @@
+"""risk.margin_state against a cross-margin account worked by hand."""
+import numpy as np
+
+from risk import margin_state
+
+
+def test_margin_state_two_leg_cross_account():
+    # Wallet 1000. Long 1 @ 100 (mark 110, x10, mmr 1%); short 10 @ 20 (mark 18, x5, mmr 2%, cum 0.5)
+    im, mm, liq, equity = margin_state(1000.0, np.array([1.0, -10.0]), np.array([100.0, 20.0]), np.array([110.0, 18.0]),
+                                       np.array([10.0, 5.0]), np.array([0.01, 0.02]), np.array([0.0, 0.5]))
+    assert equity == 1030.0 # 1000 + 10 + 20 unrealized
+    assert np.allclose(im, [11.0, 36.0]) and np.allclose(mm, [1.1, 3.1]) # 180 * 0.02 - 0.5
+    # Short: 1000 + 10 - 10 * (P - 20) = 1.1 + 10 * P * 0.02 - 0.5  ->  P = 1209.4 / 10.2
+    assert np.isclose(liq[1], 1209.4 / 10.2)
+    # Long: 1000 + 20 + (P - 100) = 3.1 + 0.01 * P  ->  P < 0, so it cannot be liquidated
+    assert np.isnan(liq[0])
+
+
+def test_margin_state_liquidation_zeroes_the_margin_balance():
+    amount, entry, mark, leverage, mmr, cum = np.array([0.5, -3.0, 2.0]), np.array([3000.0, 150.0, 40.0]), np.array([2900.0, 155.0, 41.0]), np.full(3, 20.0), np.array([0.005, 0.01, 0.02]), np.array([0.0, 1.0, 0.0])
+    im, mm, liq, equity = margin_state(120.0, amount, entry, mark, leverage, mmr, cum)
+    for i in range(3): # Move leg i alone to its liquidation price: equity then equals maintenance margin
+        moved = mark.copy(); moved[i] = liq[i]
+        _, mm_at, _, equity_at = margin_state(120.0, amount, entry, moved, leverage, mmr, cum)
+        assert np.isclose(equity_at, mm_at.sum())
@@ -0,0 +1,17 @@
+"""BasketScorer snapshot caching against the simulated exchange."""
+import asyncio
+
+from engine import TradingEngine
+from rate_limiter import RateLimiter
+from scoring import BasketScorer
+from sim_exchange import SimClient
+
+
+def test_symbols_without_data_do_not_force_a_refetch():
+    async def main():
+        sim = SimClient(n_symbols=3, latency_ms=0, jitter_ms=0); engine = TradingEngine(use_streaming=False, limiter=RateLimiter(10 ** 6)); await engine.connect(None, None, client=sim) # Roomy limiter: no pacing waits
+        scorer = BasketScorer(engine); symbols = list(sim.marks)[:2] + ["DELISTEDUSDC"] # No ticker, mark or open interest for the last one
+        for _ in range(3): snapshot = await scorer.get_snapshot(symbols, with_open_interest=True)
+        await engine.disconnect()
+        assert snapshot.symbols == symbols[:2] and sim.calls['ticker'] == 1 and sim.calls['openInterest'] == 3
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""PositionBook kept current by MarketStream from recorded frames served by streaming.serve_frames."""
+import asyncio
+import json
+import socket
+import time
+from decimal import Decimal
+
+import pytest
+import websockets
+
+import streaming
+from streaming import MarketStream, PositionBook, load_frames, serve_frames
+
+
+def account_update(*legs):
+    return {'e': 'ACCOUNT_UPDATE', 'a': {'m': 'ORDER', 'P': [{'s': s, 'ps': side, 'pa': amount, 'ep': entry} for s, side, amount, entry in legs]}}
+
+
+def order_update(order_id, status):
+    return {'e': 'ORDER_TRADE_UPDATE', 'o': {'s': 'BTCUSDC', 'i': order_id, 'X': status}}
+
+
+def mark_prices(**marks):
+    return [{'e': 'markPriceUpdate', 's': s, 'p': p} for s, p in marks.items()]
+
+
+@pytest.fixture
+def frames(tmp_path):
+    """A short recording in record_frames' JSONL format, read back with load_frames."""
+    recorded = [account_update(('BTCUSDC', 'LONG', '0.010', '60000'), ('ETHUSDC', 'SHORT', '-0.5', '3000')),
+                order_update(1, 'NEW'), order_update(2, 'NEW'), order_update(1, 'FILLED'),
+                {'e': 'ACCOUNT_CONFIG_UPDATE', 'ac': {'s': 'ETHUSDC', 'l': 20}},
+                mark_prices(BTCUSDC='61000', ETHUSDC='2900')]
+    path = tmp_path / "frames.jsonl"; started = time.time()
+    path.write_text("".join(json.dumps({'t': started + i * 0.01, 'frame': frame}) + "\n" for i, frame in enumerate(recorded)))
+    return load_frames(path)
+
+
+def free_port():
+    with socket.socket() as s: s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+
+async def until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out waiting for the book"
+        await asyncio.sleep(0.01)
+
+
+def test_book_follows_recorded_frames_across_a_reconnect(frames, monkeypatch):
+    monkeypatch.setattr(streaming, 'RECONNECT_BACKOFF_SECONDS', (0.05, 0.1))
+    async def main():
+        port = free_port(); book = PositionBook()
+        book.seed([{'symbol': 'BTCUSDC', 'positionSide': 'LONG', 'positionAmt': '0', 'leverage': '10'}, {'symbol': 'ETHUSDC', 'positionSide': 'SHORT', 'positionAmt': '0', 'leverage': '5'}])
+        server = asyncio.ensure_future(serve_frames(frames, port=port)); await asyncio.sleep(0.1)
+        stream = MarketStream(None, book, f"ws://127.0.0.1:{port}"); stream.start(asyncio.get_running_loop())
+        try:
+            await until(lambda: book.marks.get('ETHUSDC') == Decimal('2900'))
+            assert stream.is_live() and set(book.positions) == {'BTCUSDC_LONG', 'ETHUSDC_SHORT'}
+            assert book.positions['ETHUSDC_SHORT']['amount'] == Decimal('-0.5') and book.positions['BTCUSDC_LONG']['entry_price'] == Decimal('60000')
+            assert set(book.open_orders) == {2} and book.leverage == {'BTCUSDC': 10, 'ETHUSDC': 20}
+            status, portfolio, total = book.snapshot()
+            assert total == Decimal('60') and "2 Pos" in status # 0.01 * (61000 - 60000) + -0.5 * (2900 - 3000)
+            assert portfolio.margin[portfolio.index['ETHUSDC_SHORT']] == pytest.approx(0.5 * 2900 / 20)
+
+            server.cancel(); await until(lambda: not stream.connected['market']) # Server gone: the stream drops and retries
+            later = [{'t': 0, 'frame': account_update(('BTCUSDC', 'LONG', '0', '0'))}, {'t': 0, 'frame': mark_prices(ETHUSDC='3100')}]
+            server = asyncio.ensure_future(serve_frames(later, port=port))
+            await until(lambda: book.marks.get('ETHUSDC') == Decimal('3100'))
+            assert stream.reconnects >= 1 and stream.connected['market'] and set(book.positions) == {'ETHUSDC_SHORT'}
+            assert book.snapshot()[2] == Decimal('-50')
+        finally:
+            stream.stop(); server.cancel(); await asyncio.sleep(0.05)
+    asyncio.run(main())
+
+
+class UserStreamClient:
+    """REST side of the user stream: a listen key, and a position snapshot that takes `delay` seconds."""
+    def __init__(self, delay): self.delay = delay; self.seeded_at = []
+    async def futures_stream_get_listen_key(self): return "listen-key"
+    async def futures_position_information(self):
+        await asyncio.sleep(self.delay); self.seeded_at.append(time.monotonic())
+        return [{'symbol': 'BTCUSDC', 'positionSide': 'LONG', 'positionAmt': '0.010', 'entryPrice': '60000', 'leverage': '10'}]
+
+
+def test_user_stream_seeds_after_connecting_and_keeps_frames_sent_meanwhile():
+    async def main():
+        port = free_port(); book = PositionBook(); client = UserStreamClient(0.2); connected_at = []
+        async def handler(ws, *args):
+            if ws.request.path.endswith("listen-key"): # The position grew while the snapshot was being read
+                connected_at.append(time.monotonic()); await ws.send(json.dumps(account_update(('BTCUSDC', 'LONG', '0.030', '60500'))))
+            else: await ws.send(json.dumps(mark_prices(BTCUSDC='61000')))
+            await ws.wait_closed()
+        async with websockets.serve(handler, "127.0.0.1", port):
+            stream = MarketStream(client, book, f"ws://127.0.0.1:{port}"); stream.start(asyncio.get_running_loop())
+            try: await until(lambda: stream.is_live())
+            finally: stream.stop(); await asyncio.sleep(0.05)
+        assert connected_at and client.seeded_at and connected_at[0] < client.seeded_at[0] # Subscribed before the snapshot
+        assert book.positions['BTCUSDC_LONG']['amount'] == Decimal('0.030') and book.leverage == {'BTCUSDC': 10} # The buffered frame wins over the seed
+        assert book.snapshot()[2] == Decimal('15') # 0.03 * (61000 - 60500)
+    asyncio.run(main())
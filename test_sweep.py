@@ -0,0 +1,35 @@
+"""Sweep grid parsing and sweeps over a synthetic price tape."""
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from replay import ReplayConfig, ReplayData
+from sweep import SweepPoint, expand_grid, grid_values, run_sweep
+
+
+def test_grid_values_lists_and_ranges():
+    assert grid_values("20,5,10,5", int) == [5, 10, 20] # Sorted, duplicates dropped
+    assert grid_values("1:2:0.25") == [1.0, 1.25, 1.5, 1.75, 2.0] # Stop included
+    assert grid_values("0.1:0.3:0.1") == [0.1, 0.2, 0.3] # Decimal steps: no 0.30000000000000004, no lost end point
+    assert grid_values("1:10:3", int) == [1, 4, 7, 10] and grid_values("1:9:3", int) == [1, 4, 7] # Stop off the grid: left out
+    assert grid_values("5:1:1") == [] and grid_values("0,1:3:1,10", int) == [0, 1, 2, 3, 10]
+    assert grid_values("0.5:1:0.5", lambda v: Decimal(str(v))) == [Decimal('0.5'), Decimal('1.0')]
+    with pytest.raises(ValueError): grid_values("1:5:0")
+    assert len(expand_grid([5, 10], [Decimal(1)], [2, 3, 4], [0.0, 1.0])) == 12
+
+
+def tape(n_symbols=2, steps=5000, seed=7):
+    """Random-walk prices, one column per symbol, one step per second."""
+    walk = np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.002, (steps, n_symbols)), axis=0)) * 100
+    return ReplayData(walk, [f"C{i}USDC" for i in range(n_symbols)], 0, 1000)
+
+
+def test_sizes_beyond_the_basket_replay_once_at_its_margin():
+    data = tape(); basket = [{'symbol': s, 'position_side': 'LONG', 'tp_price': None, 'sl_price': None} for s in data.symbols + ['NODATAUSDC']]
+    base = ReplayConfig(Decimal(10), Decimal(1), stop_loss=Decimal(2))
+    results = run_sweep(data, basket, [SweepPoint(5, Decimal(1), size, 0.0) for size in (2, 3, 5)], base, workers=1)
+    (point, summary), = results
+    assert point.size == 2 and summary['rounds'] > 0
+    (_, exact), = run_sweep(data, basket[:2], [SweepPoint(5, Decimal(1), 2, 0.0)], base, workers=1)
+    assert summary == exact # Margin of the two coins with prices, not of five